@@ -40,18 +40,68 @@ from __future__ import print_function, unicode_literals
 
 from django.conf.urls import url
 from django.contrib import admin
+from django.contrib.admin import helpers
+from django.contrib.admin.views.main import ChangeList
 from django.http import HttpResponseRedirect
 from django.urls import reverse_lazy
+from django.utils.http import urlencode
 
-from . import conf
-from .forms import LdapGroupForm, LdapUserForm
-from .models import LdapGroup, LdapSambaDomain, LdapUser
-from .views import EmailUsersAdminAction
+from .forms import (AdminEmailForm, ConcurrencyCheckMixin, LdapGroupForm,
+                    LdapUserForm)
+from .models import (ENABLE_SAMBA, ConcurrentModificationError, LdapGroup,
+                     LdapSambaDomain, LdapUser)
+from .views import (EmailUsersAdminAction, LdapChoicesAutocompleteView,
+                    store_selection)
 
 ################################################################
 
 
-class LdapGroupAdmin(admin.ModelAdmin):
+class LdapChangeList(ChangeList):
+    """
+    Only fetch the attributes shown in the changelist.
+    """
+
+    def get_queryset(self, request):
+        queryset = super(LdapChangeList, self).get_queryset(request)
+        names = set([f.name for f in self.model._meta.concrete_fields])
+        fields = [name for name in self.list_display if name in names]
+        if fields:
+            queryset = queryset.only(*fields)
+        return queryset
+
+
+class LdapModelAdmin(admin.ModelAdmin):
+    """
+    Base admin for LDAP models.
+    """
+
+    def get_changelist(self, request, **kwargs):
+        return LdapChangeList
+
+    def get_form(self, request, obj=None, **kwargs):
+        form = super(LdapModelAdmin, self).get_form(request, obj, **kwargs)
+        if getattr(request, 'ldap_conflict', False) and \
+                issubclass(form, ConcurrencyCheckMixin):
+            form = type(form.__name__, (form, ), {'conflict': True})
+        return form
+
+    def changeform_view(self, request, object_id=None, form_url='',
+                        extra_context=None):
+        try:
+            return super(LdapModelAdmin, self).changeform_view(
+                request, object_id, form_url, extra_context)
+        except ConcurrentModificationError:
+            # The entry changed between the form's clean() and its save:
+            # show the form again, with the conflict as its error.
+            request.ldap_conflict = True
+            return super(LdapModelAdmin, self).changeform_view(
+                request, object_id, form_url, extra_context)
+
+
+################################################################
+
+
+class LdapGroupAdmin(LdapModelAdmin):
     list_display = ['name', 'gid']
     search_fields = ['name']
     ordering = [
@@ -64,8 +114,41 @@ admin.site.register(LdapGroup, LdapGroupAdmin)
 
 ################################################################
 
+SAMBA_FIELDSETS = (
+    ('Samba', {
+        'fields': [
+            'domain',
+        ]
+    }),
+    (
+        'Samba SAM Account',
+        {
+            'classes': [
+                'collapse',
+            ],
+            'fields': [
+                'lm_password',
+                'nt_password',
+                'sid',
+                'pwd_last_set',
+                'pwd_can_change',
+                'pwd_must_change',
+                'logon_time',
+                'logoff_time',
+                'kickoff_time',
+                'bad_password_count',
+                'bad_password_time',
+                #'logon_hours',
+            ]
+        }),
+)
+
+SAMBA_READONLY_FIELDS = ('lm_password', 'nt_password', 'sid', 'pwd_last_set',
+                         'logon_time', 'logoff_time', 'bad_password_count',
+                         'bad_password_time')
+
 
-class LdapUserAdmin(admin.ModelAdmin):
+class LdapUserAdmin(LdapModelAdmin):
     """
     Admin interface for LdapUser objects.
 
@@ -84,6 +167,7 @@ class LdapUserAdmin(admin.ModelAdmin):
                 'gecos',
                 'home_directory',
                 'login_shell',
+                'version',
             ]
         }),
         ('Inet Org Person', {
@@ -105,47 +189,10 @@ class LdapUserAdmin(admin.ModelAdmin):
     save_on_top = True
     search_fields = ['first_name', 'last_name', 'full_name', 'username']
 
-    def get_fieldsets(self, *args, **kwargs):
-        fieldsets = super(LdapUserAdmin, self).get_fieldsets(*args, **kwargs)
-        if conf.get('enable_samba'):
-            fieldsets += (
-                ('Samba', {
-                    'fields': [
-                        'domain',
-                    ]
-                }),
-                (
-                    'Samba SAM Account',
-                    {
-                        'classes': [
-                            'collapse',
-                        ],
-                        'fields': [
-                            'lm_password',
-                            'nt_password',
-                            'sid',
-                            'pwd_last_set',
-                            'pwd_can_change',
-                            'pwd_must_change',
-                            'logon_time',
-                            'logoff_time',
-                            'kickoff_time',
-                            'bad_password_count',
-                            'bad_password_time',
-                            #'logon_hours',
-                        ]
-                    }),
-            )
-        return fieldsets
-
-    def get_readonly_fields(self, *args, **kwargs):
-        readonly_fields = super(LdapUserAdmin, self).get_readonly_fields(
-            *args, **kwargs)
-        if conf.get('enable_samba'):
-            readonly_fields += ('lm_password', 'nt_password', 'sid',
-                                'pwd_last_set', 'logon_time', 'logoff_time',
-                                'bad_password_count', 'bad_password_time')
-        return readonly_fields
+    # like the model and its form, fixed when the app is loaded.
+    if ENABLE_SAMBA:
+        fieldsets += SAMBA_FIELDSETS
+        readonly_fields = SAMBA_READONLY_FIELDS
 
     def get_urls(self):
         """
@@ -160,17 +207,38 @@ class LdapUserAdmin(admin.ModelAdmin):
                 self.admin_site.admin_view(EmailUsersAdminAction.as_view()),
                 name='ldap-email-users',
             ),
+            url(
+                r'^email-users/choices/(?P<field_name>\w+)/$',
+                self.admin_site.admin_view(
+                    LdapChoicesAutocompleteView.as_view(
+                        form_class=AdminEmailForm)),
+                name='ldap-email-choices-autocomplete',
+            ),
+            url(
+                r'^choices/(?P<field_name>\w+)/$',
+                self.admin_site.admin_view(
+                    LdapChoicesAutocompleteView.as_view(
+                        form_class=self.form)),
+                name='ldap-choices-autocomplete',
+            ),
         ] + urls
         return urls
 
     def email_users_action(self, request, queryset):
         """
         Redirect to the actual view.
+        The selection is stored in the session (it may be too large
+        for a URL), and only its token is passed along.
         """
         url = reverse_lazy('admin:ldap-email-users')
-        selected = request.POST.getlist(admin.ACTION_CHECKBOX_NAME)
-        query = '&'.join(['to={0}'.format(s) for s in selected])
-        return HttpResponseRedirect(url + '?' + query)
+        if request.POST.get('select_across', '0') == '1':
+            selected = queryset.values_list('pk', flat=True)
+        else:
+            selected = request.POST.getlist(helpers.ACTION_CHECKBOX_NAME)
+        token = store_selection(request, selected)
+        return HttpResponseRedirect(url + '?' + urlencode({
+            'selection': token
+        }))
 
     email_users_action.short_description = "Email selected user(s)"
 
@@ -180,7 +248,7 @@ admin.site.register(LdapUser, LdapUserAdmin)
 ################################################################
 
 
-class LdapSambaDomainAdmin(admin.ModelAdmin):
+class LdapSambaDomainAdmin(LdapModelAdmin):
     list_display = ['domain_name', 'sid']
     search_fields = ['domain_name']
     ordering = [
@@ -191,7 +259,7 @@ class LdapSambaDomainAdmin(admin.ModelAdmin):
     ]
 
 
-if conf.get('enable_samba'):
+if ENABLE_SAMBA:
     admin.site.register(LdapSambaDomain, LdapSambaDomainAdmin)
 
 ################################################################
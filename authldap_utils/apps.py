@@ -2,6 +2,7 @@
 from __future__ import print_function, unicode_literals
 
 from django.apps import AppConfig
+from django.core.signals import request_finished, request_started
 from django.db.models import signals
 from django.utils.translation import ugettext_lazy as _
 
@@ -14,6 +15,31 @@ class BaseConfig(AppConfig):
     name = "authldap_utils"
     verbose_name = _("LDAP")
 
+    def ready(self):
+        """
+        Invalidate cached form choices and photos when the directory
+        changes, and keep the read-your-writes state of the
+        ReplicaRouter (for each request).
+        """
+        super(BaseConfig, self).ready()
+
+        from .instrumentation import ldap_operation
+        from .router import pin_on_write, unpin
+        ldap_operation.connect(pin_on_write)
+        request_started.connect(unpin)
+        request_finished.connect(unpin)
+
+        from .models import LdapGroup, LdapSambaDomain, LdapUser
+        for model in [LdapGroup, LdapSambaDomain]:
+            signals.post_save.connect(
+                handlers.choices_cache_invalidate, sender=model)
+            signals.post_delete.connect(
+                handlers.choices_cache_invalidate, sender=model)
+        signals.post_save.connect(
+            handlers.photo_cache_invalidate, sender=LdapUser)
+        signals.post_delete.connect(
+            handlers.photo_cache_invalidate, sender=LdapUser)
+
 
 #########################################################################
 
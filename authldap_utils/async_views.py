@@ -0,0 +1,81 @@
+"""
+Asynchronous counterparts of the password views, for ASGI deployments
+(Python 3, Django 3.1 or later).  Use them in place of those of
+``authldap_utils.views`` in your urls, e.g.::
+
+    from authldap_utils import async_views
+
+    path('password-change/',
+         async_views.LdapPasswordChangeView.as_view(),
+         name='password_change'),
+
+ldapdb has no non-blocking client, so each view (its directory lookups
+and modifies, password hashing, sending emails and rendering) runs in
+the bounded thread pool of ``authldap_utils.executors``: the event loop
+is never blocked, and serves other requests meanwhile, while at most
+``executor_workers`` password operations reach the directory at once.
+"""
+################################################################
+from __future__ import print_function, unicode_literals
+
+import asyncio
+from functools import update_wrapper
+
+from django.utils.decorators import classonlymethod
+
+from . import views
+from .executors import submit
+
+################################################################
+
+
+async def run_in_executor(function, *args, **kwargs):
+    """
+    Await ``function(*args, **kwargs)``, run in the shared thread pool.
+    """
+    return await asyncio.wrap_future(submit(function, *args, **kwargs))
+
+
+def get_rendered_response(view, request, *args, **kwargs):
+    response = view(request, *args, **kwargs)
+    # (templates are rendered here too, not in the event loop.)
+    if callable(getattr(response, 'render', None)):
+        response.render()
+    return response
+
+
+################################################################
+
+
+class AsyncViewMixin(object):
+    """
+    Make the view asynchronous: each request is handled (synchronously)
+    in the shared thread pool.
+    """
+
+    @classonlymethod
+    def as_view(cls, **initkwargs):
+        view = super(AsyncViewMixin, cls).as_view(**initkwargs)
+
+        async def async_view(request, *args, **kwargs):
+            return await run_in_executor(get_rendered_response, view,
+                                         request, *args, **kwargs)
+
+        update_wrapper(async_view, view)
+        return async_view
+
+
+class LdapPasswordChangeView(AsyncViewMixin, views.LdapPasswordChangeView):
+    pass
+
+
+class LdapPasswordResetView(AsyncViewMixin, views.LdapPasswordResetView):
+    pass
+
+
+class LdapPasswordResetConfirmView(AsyncViewMixin,
+                                   views.LdapPasswordResetConfirmView):
+    pass
+
+
+################################################################
@@ -0,0 +1,215 @@
+"""
+An ldapdb database backend using a pool of bound connections.
+
+Use ``'ENGINE': 'authldap_utils.backends.ldap'`` in the ``DATABASES``
+setting, with (optionally) a ``POOL`` dictionary::
+
+    "ldap": {
+        "ENGINE": "authldap_utils.backends.ldap",
+        ...
+        "POOL": {
+            "SIZE": 10,             # maximum number of connections
+            "IDLE_TIMEOUT": 300,    # unbind connections idle this long
+            "PING_INTERVAL": 30,    # check connections idle this long
+            "TIMEOUT": 10,          # wait this long for a connection
+        },
+    }
+"""
+################################################################
+from __future__ import print_function, unicode_literals
+
+import threading
+import time
+
+import ldap
+from ldapdb.backends.ldap import base
+
+from ...instrumentation import record, timed
+from .pool import LdapConnectionPool
+
+################################################################
+
+# One pool per database alias, shared by all threads.
+_pools = {}
+_pools_lock = threading.Lock()
+
+# Search latency (seconds, moving average) per database alias.
+_latency = {}
+LATENCY_WEIGHT = 0.2
+
+
+def get_latency(alias):
+    """
+    The average search latency for the database alias; None if no
+    searches have been made.
+    """
+    return _latency.get(alias, None)
+
+
+def record_latency(alias, seconds):
+    average = _latency.get(alias, None)
+    if average is None:
+        _latency[alias] = seconds
+    else:
+        _latency[alias] = (1 - LATENCY_WEIGHT) * average + \
+                          LATENCY_WEIGHT * seconds
+
+################################################################
+
+
+class DatabaseOperations(base.DatabaseOperations):
+    compiler_module = 'authldap_utils.backends.ldap.compiler'
+
+
+################################################################
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """
+    The connection of each (thread local) database wrapper is taken from
+    a pool shared by all threads, and returned to the pool when closed,
+    rather than being bound and unbound for each request.
+    Operations failing with ``SERVER_DOWN`` are retried once, with a
+    freshly bound connection.
+    Every operation is recorded (see ``authldap_utils.instrumentation``).
+    """
+    ops_class = DatabaseOperations
+
+    def get_pool(self):
+        with _pools_lock:
+            pool = _pools.get(self.alias, None)
+            if pool is None:
+                options = self.settings_dict.get('POOL', {})
+                pool = LdapConnectionPool(
+                    size=options.get('SIZE', 10),
+                    idle_timeout=options.get('IDLE_TIMEOUT', 300),
+                    ping_interval=options.get('PING_INTERVAL', 30),
+                    timeout=options.get('TIMEOUT', 10),
+                )
+                _pools[self.alias] = pool
+        return pool
+
+    def get_new_connection(self, conn_params):
+        # The page size is a connection option, but kept on the wrapper.
+        self.page_size = int(conn_params['options'].get(
+            'page_size', self.page_size))
+        parent = super(DatabaseWrapper, self).get_new_connection
+        return self.get_pool().acquire(lambda: parent(conn_params))
+
+    def ensure_connection(self):
+        # ldapdb (1.1 and later) does a test bind before each operation;
+        # pooled connections are pinged by the pool instead, and
+        # operations failing with SERVER_DOWN are retried.
+        super(base.DatabaseWrapper, self).ensure_connection()
+
+    def close(self):
+        self.validate_thread_sharing()
+        if self.connection is not None:
+            self.get_pool().release(self.connection)
+            self.connection = None
+
+    def discard_connection(self):
+        """
+        Drop the current (broken) connection; the next operation binds
+        a new one.
+        """
+        if self.connection is not None:
+            self.get_pool().discard(self.connection)
+            self.connection = None
+
+    def _retry(self, method, *args):
+        try:
+            return method(*args)
+        except ldap.SERVER_DOWN:
+            self.discard_connection()
+            return method(*args)
+
+    def add_s(self, dn, modlist):
+        with timed('add', self.alias, dn=dn):
+            return self._retry(super(DatabaseWrapper, self).add_s, dn,
+                               modlist)
+
+    def delete_s(self, dn):
+        with timed('delete', self.alias, dn=dn):
+            return self._retry(super(DatabaseWrapper, self).delete_s, dn)
+
+    def modify_s(self, dn, modlist):
+        with timed('modify', self.alias, dn=dn):
+            return self._retry(super(DatabaseWrapper, self).modify_s, dn,
+                               modlist)
+
+    def rename_s(self, dn, newrdn):
+        with timed('rename', self.alias, dn=dn):
+            return self._retry(super(DatabaseWrapper, self).rename_s, dn,
+                               newrdn)
+
+    def _search(self, base, scope, filterstr, attrlist, page_size):
+        """
+        Start a paged search: return (first result, remaining results).
+        """
+        results = super(DatabaseWrapper, self).search_s(
+            base, scope, filterstr, attrlist)
+        # The page size is read as the search starts.
+        default_page_size = self.page_size
+        self.page_size = page_size or default_page_size
+        try:
+            return next(results, None), results
+        finally:
+            self.page_size = default_page_size
+
+    def search_s(self, base, scope, filterstr='(objectClass=*)',
+                 attrlist=None, page_size=None, model=None):
+        """
+        Return the list of (dn, attrs) results (see ``search_iter()``).
+        """
+        return list(self.search_iter(base, scope, filterstr, attrlist,
+                                     page_size, model))
+
+    def search_iter(self, base, scope, filterstr='(objectClass=*)',
+                    attrlist=None, page_size=None, model=None):
+        """
+        Yield the (dn, attrs) results, fetching ``page_size`` entries
+        (by default the ``page_size`` connection option) at a time.
+        """
+        start = time.time()
+        try:
+            first, results = self._search(base, scope, filterstr, attrlist,
+                                          page_size)
+        except ldap.SERVER_DOWN:
+            # Only retried before any results have been returned.
+            self.discard_connection()
+            start = time.time()
+            first, results = self._search(base, scope, filterstr, attrlist,
+                                          page_size)
+        # the time to the first page of results.
+        duration = time.time() - start
+        record_latency(self.alias, duration)
+        count = 0
+        try:
+            if first is None:
+                return
+            count += 1
+            yield first
+            while True:
+                # only the time spent waiting for the directory.
+                start = time.time()
+                result = next(results, None)
+                duration += time.time() - start
+                if result is None:
+                    return
+                count += 1
+                yield result
+        finally:
+            record(
+                'search',
+                self.alias,
+                model=model,
+                count=count,
+                duration=duration,
+                dn=base,
+                filterstr=filterstr,
+                scope=scope,
+                attrlist=attrlist)
+
+
+################################################################
@@ -0,0 +1,236 @@
+"""
+Query compilers for the pooled ldapdb backend.
+
+These only request the LDAP attributes a query actually needs, so
+``.only()``, ``.defer()``, ``.values()`` and ``.values_list()``
+reduce the data sent by the server.  (The ldapdb compiler always
+requests every attribute of the model.)
+
+Results are streamed one page at a time, with the page size given
+by ``.iterator(chunk_size=...)``; only ordered queries need every
+result before the first is returned.
+"""
+################################################################
+from __future__ import print_function, unicode_literals
+
+import ldap
+from django.db.models import aggregates
+from django.db.models.sql.constants import GET_ITERATOR_CHUNK_SIZE, SINGLE
+from ldapdb.backends.ldap import compiler
+from ldapdb.backends.ldap.compiler import query_as_ldap
+from ldapdb.models.fields import ListField
+
+################################################################
+
+
+def get_select_field(expression):
+    """
+    Return the model field for a select expression, if there is one.
+    """
+    if isinstance(expression, aggregates.Count):
+        expression = expression.get_source_expressions()[0]
+    return getattr(expression, 'field', None)
+
+
+################################################################
+
+
+class SQLCompiler(compiler.SQLCompiler):
+    """
+    LDAP query compiler with attribute projection.
+    """
+    page_size = None
+    # a function (dn, attrs) -> value for each selected column.
+    converters = None
+
+    def execute_sql(self,
+                    result_type=SINGLE,
+                    chunked_fetch=False,
+                    chunk_size=GET_ITERATOR_CHUNK_SIZE):
+        if self.query.annotation_select or \
+                getattr(self.query, 'subquery', False):
+            # aggregates, e.g., count()
+            return super(SQLCompiler, self).execute_sql(
+                result_type, chunked_fetch, chunk_size)
+        # Model instances are made from results_iter(): the parent's
+        # search (of every DN, as a list) would be wasted.
+        self.pre_sql_setup()
+        if chunked_fetch:
+            self.page_size = chunk_size
+        return []
+
+    def has_results(self):
+        lookup = query_as_ldap(
+            self.query, compiler=self, connection=self.connection)
+        if lookup is None:
+            return False
+        for result in self.search(lookup, ['1.1'], page_size=1):
+            return True
+        return False
+
+    def get_ordering(self):
+        if self.query.extra_order_by:
+            return self.query.extra_order_by
+        elif not self.query.default_ordering:
+            return self.query.order_by
+        return self.query.order_by or self.query.model._meta.ordering
+
+    def get_ordering_fields(self):
+        """
+        Return [(field, reverse), ...] for sorting the results.
+        """
+        opts = self.query.model._meta
+        result = []
+        for fieldname in self.get_ordering():
+            reverse = fieldname.startswith('-')
+            fieldname = fieldname.lstrip('-')
+            if fieldname == 'pk':
+                fieldname = opts.pk.name
+            result.append((opts.get_field(fieldname), reverse))
+        return result
+
+    def get_attrlist(self, ordering_fields):
+        """
+        The LDAP attributes for the selected (i.e., not deferred) fields,
+        and those needed for sorting.
+        """
+        attrlist = []
+        fields = [get_select_field(e[0]) for e in self.select]
+        fields += [field for field, reverse in ordering_fields]
+        for field in fields:
+            db_column = getattr(field, 'db_column', None)
+            if db_column and db_column not in attrlist:
+                attrlist.append(db_column)
+        # Never an empty list, which would request every attribute:
+        # '1.1' requests none (RFC 4511).
+        return attrlist or ['1.1']
+
+    def search(self, lookup, attrlist, page_size=None):
+        """
+        Yield the (dn, attrs) search results; a missing base is empty.
+        """
+        try:
+            for result in self.connection.search_iter(
+                    base=lookup.base,
+                    scope=lookup.scope,
+                    filterstr=lookup.filterstr,
+                    attrlist=attrlist,
+                    page_size=page_size,
+                    model=self.query.model):
+                yield result
+        except ldap.NO_SUCH_OBJECT:
+            return
+
+    def sort_results(self, vals, ordering_fields):
+        for field, reverse in reversed(ordering_fields):
+
+            def get_key(obj, field=field):
+                attr = field.from_ldap(
+                    obj[1].get(field.db_column, []),
+                    connection=self.connection,
+                )
+                if hasattr(attr, 'lower'):
+                    attr = attr.lower()
+                return attr
+
+            vals = sorted(vals, key=get_key, reverse=reverse)
+        return vals
+
+    def get_converter(self, expression):
+        """
+        Return a function (dn, attrs) -> value for a select expression;
+        these are made once per query, not for each result.
+        """
+        connection = self.connection
+        field = get_select_field(expression)
+        if field.attname == 'dn':
+            if isinstance(expression, aggregates.Count):
+                return lambda dn, attrs: 1
+            return lambda dn, attrs: dn
+        if not hasattr(field, 'from_ldap'):
+            value = 0 if isinstance(expression, aggregates.Count) else None
+            return lambda dn, attrs: value
+        from_ldap = field.from_ldap
+        db_column = field.db_column
+        if not isinstance(expression, aggregates.Count):
+            return lambda dn, attrs: from_ldap(
+                attrs.get(db_column, []), connection=connection)
+
+        def count(dn, attrs):
+            result = from_ldap(attrs.get(db_column, []), connection=connection)
+            if not result:
+                return 0
+            return len(result) if isinstance(field, ListField) else 1
+
+        return count
+
+    def get_row(self, dn, attrs):
+        if self.converters is None:
+            self.converters = [self.get_converter(e[0]) for e in self.select]
+        return [convert(dn, attrs) for convert in self.converters]
+
+    def results_iter(self,
+                     results=None,
+                     tuple_expected=False,
+                     chunked_fetch=False,
+                     chunk_size=GET_ITERATOR_CHUNK_SIZE):
+        lookup = query_as_ldap(
+            self.query, compiler=self, connection=self.connection)
+        if lookup is None:
+            return
+
+        self.setup_query()
+        self.converters = None
+        page_size = chunk_size if chunked_fetch else self.page_size
+        ordering_fields = self.get_ordering_fields()
+        vals = self.search(lookup, self.get_attrlist(ordering_fields),
+                           page_size)
+        # Sorting is done client side.
+        vals = self.sort_results(vals, ordering_fields)
+
+        low_mark = self.query.low_mark
+        high_mark = self.query.high_mark
+        pos = 0
+        seen = []
+        for dn, attrs in vals:
+            if high_mark is not None and pos >= high_mark:
+                break
+            if low_mark and pos < low_mark:
+                pos += 1
+                continue
+            row = self.get_row(dn, attrs)
+            if self.query.distinct:
+                if row in seen:
+                    continue
+                seen.append(row)
+            yield tuple(row) if tuple_expected else row
+            pos += 1
+
+
+class SQLInsertCompiler(compiler.SQLInsertCompiler, SQLCompiler):
+    pass
+
+
+class SQLDeleteCompiler(compiler.SQLDeleteCompiler, SQLCompiler):
+    pass
+
+
+class SQLUpdateCompiler(compiler.SQLUpdateCompiler, SQLCompiler):
+    pass
+
+
+class SQLAggregateCompiler(compiler.SQLAggregateCompiler, SQLCompiler):
+
+    def execute_sql(self, result_type=SINGLE):
+        inner_query = getattr(self.query, 'inner_query', None)
+        if inner_query is None:
+            return super(SQLAggregateCompiler, self).execute_sql(result_type)
+        # Django 3.0+: e.g., count() of a sliced or distinct queryset;
+        # count the rows of the inner query, which honours both.
+        inner = inner_query.get_compiler(self.using, self.connection)
+        number = sum(1 for row in inner.results_iter())
+        return [number if isinstance(annotation, aggregates.Count) else None
+                for annotation in self.query.annotation_select.values()]
+
+
+################################################################
@@ -0,0 +1,153 @@
+"""
+A thread-safe pool of bound LDAP connections.
+"""
+################################################################
+from __future__ import print_function, unicode_literals
+
+import logging
+import threading
+import time
+
+import ldap
+
+logger = logging.getLogger('authldap_utils')
+
+################################################################
+
+
+class PoolTimeout(ldap.TIMEOUT):
+    """
+    No connection became available within the pool timeout.
+    """
+
+
+################################################################
+
+
+class LdapConnectionPool(object):
+    """
+    A pool of (at most ``size``) bound LDAP connections.
+
+    Idle connections are unbound after ``idle_timeout`` seconds, and
+    those idle for more than ``ping_interval`` seconds are checked
+    (with a "Who am I?" operation) before being handed out again;
+    a connection which fails the check is replaced by a new one.
+    When every connection is in use, ``acquire()`` waits up to
+    ``timeout`` seconds for one to be released.
+    """
+
+    def __init__(self,
+                 size=10,
+                 idle_timeout=300,
+                 ping_interval=30,
+                 timeout=10):
+        self.size = size
+        self.idle_timeout = idle_timeout
+        self.ping_interval = ping_interval
+        self.timeout = timeout
+        self.condition = threading.Condition(threading.Lock())
+        self.idle = []  # [(connection, last_used), ...]
+        self.opened = 0  # idle and in use
+
+    def _unbind(self, connection):
+        try:
+            connection.unbind_s()
+        except ldap.LDAPError:
+            pass
+
+    def _pop_idle(self, now):
+        """
+        Return an idle (connection, last_used), or None; expired
+        connections are dropped.  The lock must be held.
+        """
+        while self.idle:
+            connection, last_used = self.idle.pop()
+            if now - last_used <= self.idle_timeout:
+                return connection, last_used
+            self.opened -= 1
+            self._unbind(connection)
+        return None
+
+    def _is_healthy(self, connection):
+        try:
+            connection.whoami_s()
+        except ldap.LDAPError as e:
+            logger.info('Dropping pooled LDAP connection: %s', e)
+            return False
+        return True
+
+    def _open(self, connect):
+        """
+        Open a new connection, in a slot already counted in ``opened``.
+        """
+        try:
+            return connect()
+        except Exception:
+            self.discard(None)
+            raise
+
+    def acquire(self, connect):
+        """
+        Return a bound connection from the pool.
+        ``connect`` is a callable returning a new, bound connection,
+        used when the pool needs one.
+        """
+        deadline = time.time() + self.timeout
+        with self.condition:
+            while True:
+                now = time.time()
+                idle = self._pop_idle(now)
+                if idle is not None:
+                    break
+                if self.opened < self.size:
+                    self.opened += 1
+                    idle = None
+                    break
+                remaining = deadline - now
+                if remaining <= 0:
+                    raise PoolTimeout(
+                        'No LDAP connection available after {0}s'.format(
+                            self.timeout))
+                self.condition.wait(remaining)
+
+        if idle is None:
+            return self._open(connect)
+        connection, last_used = idle
+        if time.time() - last_used > self.ping_interval and \
+                not self._is_healthy(connection):
+            # rebind
+            self._unbind(connection)
+            return self._open(connect)
+        return connection
+
+    def release(self, connection):
+        """
+        Return a connection to the pool.
+        """
+        with self.condition:
+            self.idle.append((connection, time.time()))
+            self.condition.notify()
+
+    def discard(self, connection):
+        """
+        Drop a (broken) connection, freeing its place in the pool.
+        """
+        if connection is not None:
+            self._unbind(connection)
+        with self.condition:
+            self.opened -= 1
+            self.condition.notify()
+
+    def clear(self):
+        """
+        Unbind all idle connections.
+        """
+        with self.condition:
+            idle, self.idle = self.idle, []
+            self.opened -= len(idle)
+            self.condition.notify_all()
+        for connection, last_used in idle:
+            self._unbind(connection)
+
+
+################################################################
@@ -0,0 +1,133 @@
+"""
+An in-memory LDAP database backend (see ``authldap_utils.fakeldap``),
+for tests and benchmarks without an LDAP server::
+
+    "ldap": {
+        "ENGINE": "authldap_utils.backends.memory",
+        "NAME": "memory://default",
+        "USER": "cn=admin,dc=example,dc=com",
+        "PASSWORD": "",
+        "SUFFIX": "dc=example,dc=com",  # default: settings.LDAP_DC_DN
+    }
+
+The directory is named by ``NAME``; it is shared by the connections
+of a process, and starts empty (but for the ``SUFFIX`` entry).
+Operations are recorded like those of ``authldap_utils.backends.ldap``.
+
+Transactions (and savepoints) are supported, by journals of the
+entries changed (see ``fakeldap.Directory.begin()``): ``TestCase``
+rolls back each test in the directory too, so test data need not be
+deleted.  With ``--parallel``, each
+test process gets a copy of the test directory.
+"""
+################################################################
+from __future__ import print_function, unicode_literals
+
+from django.conf import settings
+from ldapdb.backends.ldap import base as ldapdb_base
+
+from ... import fakeldap
+from ..ldap import base
+from .creation import DatabaseCreation
+
+################################################################
+
+
+class DatabaseFeatures(ldapdb_base.DatabaseFeatures):
+    supports_transactions = True
+    uses_savepoints = True
+    can_release_savepoints = True
+
+
+################################################################
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """
+    The LDAP backend, connected to an in-memory directory (without
+    a connection pool), with transactions.
+    """
+    creation_class = DatabaseCreation
+    features_class = DatabaseFeatures
+
+    def __init__(self, *args, **kwargs):
+        super(DatabaseWrapper, self).__init__(*args, **kwargs)
+        # the changes (undo logs) since the start of the transaction,
+        # and since each savepoint.
+        self.transaction_journal = None
+        self.savepoint_journals = {}
+
+    def get_suffix(self):
+        return self.settings_dict.get(
+            'SUFFIX', getattr(settings, 'LDAP_DC_DN', 'dc=example,dc=com'))
+
+    def get_directory(self):
+        """
+        The ``fakeldap.Directory`` of this database.
+        """
+        return fakeldap.get_directory(
+            fakeldap.get_directory_name(self.settings_dict['NAME']),
+            self.get_suffix())
+
+    def get_new_connection(self, conn_params):
+        self.page_size = int(conn_params['options'].get(
+            'page_size', self.page_size))
+        connection = fakeldap.initialize(conn_params['uri'],
+                                         self.get_suffix())
+        connection.simple_bind_s(conn_params['bind_dn'],
+                                 conn_params['bind_pw'])
+        return connection
+
+    def close(self):
+        self.validate_thread_sharing()
+        if not self.in_atomic_block:
+            self.end_journals()
+        if self.connection is not None:
+            self.connection.unbind_s()
+            self.connection = None
+
+    discard_connection = close
+
+    def is_usable(self):
+        return True
+
+    # Transactions
+
+    def end_journals(self):
+        journals = list(self.savepoint_journals.values())
+        if self.transaction_journal is not None:
+            journals.append(self.transaction_journal)
+        if journals:
+            directory = self.get_directory()
+            for journal in journals:
+                directory.end(journal)
+        self.transaction_journal = None
+        self.savepoint_journals = {}
+
+    def _set_autocommit(self, autocommit):
+        self.end_journals()
+        if not autocommit:
+            self.transaction_journal = self.get_directory().begin()
+
+    def _commit(self):
+        if self.transaction_journal is not None:
+            # (a new transaction starts)
+            self.transaction_journal.clear()
+
+    def _rollback(self):
+        if self.transaction_journal is not None:
+            self.get_directory().rollback(self.transaction_journal)
+
+    def _savepoint(self, sid):
+        self.savepoint_journals[sid] = self.get_directory().begin()
+
+    def _savepoint_rollback(self, sid):
+        self.get_directory().rollback(self.savepoint_journals[sid])
+
+    def _savepoint_commit(self, sid):
+        journal = self.savepoint_journals.pop(sid, None)
+        if journal is not None:
+            self.get_directory().end(journal)
+
+
+################################################################
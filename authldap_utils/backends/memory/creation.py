@@ -0,0 +1,65 @@
+"""
+Test directories for the in-memory LDAP backend.
+"""
+################################################################
+from __future__ import print_function, unicode_literals
+
+from django.conf import settings
+from django.db.backends.base.creation import BaseDatabaseCreation
+
+from ... import fakeldap
+
+################################################################
+
+
+class DatabaseCreation(BaseDatabaseCreation):
+    """
+    A test database is an (empty) in-memory directory, named after
+    the database's, e.g., ``memory://test_default``; clones (for
+    ``--parallel``) are copies of it.
+    """
+
+    def _get_test_db_name(self):
+        if self.connection.settings_dict['TEST']['NAME']:
+            return self.connection.settings_dict['TEST']['NAME']
+        name = fakeldap.get_directory_name(
+            self.connection.settings_dict['NAME'])
+        return fakeldap.URI_PREFIX + 'test_' + name
+
+    def create_test_db(self,
+                       verbosity=1,
+                       autoclobber=False,
+                       serialize=True,
+                       keepdb=False):
+        test_database_name = self._get_test_db_name()
+        if verbosity >= 1:
+            self.log('{0} test directory for alias {1}...'.format(
+                'Using existing' if keepdb else 'Creating',
+                self._get_database_display_str(verbosity,
+                                               test_database_name)))
+        if not keepdb:
+            fakeldap.drop_directory(
+                fakeldap.get_directory_name(test_database_name))
+
+        self.connection.close()
+        settings.DATABASES[self.connection.alias]['NAME'] = test_database_name
+        self.connection.settings_dict['NAME'] = test_database_name
+        # (created, with the suffix entry)
+        self.connection.get_directory()
+        return test_database_name
+
+    def _clone_test_db(self, suffix, verbosity, keepdb=False):
+        source = self.connection.get_directory()
+        target_name = fakeldap.get_directory_name(
+            self.get_test_db_clone_settings(suffix)['NAME'])
+        if keepdb and fakeldap.has_directory(target_name):
+            return
+        fakeldap.drop_directory(target_name)
+        fakeldap.get_directory(target_name, source.suffix).restore(
+            source.snapshot())
+
+    def _destroy_test_db(self, test_database_name, verbosity):
+        fakeldap.drop_directory(fakeldap.get_directory_name(test_database_name))
+
+
+################################################################
@@ -0,0 +1,17 @@
+"""
+The checkpoints of the change feeds (``authldap_utils.sync``), kept in
+the default database.
+
+This is an app of its own, so the migrations of ``authldap_utils``
+(which has none) never include the LDAP models: add
+``'authldap_utils.checkpoints'`` to ``INSTALLED_APPS`` to use the change
+feeds, and run ``migrate``.
+"""
+###############################################################
+from __future__ import unicode_literals, print_function
+
+###############################################################
+
+default_app_config = 'authldap_utils.checkpoints.apps.CheckpointsConfig'
+
+###############################################################
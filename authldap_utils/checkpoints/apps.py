@@ -0,0 +1,16 @@
+#########################################################################
+from __future__ import print_function, unicode_literals
+
+from django.apps import AppConfig
+from django.utils.translation import ugettext_lazy as _
+
+#########################################################################
+
+
+class CheckpointsConfig(AppConfig):
+    name = "authldap_utils.checkpoints"
+    label = "authldap_utils_checkpoints"
+    verbose_name = _("LDAP change feeds")
+
+
+#########################################################################
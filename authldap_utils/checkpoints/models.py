@@ -0,0 +1,30 @@
+################################################################
+from __future__ import print_function, unicode_literals
+
+import six
+from django.db import models
+
+################################################################
+
+
+@six.python_2_unicode_compatible
+class SyncCheckpoint(models.Model):
+    """
+    The position of an incremental change feed (see ``sync.ChangeFeed``)
+    in the directory, kept in the default database.
+    """
+    name = models.CharField(max_length=100, unique=True)
+    # the latest modifyTimestamp seen (generalized time).
+    timestamp = models.CharField(max_length=32, blank=True)
+    # the RFC 4533 (syncrepl) cookie.
+    cookie = models.TextField(blank=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'sync checkpoint'
+
+    def __str__(self):
+        return self.name
+
+
+################################################################
@@ -0,0 +1,107 @@
+"""
+Cached form choices for LDAP models.
+
+Enumerating every LdapGroup (or LdapSambaDomain) from the directory
+on each render of the admin change form is expensive; the choices
+are instead kept in the application cache, and invalidated by the
+post_save/post_delete signal handlers in ``handlers.py``.
+"""
+################################################################
+from __future__ import print_function, unicode_literals
+
+import six
+from django import forms
+
+from . import conf
+from .utils import get_cache
+
+################################################################
+
+
+def get_cache_key(model):
+    """
+    The cache key for the choices of the given model.
+    """
+    return 'authldap_utils.choices.{0}.{1}'.format(model._meta.app_label,
+                                                   model._meta.model_name)
+
+
+def invalidate_choices(model):
+    """
+    Forget any cached choices for the given model.
+    """
+    get_cache().delete(get_cache_key(model))
+
+
+def get_cached_choices(field):
+    """
+    Return the list of (value, label) choices for the given
+    ModelChoiceField, from the cache if possible.
+
+    The cached entry is a dictionary keyed by ``to_field_name``, so
+    several fields may share the choices of a model.
+    """
+    cache = get_cache()
+    key = get_cache_key(field.queryset.model)
+    name = field.to_field_name or 'pk'
+    cached = cache.get(key) or {}
+    if name not in cached:
+        cached[name] = [(field.prepare_value(obj),
+                         field.label_from_instance(obj))
+                        for obj in field.queryset.iterator()]
+        cache.set(key, cached, conf.get('choices_cache_timeout'))
+    return cached[name]
+
+
+################################################################
+
+
+class CachedModelChoiceIterator(forms.models.ModelChoiceIterator):
+    """
+    A ModelChoiceIterator that does not query the directory when the
+    choices are already cached.
+    """
+
+    def __iter__(self):
+        if self.field.empty_label is not None:
+            yield ('', self.field.empty_label)
+        for choice in get_cached_choices(self.field):
+            yield choice
+
+    def __len__(self):
+        return len(get_cached_choices(self.field)) + \
+               (1 if self.field.empty_label is not None else 0)
+
+    def __bool__(self):
+        return self.field.empty_label is not None or \
+               bool(get_cached_choices(self.field))
+
+    __nonzero__ = __bool__
+
+    def search(self, term):
+        """
+        Return the cached choices with labels containing ``term``.
+        """
+        term = term.lower()
+        return [(value, label) for value, label in get_cached_choices(
+            self.field) if term in six.text_type(label).lower()]
+
+    def selected(self, values):
+        """
+        Return the cached choices for the given (selected) values.
+        """
+        values = set(six.text_type(v) for v in values)
+        return [(value, label)
+                for value, label in get_cached_choices(self.field)
+                if six.text_type(value) in values]
+
+
+class CachedModelChoiceField(forms.ModelChoiceField):
+    """
+    A ModelChoiceField with cached choices.
+    Validation still looks up the chosen object in the directory.
+    """
+    iterator = CachedModelChoiceIterator
+
+
+################################################################
@@ -15,6 +15,71 @@ DEFAULT = {
     # Default home template when creating users.
     'home_template': '/home/{username}',
     'enable_samba': False,
+
+    # The cache (an alias from settings.CACHES) used by this application.
+    'cache_alias': 'default',
+    # Number of seconds LdapGroup/LdapSambaDomain form choices are cached.
+    'choices_cache_timeout': 300,
+    # Use autocomplete widgets (loaded on demand) for group/domain choices.
+    'choices_autocomplete': False,
+    # Number of values in a single LDAP OR-filter, when many entries
+    # are looked up at once (e.g., email recipients).
+    'ldap_chunk_size': 100,
+    # Number of email messages handed to the mail backend at once.
+    'email_chunk_size': 100,
+
+    # Password reset emails: a (number, seconds) rate per email address,
+    # or None for no limit.
+    'password_reset_rate': (3, 3600),
+    # Dotted path of a callable taking a list of EmailMessages, which
+    # sends the password reset emails in one batch, e.g.,
+    # 'authldap_utils.mail.send_mass_messages' or
+    # 'authldap_utils.mail.send_mass_messages_in_background'.
+    # None sends each message as it is rendered (the Django default).
+    'password_reset_sender': None,
+
+    # Password change/reset form submissions: a (number, seconds) rate
+    # per client IP address, and per user; or None for no limit.
+    'password_throttle_rate': (10, 300),
+    # The request.META key with the client IP address, e.g.,
+    # 'HTTP_X_FORWARDED_FOR' behind a (trusted) proxy.
+    'throttle_ip_header': 'REMOTE_ADDR',
+
+    # Database aliases of LDAP consumer replicas for the ReplicaRouter,
+    # and how to choose one: 'round-robin' or 'least-latency'.
+    'ldap_replicas': [],
+    'ldap_replica_selection': 'round-robin',
+
+    # User photo thumbnails: the sizes (in pixels) served, the first is
+    # the default; and the number of seconds photo details and
+    # thumbnails are cached.
+    'photo_thumbnail_sizes': [128, 32, 64, 256],
+    'photo_cache_timeout': 3600,
+
+    # How change feeds (authldap_utils.sync) find changed entries:
+    # 'syncrepl' (RFC 4533), 'timestamp' (modifyTimestamp) or 'auto'
+    # (syncrepl, if the server offers it).
+    'change_feed_mode': 'auto',
+
+    # How LdapUserForm/LdapGroupForm saves check that the entry was not
+    # changed since it was loaded: 'assertion' (RFC 4528 Assertion
+    # control, atomic) or 'compare' (a compare before the modify, for
+    # servers without the control).
+    'concurrency_check': 'assertion',
+
+    # authldap_utils.debug: the LDAP operations are shown at the end of
+    # HTML pages (for staff users, when DEBUG is on), with the innermost
+    # frames of the call stack where they were made.
+    'ldap_debug_html': True,
+    'ldap_debug_stack_depth': 5,
+
+    # The number of threads of authldap_utils.executors, which run the
+    # (blocking) work of the asynchronous views (authldap_utils.async_views).
+    'executor_workers': 8,
+    # Hash passwords (LdapUser.set_password) in a shared pool of this
+    # many processes, outside the request threads; None hashes them in
+    # the calling thread.
+    'password_hashing_processes': None,
 }
 
 #########################################################################
@@ -0,0 +1,161 @@
+"""
+Per-request LDAP debugging: which searches (filter, base, scope,
+attributes) and writes a request made, how long they took, which are
+duplicates, and where they were made.
+
+Add the middleware (only when ``DEBUG`` is on; it shows call stacks)::
+
+    MIDDLEWARE += ['authldap_utils.debug.LdapDebugMiddleware']
+
+or, with django-debug-toolbar, the panel::
+
+    DEBUG_TOOLBAR_PANELS += ['authldap_utils.panels.LdapPanel']
+
+Both need the ``authldap_utils.backends.ldap`` database engine.
+"""
+################################################################
+from __future__ import print_function, unicode_literals
+
+import logging
+import os
+import traceback
+
+from django.conf import settings
+from django.template.loader import render_to_string
+from django.utils.encoding import force_text
+
+from . import conf
+from .instrumentation import CapturedOperations, ldap_operation
+
+logger = logging.getLogger('authldap_utils')
+
+################################################################
+
+# Frames from these (installed) packages are left out of call stacks.
+HIDDEN_PATHS = [
+    os.path.join('django', ''),
+    os.path.join('ldap', ''),
+    os.path.join('ldapdb', ''),
+    os.path.join('debug_toolbar', ''),
+    os.path.join('authldap_utils', 'backends', ''),
+    os.path.join('authldap_utils', 'instrumentation.py'),
+    os.path.join('authldap_utils', 'debug.py'),
+]
+
+
+def get_stack():
+    """
+    The call site of an operation: the innermost frames outside of
+    Django and the LDAP libraries, as [(file, line, function, code)].
+    """
+    frames = [
+        frame for frame in traceback.extract_stack()
+        if not any(path in frame[0] for path in HIDDEN_PATHS)
+    ]
+    return [tuple(frame) for frame in
+            frames[-conf.get('ldap_debug_stack_depth'):]]
+
+
+def get_operation_key(op):
+    return (op['operation'], op.get('dn', ''), op.get('filterstr', ''),
+            op.get('scope', None), tuple(op.get('attrlist', None) or ()))
+
+
+class LdapOperationCollector(CapturedOperations):
+    """
+    Capture (this thread's) LDAP operations, with their call stacks.
+    """
+
+    def __call__(self, sender, **kwargs):
+        kwargs['stack'] = get_stack()
+        super(LdapOperationCollector, self).__call__(sender, **kwargs)
+
+    def start(self):
+        ldap_operation.connect(self, weak=False)
+
+    def stop(self):
+        ldap_operation.disconnect(self)
+
+    def get_stats(self):
+        """
+        Summarize the operations; identical operations (same type,
+        DN/base, filter, scope and attributes) are flagged as duplicates.
+        """
+        seen = {}
+        for op in self.operations:
+            key = get_operation_key(op)
+            seen[key] = seen.get(key, 0) + 1
+        operations = []
+        for op in self.operations:
+            op = dict(op)
+            op['repeated'] = seen[get_operation_key(op)]
+            op['duration_ms'] = op['duration'] * 1000
+            op['model_label'] = op['model']._meta.label if op['model'] \
+                else ''
+            operations.append(op)
+        return {
+            'operations': operations,
+            'count': len(operations),
+            'duration_ms': sum([op['duration_ms'] for op in operations]),
+            'duplicates': sum([n - 1 for n in seen.values()]),
+        }
+
+
+def render_stats(stats):
+    return render_to_string('authldap_utils/ldap_debug.html', stats)
+
+
+################################################################
+
+
+class LdapDebugMiddleware(object):
+    """
+    Collect the LDAP operations of each request (when ``DEBUG`` is on),
+    summarize them in an ``X-LDAP-Operations`` header and the log,
+    and show them at the end of HTML pages (for staff users; see the
+    ``ldap_debug_html`` setting).
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.DEBUG:
+            return self.get_response(request)
+
+        collector = LdapOperationCollector()
+        collector.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            collector.stop()
+
+        stats = collector.get_stats()
+        response['X-LDAP-Operations'] = \
+            '{count}; {duration_ms:.1f}ms; {duplicates} duplicates'.format(
+                **stats)
+        logger.debug('%s: %d LDAP operations (%d duplicates) in %.1fms',
+                     request.path, stats['count'], stats['duplicates'],
+                     stats['duration_ms'])
+        if self.show_html(request, response):
+            self.insert_html(response, render_stats(stats))
+        return response
+
+    def show_html(self, request, response):
+        user = getattr(request, 'user', None)
+        return conf.get('ldap_debug_html') and \
+            user is not None and user.is_staff and \
+            not getattr(response, 'streaming', False) and \
+            response.get('Content-Type', '').startswith('text/html')
+
+    def insert_html(self, response, html):
+        content = force_text(response.content, encoding=response.charset)
+        index = content.lower().rfind('</body>')
+        if index == -1:
+            return
+        response.content = content[:index] + html + content[index:]
+        if 'Content-Length' in response:
+            response['Content-Length'] = len(response.content)
+
+
+################################################################
@@ -0,0 +1,103 @@
+"""
+A bounded, shared pool of threads for blocking work (directory lookups
+and modifies, password hashing) done on behalf of asynchronous views;
+see ``authldap_utils.async_views``.
+
+Each call runs like a request of its own: database connections are
+closed (when expired) before and after it, and the read-your-writes
+state of the ``ReplicaRouter`` is reset.
+
+Passwords are hashed (``hash_password()``) in a shared pool of
+``password_hashing_processes`` processes, if set: the (CPU-bound)
+hashing then runs outside the request threads, and their process.
+
+``concurrent.futures`` is imported on first use only: on Python 2 it
+needs the ``futures`` backport, which is only required to use the pools.
+"""
+################################################################
+from __future__ import print_function, unicode_literals
+
+import threading
+
+from django.db import close_old_connections
+
+from . import conf
+from .instrumentation import timed_hashing
+from .router import unpin
+from .utils import make_password_hashes
+
+################################################################
+
+_executor = None
+_hashing_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """
+    The shared thread pool (of ``executor_workers`` threads), created
+    on first use.
+    """
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                from concurrent.futures import ThreadPoolExecutor
+                _executor = ThreadPoolExecutor(
+                    max_workers=conf.get('executor_workers'))
+    return _executor
+
+
+def call_in_request(function, *args, **kwargs):
+    """
+    Call ``function(*args, **kwargs)`` as a (synchronous) request.
+    """
+    unpin()
+    close_old_connections()
+    try:
+        return function(*args, **kwargs)
+    finally:
+        close_old_connections()
+
+
+def submit(function, *args, **kwargs):
+    """
+    Run ``function(*args, **kwargs)`` in the shared pool; return a
+    ``concurrent.futures.Future`` of its result.
+    """
+    return get_executor().submit(call_in_request, function, *args, **kwargs)
+
+
+################################################################
+
+
+def get_hashing_executor():
+    """
+    The shared process pool for password hashing, created on first
+    use; None without ``password_hashing_processes``.
+    """
+    global _hashing_executor
+    processes = conf.get('password_hashing_processes')
+    if not processes:
+        return None
+    if _hashing_executor is None:
+        with _executor_lock:
+            if _hashing_executor is None:
+                from concurrent.futures import ProcessPoolExecutor
+                _hashing_executor = ProcessPoolExecutor(max_workers=processes)
+    return _hashing_executor
+
+
+def hash_password(password):
+    """
+    Return ``utils.make_password_hashes(password)``, computed in the
+    hashing process pool (waiting for it), or else in this thread.
+    """
+    executor = get_hashing_executor()
+    with timed_hashing():
+        if executor is None:
+            return make_password_hashes(password)
+        return executor.submit(make_password_hashes, password).result()
+
+
+################################################################
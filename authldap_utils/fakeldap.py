@@ -0,0 +1,772 @@
+"""
+An in-process, in-memory LDAP directory, with a connection object
+offering the python-ldap ``LDAPObject`` methods the ldapdb backends
+and this application use.
+
+It implements what the LDAP models rely on (and no schema checking):
+search scopes, RFC 4515 filters (equality, presence, substrings,
+``>=``/``<=`` and boolean operators; case-insensitive), paged results,
+add, modify, delete, rename and compare, the Assertion control
+(RFC 4528), and the ``entryCSN``/``modifyTimestamp`` operational
+attributes.
+
+Directories are named, and shared by the connections of a process::
+
+    connection = fakeldap.initialize('memory://benchmarks')
+"""
+################################################################
+from __future__ import print_function, unicode_literals
+
+import itertools
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import ldap
+import ldap.controls
+import ldap.dn
+import six
+from django.utils.encoding import force_bytes, force_text
+
+################################################################
+
+URI_PREFIX = 'memory://'
+
+# Maintained by the directory, only returned when asked for.
+OPERATIONAL_ATTRIBUTES = [
+    'createTimestamp',
+    'modifyTimestamp',
+    'entryCSN',
+]
+
+# Advertised in the root DSE.
+SUPPORTED_CONTROLS = [
+    ldap.CONTROL_PAGEDRESULTS,
+    '1.3.6.1.1.12',  # Assertion (RFC 4528)
+]
+ASSERTION_CONTROL_OID = '1.3.6.1.1.12'
+
+# Equality indexes (like slapd's ``index ... eq``), so lookups of an
+# entry by these do not scan the directory.
+INDEXED_ATTRIBUTES = [
+    'uid',
+    'cn',
+    'mail',
+    'uidnumber',
+    'gidnumber',
+    'memberuid',
+    'sambadomainname',
+    'sambasid',
+]
+
+_directories = {}
+_directories_lock = threading.Lock()
+
+################################################################
+
+
+def normalize_dn(dn):
+    """
+    The (case-insensitive) key of a DN.
+    """
+    try:
+        rdns = ldap.dn.str2dn(dn)
+    except ldap.DECODING_ERROR:
+        raise ldap.INVALID_DN_SYNTAX({'desc': 'Invalid DN syntax', 'info': dn})
+    return ','.join([
+        '+'.join(['{0}={1}'.format(attr.lower(), value.lower())
+                  for attr, value, flags in rdn])
+        for rdn in rdns
+    ])
+
+
+def parent_dn(dn):
+    rdns = ldap.dn.str2dn(dn)
+    return ldap.dn.dn2str(rdns[1:])
+
+
+def get_directory_name(uri):
+    """
+    The directory name of a ``memory://<name>`` URI.
+    """
+    if not uri.startswith(URI_PREFIX):
+        raise ldap.SERVER_DOWN({'desc': "Can't contact LDAP server",
+                                'info': uri})
+    return uri[len(URI_PREFIX):]
+
+
+def has_directory(name):
+    return name in _directories
+
+
+def drop_directory(name):
+    """
+    Forget the named directory (and its entries).
+    """
+    with _directories_lock:
+        _directories.pop(name, None)
+
+
+def get_directory(name, suffix=None):
+    """
+    The named directory (created empty, with the ``suffix`` entry,
+    the first time).
+    """
+    with _directories_lock:
+        directory = _directories.get(name, None)
+        if directory is None:
+            directory = _directories[name] = Directory(suffix)
+        return directory
+
+
+def initialize(uri, suffix=None, **kwargs):
+    """
+    A connection to the directory named by ``memory://<name>``.
+    """
+    return FakeLDAPObject(get_directory(get_directory_name(uri), suffix))
+
+
+################################################################
+
+# Filters
+
+
+def unescape_filter_value(value):
+    """
+    Decode the ``\\XX`` escapes of a filter assertion value.
+    """
+    parts = re.split(r'\\([0-9a-fA-F]{2})', value)
+    data = b''.join([
+        force_bytes(part) if i % 2 == 0 else
+        six.int2byte(int(part, 16))
+        for i, part in enumerate(parts)
+    ])
+    return force_text(data, errors='replace')
+
+
+def compare_values(a, b):
+    """
+    Order two attribute values: as integers if both are, otherwise as
+    case-folded text (generalized times sort as text).
+    """
+    try:
+        a, b = int(a), int(b)
+    except ValueError:
+        a, b = a.lower(), b.lower()
+    return (a > b) - (a < b)
+
+
+class Filter(object):
+    """
+    A parsed search filter; ``match(entry)`` tests an entry.
+    """
+
+    def __init__(self, filterstr):
+        self.filterstr = filterstr
+        self.node, pos = self.parse(filterstr.strip(), 0)
+        if pos != len(filterstr.strip()):
+            raise self.error()
+
+    def error(self):
+        return ldap.FILTER_ERROR({'desc': 'Bad search filter',
+                                  'info': self.filterstr})
+
+    def parse(self, s, pos):
+        if not s.startswith('(', pos):
+            raise self.error()
+        pos += 1
+        if s[pos:pos + 1] in ('&', '|'):
+            operator = 'and' if s[pos] == '&' else 'or'
+            pos += 1
+            children = []
+            while s.startswith('(', pos):
+                child, pos = self.parse(s, pos)
+                children.append(child)
+            node = (operator, children)
+        elif s[pos:pos + 1] == '!':
+            child, pos = self.parse(s, pos + 1)
+            node = ('not', child)
+        else:
+            end = s.find(')', pos)
+            if end == -1:
+                raise self.error()
+            node = self.parse_item(s[pos:end])
+            pos = end
+        if not s.startswith(')', pos):
+            raise self.error()
+        return node, pos + 1
+
+    def parse_item(self, item):
+        index = item.find('=')
+        if index < 1:
+            raise self.error()
+        attr, value = item[:index], item[index + 1:]
+        if attr[-1] == '~':
+            # approximate matching is equality here.
+            return ('eq', attr[:-1].lower(),
+                    unescape_filter_value(value).lower())
+        if attr[-1] in '<>':
+            operator = 'le' if attr[-1] == '<' else 'ge'
+            return (operator, attr[:-1].lower(), unescape_filter_value(value))
+        if ':' in attr:
+            # extensible matching is not supported.
+            raise self.error()
+        attr = attr.lower()
+        if value == '*':
+            return ('present', attr)
+        if '*' in value:
+            pattern = '.*'.join([
+                re.escape(unescape_filter_value(part))
+                for part in value.split('*')
+            ])
+            return ('substrings', attr,
+                    re.compile(pattern + '$', re.IGNORECASE | re.DOTALL))
+        return ('eq', attr, unescape_filter_value(value).lower())
+
+    def match(self, entry):
+        return self.match_node(self.node, entry)
+
+    def get_indexed(self, node=None):
+        """
+        The equality index keys, [(attribute, value)], one of which an
+        entry must have to match (on the ``INDEXED_ATTRIBUTES``); or
+        None, when the filter cannot use the index.
+        """
+        if node is None:
+            node = self.node
+        if node[0] == 'eq' and node[1] in INDEXED_ATTRIBUTES:
+            return [(node[1], node[2])]
+        if node[0] == 'or':
+            keys = []
+            for child in node[1]:
+                child_keys = self.get_indexed(child)
+                if child_keys is None:
+                    return None
+                keys.extend(child_keys)
+            return keys
+        if node[0] == 'and':
+            for child in node[1]:
+                keys = self.get_indexed(child)
+                if keys is not None:
+                    return keys
+        return None
+
+    def match_node(self, node, entry):
+        operator = node[0]
+        if operator == 'and':
+            return all(self.match_node(child, entry) for child in node[1])
+        if operator == 'or':
+            return any(self.match_node(child, entry) for child in node[1])
+        if operator == 'not':
+            return not self.match_node(node[1], entry)
+        if operator == 'present':
+            return node[1] == 'objectclass' or bool(entry.get(node[1]))
+        values = entry.get_text(node[1])
+        if operator == 'eq':
+            return node[2] in [value.lower() for value in values]
+        if operator == 'substrings':
+            return any(node[2].match(value) for value in values)
+        if operator == 'ge':
+            return any(compare_values(value, node[2]) >= 0
+                       for value in values)
+        return any(compare_values(value, node[2]) <= 0 for value in values)
+
+
+################################################################
+
+
+class Entry(object):
+    """
+    A directory entry: its DN, and attribute values (bytes), with
+    case-insensitive attribute names.
+    """
+
+    position = 0
+
+    def __init__(self, dn, attrs=None):
+        self.dn = dn
+        self.attrs = OrderedDict()
+        self.names = {}
+        for attr, values in (attrs or {}).items():
+            self.set(attr, values)
+
+    def copy(self):
+        entry = Entry(self.dn, self.attrs)
+        entry.position = self.position
+        return entry
+
+    def get(self, attr):
+        name = self.names.get(attr.lower(), None)
+        if name is None:
+            return []
+        return self.attrs[name]
+
+    def get_text(self, attr):
+        return [force_text(value, errors='replace')
+                for value in self.get(attr)]
+
+    def set(self, attr, values):
+        name = self.names.pop(attr.lower(), None)
+        if name is not None:
+            del self.attrs[name]
+        if values:
+            self.names[attr.lower()] = attr
+            self.attrs[attr] = list(values)
+
+    def get_attrs(self, attrlist):
+        """
+        The attributes requested by a search.
+        """
+        if not attrlist:
+            attrlist = ['*']
+        requested = [attr.lower() for attr in attrlist]
+        result = {}
+        for name, values in self.attrs.items():
+            key = name.lower()
+            if key in _operational:
+                wanted = '+' in attrlist
+            else:
+                wanted = '*' in attrlist
+            if wanted or key in requested:
+                result[name] = list(values)
+        return result
+
+    def get_index_keys(self):
+        return [(attr, force_text(value, errors='replace').lower())
+                for attr in INDEXED_ATTRIBUTES for value in self.get(attr)]
+
+
+_operational = [attr.lower() for attr in OPERATIONAL_ATTRIBUTES]
+
+
+def to_values(values):
+    """
+    Attribute values in a modlist, as a list of bytes.
+    """
+    if values is None:
+        return []
+    if isinstance(values, (six.binary_type, six.text_type)):
+        values = [values]
+    return [force_bytes(value) for value in values]
+
+
+################################################################
+
+
+class Directory(object):
+    """
+    The entries (by normalized DN, in the order added) of an in-memory
+    directory, and its change sequence.
+
+    Changes can be undone: each journal (see ``begin()``) keeps the
+    state, before their first change since, of the entries changed.
+    """
+
+    def __init__(self, suffix=None):
+        self.lock = threading.RLock()
+        self.entries = OrderedDict()
+        self.index = {}
+        self.positions = itertools.count(1)
+        self.sequence = itertools.count(1)
+        self.filters = {}
+        self.journals = []
+        self.suffix = suffix
+        if suffix:
+            self.add_suffix(suffix)
+
+    def add_suffix(self, suffix):
+        """
+        Add the naming context entry (e.g., dc=example,dc=com).
+        """
+        attr, value, flags = ldap.dn.str2dn(suffix)[0][0]
+        self.add(suffix, [
+            ('objectClass', [b'top', b'dcObject', b'organization']),
+            (attr, [force_bytes(value)]),
+            ('o', [force_bytes(value)]),
+        ], check_parent=False)
+
+    def clear(self):
+        with self.lock:
+            for key in self.entries:
+                self.record(key)
+            self.entries.clear()
+            self.index.clear()
+            if self.suffix:
+                self.add_suffix(self.suffix)
+
+    def snapshot(self):
+        """
+        A copy of the entries, for ``restore()``.
+        """
+        with self.lock:
+            return OrderedDict([(key, entry.copy())
+                                for key, entry in self.entries.items()])
+
+    def restore(self, snapshot):
+        with self.lock:
+            self.entries = OrderedDict([(key, entry.copy())
+                                        for key, entry in snapshot.items()])
+            self.index.clear()
+            for key, entry in self.entries.items():
+                self.add_to_index(key, entry)
+            position = max([entry.position
+                            for entry in self.entries.values()] or [0])
+            self.positions = itertools.count(position + 1)
+
+    def begin(self):
+        """
+        Start recording changes; return the journal, for ``rollback()``
+        and ``end()``.
+        """
+        with self.lock:
+            journal = OrderedDict()
+            self.journals.append(journal)
+            return journal
+
+    def end(self, journal):
+        """
+        Stop recording changes in the journal.
+        """
+        with self.lock:
+            self.journals = [j for j in self.journals if j is not journal]
+
+    def record(self, key):
+        """
+        Keep the entry (None if there is none) in each journal, before
+        its first change there.
+        """
+        saved = False
+        for journal in self.journals:
+            if key not in journal:
+                if saved is False:
+                    entry = self.entries.get(key, None)
+                    saved = entry.copy() if entry is not None else None
+                journal[key] = saved
+
+    def rollback(self, journal):
+        """
+        Undo the changes since the journal was started (or rolled back),
+        and go on recording in it.
+        """
+        with self.lock:
+            reinserted = False
+            for key, saved in journal.items():
+                entry = self.entries.pop(key, None)
+                if entry is not None:
+                    self.remove_from_index(key, entry)
+                if saved is not None:
+                    entry = self.entries[key] = saved.copy()
+                    self.add_to_index(key, entry)
+                    reinserted = True
+            if reinserted:
+                self.entries = OrderedDict(
+                    sorted(self.entries.items(),
+                           key=lambda item: item[1].position))
+            journal.clear()
+
+    def add_to_index(self, key, entry):
+        for index_key in entry.get_index_keys():
+            self.index.setdefault(index_key, set()).add(key)
+
+    def remove_from_index(self, key, entry):
+        for index_key in entry.get_index_keys():
+            keys = self.index.get(index_key, None)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.index[index_key]
+
+    def get_filter(self, filterstr):
+        # the same few filters are used over and over.
+        search_filter = self.filters.get(filterstr, None)
+        if search_filter is None:
+            search_filter = self.filters[filterstr] = Filter(filterstr)
+        return search_filter
+
+    def get_entry(self, dn):
+        entry = self.entries.get(normalize_dn(dn), None)
+        if entry is None:
+            raise ldap.NO_SUCH_OBJECT({'desc': 'No such object',
+                                       'matched': '', 'info': dn})
+        return entry
+
+    def touch(self, entry, created=False):
+        now = time.time()
+        timestamp = time.strftime('%Y%m%d%H%M%SZ', time.gmtime(now))
+        csn = '{0}.{1:06d}Z#{2:06x}#000#000000'.format(
+            time.strftime('%Y%m%d%H%M%S', time.gmtime(now)),
+            int(now % 1 * 1000000), next(self.sequence) % 0x1000000)
+        if created:
+            entry.set('createTimestamp', [force_bytes(timestamp)])
+        entry.set('modifyTimestamp', [force_bytes(timestamp)])
+        entry.set('entryCSN', [force_bytes(csn)])
+
+    def check_assertion(self, entry, serverctrls):
+        for control in serverctrls or []:
+            if control.controlType == ASSERTION_CONTROL_OID and \
+                    not self.get_filter(control.filterstr).match(entry):
+                raise ldap.ASSERTION_FAILED({'desc': 'Assertion Failed'})
+
+    def search(self, base, scope, filterstr, attrlist):
+        """
+        Return the [(dn, attrs)] results.
+        """
+        search_filter = self.get_filter(filterstr or '(objectClass=*)')
+        with self.lock:
+            if not base and scope == ldap.SCOPE_BASE:
+                return [('', {'supportedControl': [
+                    force_bytes(oid) for oid in SUPPORTED_CONTROLS]})]
+            base_key = normalize_dn(base)
+            if base_key not in self.entries:
+                self.get_entry(base)
+            indexed = search_filter.get_indexed()
+            if scope == ldap.SCOPE_BASE:
+                candidates = [self.entries[base_key]]
+            else:
+                suffix = ',' + base_key
+                depth = base_key.count(',') + 1
+                candidates = []
+                if indexed is None:
+                    items = self.entries.items()
+                else:
+                    keys = set()
+                    for index_key in indexed:
+                        keys.update(self.index.get(index_key, ()))
+                    items = sorted([(key, self.entries[key]) for key in keys],
+                                   key=lambda item: item[1].position)
+                for key, entry in items:
+                    if key == base_key:
+                        if scope == ldap.SCOPE_SUBTREE:
+                            candidates.append(entry)
+                    elif key.endswith(suffix) and \
+                            (scope == ldap.SCOPE_SUBTREE or
+                             key.count(',') == depth):
+                        candidates.append(entry)
+            return [(entry.dn, entry.get_attrs(attrlist))
+                    for entry in candidates if search_filter.match(entry)]
+
+    def add(self, dn, modlist, check_parent=True):
+        key = normalize_dn(dn)
+        with self.lock:
+            if key in self.entries:
+                raise ldap.ALREADY_EXISTS({'desc': 'Already exists',
+                                           'info': dn})
+            if check_parent:
+                self.get_entry(parent_dn(dn))
+            entry = Entry(dn)
+            for attr, values in modlist:
+                entry.set(attr, to_values(values))
+            # the naming attribute values, if they were left out.
+            for attr, value, flags in ldap.dn.str2dn(dn)[0]:
+                if force_bytes(value) not in entry.get(attr):
+                    entry.set(attr, entry.get(attr) + [force_bytes(value)])
+            entry.position = next(self.positions)
+            self.touch(entry, created=True)
+            self.record(key)
+            self.entries[key] = entry
+            self.add_to_index(key, entry)
+
+    def modify(self, dn, modlist, serverctrls=None):
+        with self.lock:
+            entry = self.get_entry(dn)
+            self.check_assertion(entry, serverctrls)
+            # all or nothing
+            changed = entry.copy()
+            for op, attr, values in modlist:
+                values = to_values(values)
+                current = changed.get(attr)
+                if op == ldap.MOD_ADD:
+                    for value in values:
+                        if value in current:
+                            raise ldap.TYPE_OR_VALUE_EXISTS(
+                                {'desc': 'Type or value exists',
+                                 'info': attr})
+                    changed.set(attr, current + values)
+                elif op == ldap.MOD_DELETE:
+                    if not current or \
+                            [value for value in values if value not in current]:
+                        raise ldap.NO_SUCH_ATTRIBUTE(
+                            {'desc': 'No such attribute', 'info': attr})
+                    changed.set(attr, [value for value in current
+                                       if values and value not in values])
+                else:
+                    changed.set(attr, values)
+            key = normalize_dn(dn)
+            self.record(key)
+            self.remove_from_index(key, entry)
+            entry.attrs, entry.names = changed.attrs, changed.names
+            self.touch(entry)
+            self.add_to_index(key, entry)
+
+    def delete(self, dn):
+        key = normalize_dn(dn)
+        with self.lock:
+            entry = self.get_entry(dn)
+            suffix = ',' + key
+            for other in self.entries:
+                if other.endswith(suffix):
+                    raise ldap.NOT_ALLOWED_ON_NONLEAF(
+                        {'desc': 'Operation not allowed on non-leaf',
+                         'info': dn})
+            self.record(key)
+            self.remove_from_index(key, entry)
+            del self.entries[key]
+
+    def rename(self, dn, newrdn, newsuperior=None, delold=1,
+               serverctrls=None):
+        with self.lock:
+            entry = self.get_entry(dn)
+            self.check_assertion(entry, serverctrls)
+            if newsuperior is None:
+                newsuperior = parent_dn(dn)
+            else:
+                self.get_entry(newsuperior)
+            new_dn = ','.join([newrdn, newsuperior]) if newsuperior else newrdn
+            new_key = normalize_dn(new_dn)
+            old_key = normalize_dn(dn)
+            if new_key in self.entries and new_key != old_key:
+                raise ldap.ALREADY_EXISTS({'desc': 'Already exists',
+                                           'info': new_dn})
+            suffix = ',' + old_key
+            for key in list(self.entries):
+                if key == old_key or key.endswith(suffix):
+                    self.record(key)
+                    self.record(key[:-len(old_key)] + new_key)
+            self.remove_from_index(old_key, entry)
+            if delold:
+                for attr, value, flags in ldap.dn.str2dn(dn)[0]:
+                    entry.set(attr, [v for v in entry.get(attr)
+                                     if v != force_bytes(value)])
+            for attr, value, flags in ldap.dn.str2dn(newrdn)[0]:
+                if force_bytes(value) not in entry.get(attr):
+                    entry.set(attr, entry.get(attr) + [force_bytes(value)])
+            self.touch(entry)
+            # move the entry (and any subordinates), keeping the order.
+            entries = OrderedDict()
+            for key, other in self.entries.items():
+                if key == old_key:
+                    other.dn = new_dn
+                    key = new_key
+                elif key.endswith(suffix):
+                    other.dn = other.dn[:-len(dn)] + new_dn
+                    key = normalize_dn(other.dn)
+                entries[key] = other
+            self.entries = entries
+            self.index.clear()
+            for key, other in self.entries.items():
+                self.add_to_index(key, other)
+
+    def compare(self, dn, attr, value):
+        with self.lock:
+            entry = self.get_entry(dn)
+            return force_bytes(value) in entry.get(attr)
+
+
+################################################################
+
+
+class FakeLDAPObject(object):
+    """
+    A connection to a ``Directory``, like python-ldap's ``LDAPObject``
+    (synchronous; ``search_ext()`` results are kept for ``result3()``).
+    """
+    timeout = -1
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.who = ''
+        self.options = {}
+        self.msgids = itertools.count(1)
+        self.pending = {}
+        self.cookies = itertools.count(1)
+        self.paged = {}
+
+    def set_option(self, option, value):
+        self.options[option] = value
+
+    def get_option(self, option):
+        return self.options.get(option, None)
+
+    def start_tls_s(self):
+        pass
+
+    def simple_bind_s(self, who='', cred='', serverctrls=None,
+                      clientctrls=None):
+        self.who = who or ''
+
+    def whoami_s(self):
+        return 'dn:' + self.who if self.who else ''
+
+    def unbind_s(self):
+        self.pending.clear()
+        self.paged.clear()
+
+    unbind = unbind_s
+
+    def search_ext(self, base, scope, filterstr='(objectClass=*)',
+                   attrlist=None, attrsonly=0, serverctrls=None,
+                   clientctrls=None, timeout=-1, sizelimit=0):
+        msgid = next(self.msgids)
+        paged = [control for control in serverctrls or []
+                 if control.controlType == ldap.CONTROL_PAGEDRESULTS]
+        if not paged:
+            self.pending[msgid] = (
+                self.directory.search(base, scope, filterstr, attrlist), [])
+            return msgid
+
+        # The cookie names the rest of the results, kept (like a
+        # server would) until the last page is read.
+        control = paged[0]
+        if control.cookie:
+            results = self.paged.pop(force_text(control.cookie))
+        else:
+            results = self.directory.search(base, scope, filterstr, attrlist)
+        size = control.size or len(results)
+        cookie = b''
+        if len(results) > size:
+            cookie = force_bytes(next(self.cookies))
+            self.paged[force_text(cookie)] = results[size:]
+        response = ldap.controls.SimplePagedResultsControl(
+            criticality=False, size=len(results), cookie=cookie)
+        self.pending[msgid] = (results[:size], [response])
+        return msgid
+
+    def result3(self, msgid=ldap.RES_ANY, all=1, timeout=None):
+        results, controls = self.pending.pop(msgid)
+        return ldap.RES_SEARCH_RESULT, results, msgid, controls
+
+    def search_ext_s(self, *args, **kwargs):
+        return self.result3(self.search_ext(*args, **kwargs))[1]
+
+    def search_s(self, base, scope, filterstr='(objectClass=*)',
+                 attrlist=None, attrsonly=0):
+        return self.directory.search(base, scope, filterstr, attrlist)
+
+    def add_s(self, dn, modlist):
+        self.directory.add(dn, modlist)
+
+    add_ext_s = add_s
+
+    def modify_s(self, dn, modlist):
+        self.directory.modify(dn, modlist)
+
+    def modify_ext_s(self, dn, modlist, serverctrls=None, clientctrls=None):
+        self.directory.modify(dn, modlist, serverctrls=serverctrls)
+
+    def delete_s(self, dn):
+        self.directory.delete(dn)
+
+    def rename_s(self, dn, newrdn, newsuperior=None, delold=1,
+                 serverctrls=None, clientctrls=None):
+        self.directory.rename(dn, newrdn, newsuperior, delold,
+                              serverctrls=serverctrls)
+
+    def modrdn_s(self, dn, newrdn, delold=1):
+        self.rename_s(dn, newrdn, delold=delold)
+
+    def compare_s(self, dn, attr, value):
+        return self.directory.compare(dn, attr, value)
+
+
+################################################################
@@ -0,0 +1,34 @@
+"""
+Model fields for the authldap_utils application.
+"""
+################################################################
+from __future__ import print_function, unicode_literals
+
+from ldapdb.models.fields import CharField, GteLookup, LteLookup
+
+################################################################
+
+
+class OperationalField(CharField):
+    """
+    A read-only operational attribute, maintained by the server, e.g.,
+    ``modifyTimestamp`` or ``entryCSN``.  It is never written.
+
+    Timestamps (generalized time) and CSNs sort as strings, so ``gte``
+    and ``lte`` lookups are supported.
+    """
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('editable', False)
+        kwargs.setdefault('blank', True)
+        super(OperationalField, self).__init__(*args, **kwargs)
+
+    def get_db_prep_save(self, value, connection):
+        # unchanged (None) for updates, and left out when adding.
+        return None
+
+
+OperationalField.register_lookup(GteLookup)
+OperationalField.register_lookup(LteLookup)
+
+################################################################
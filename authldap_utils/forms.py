@@ -6,10 +6,10 @@ from __future__ import print_function, unicode_literals
 
 import unicodedata
 from collections import OrderedDict
+from email.utils import formataddr
 
+import six
 from django import forms
-from django.contrib.admin.templatetags.admin_static import static
-from django.contrib.admin.widgets import FilteredSelectMultiple
 from django.contrib.auth import get_user_model
 from django.contrib.auth.forms import (PasswordChangeForm, PasswordResetForm,
                                        SetPasswordForm)
@@ -17,18 +17,22 @@ from django.contrib.auth.hashers import is_password_usable
 from django.contrib.auth.tokens import default_token_generator
 from django.contrib.sites.shortcuts import get_current_site
 from django.core.exceptions import ValidationError
-from django.core.mail import EmailMessage, send_mail
+from django.core.mail import EmailMessage, EmailMultiAlternatives, send_mail
+from django.db.models import Q
 from django.template import loader
 from django.utils.encoding import force_bytes
 from django.utils.http import urlsafe_base64_encode
+from django.utils.module_loading import import_string
 from django.utils.translation import ugettext_lazy as _
 
 from . import conf
-from .models import LdapGroup, LdapSambaDomain, LdapUser
+from .choices import CachedModelChoiceField
+from .mail import (MERGE_FIELDS, MergeTemplate, get_merge_context,
+                   send_mass_messages)
+from .models import ENABLE_SAMBA, LdapGroup, LdapSambaDomain, LdapUser
+from .throttle import is_rate_limited
 from .utils import generate_random_password, make_ssha_password
 
-DjangoUser = get_user_model()
-
 ################################################################
 
 ################################################################
@@ -49,18 +53,18 @@ class CheckAlreadyAssignedMixin(object):
 
     def auto_numeric_check(self, name, default, qs, verbose_name=None):
         value = self.data[name]
-        #values_list = [int(getattr(o, name, default)) for o in qs.all()]
-        values_list = [int(v) for v in qs.values_list(name, flat=True)]
         if not value:
-            if values_list:
-                M = max(values_list)
-                value = M + 1
-            else:
-                value = default
+            # one pass over the (streamed) values, never all in memory.
+            maximum = None
+            for v in qs.values_list(name, flat=True).iterator():
+                v = int(v)
+                if maximum is None or v > maximum:
+                    maximum = v
+            value = default if maximum is None else maximum + 1
         else:
             value = int(value)
-        return self.check_already_assigned(name, qs, value, values_list,
-                                           verbose_name)
+        return self.check_already_assigned(name, qs, value,
+                                           verbose_name=verbose_name)
 
     def check_already_assigned(self,
                                name,
@@ -71,7 +75,9 @@ class CheckAlreadyAssignedMixin(object):
         if value is None:
             value = self.data[name]
         if field_list is None:
-            field_list = qs.values_list(name, flat=True)
+            # only the entries with this value.
+            field_list = qs.filter(**{name: value}).values_list(name,
+                                                               flat=True)
         if not isinstance(field_list, list):
             field_list = list(field_list)
         if verbose_name is None:
@@ -90,21 +96,77 @@ class CheckAlreadyAssignedMixin(object):
 ################################################################
 
 
+class ConcurrencyCheckMixin(forms.Form):
+    """
+    Optimistic concurrency for LDAP model forms: the version of the
+    entry when the form was loaded is kept in a hidden field, and
+    changes since then are reported as a form error.  The save is also
+    conditional on that version (see ``LdapModel.expected_version``).
+    """
+    version = forms.CharField(widget=forms.HiddenInput, required=False)
+    # True when a conflict was already detected, e.g., by the save.
+    conflict = False
+
+    conflict_message = (
+        'This entry was changed by someone else since you loaded it.  '
+        'Reload it, and make your changes again.')
+
+    def __init__(self, *args, **kwargs):
+        super(ConcurrencyCheckMixin, self).__init__(*args, **kwargs)
+        if self.instance is not None and self.instance.dn:
+            self.fields['version'].initial = self.instance.get_version()
+
+    def clean(self):
+        cleaned_data = super(ConcurrencyCheckMixin, self).clean()
+        version = cleaned_data.get('version', '')
+        if self.conflict or (
+                version and version != self.instance.get_current_version()):
+            raise ValidationError(self.conflict_message, code='conflict')
+        return cleaned_data
+
+    def save(self, commit=True):
+        self.instance.expected_version = self.cleaned_data.get('version', '')
+        return super(ConcurrencyCheckMixin, self).save(commit=commit)
+
+
+################################################################
+
+
 class LdapUserMixin(object):
     """
     Provide a function to get an LDAP user from a username.
     """
 
+    def get_ldap_user_fields(self):
+        """
+        The fields to fetch for the LDAP user (None for all of them).
+        This mixin is used by the password forms, so only the password
+        related attributes are fetched.
+        """
+        return LdapUser.get_password_fields()
+
     def get_ldap_user(self, username):
         """
         Get the LDAP user, if there is one.  If not, return None.
+        The user is looked up once per form (e.g., the password change
+        form needs it to check the old password, and to save).
         """
+        ldap_users = self.__dict__.setdefault('_ldap_users', {})
+        if username in ldap_users:
+            return ldap_users[username]
+        fields = self.get_ldap_user_fields()
+        if fields is None:
+            queryset = LdapUser.objects.all()
+        else:
+            # not LdapUser.objects: only() would leave the fields it
+            # always defers (e.g., the Samba ones) deferred.
+            queryset = LdapUser._base_manager.only('dn', *fields)
         try:
-            ldap_user = LdapUser.objects.get(username=username)
+            ldap_user = queryset.get(username=username)
         except LdapUser.DoesNotExist:
-            return None
-        else:
-            return ldap_user
+            ldap_user = None
+        ldap_users[username] = ldap_user
+        return ldap_user
 
 
 class LdapUserPasswordMixin(object):
@@ -124,22 +186,78 @@ class LdapUserPasswordMixin(object):
 ################################################################
 
 
-class LdapUserForm(CheckAlreadyAssignedMixin, LdapUserPasswordMixin,
-                   forms.ModelForm):
+# The user form fields, in order (the LdapUserAdmin uses fieldsets):
+field_list = [
+    'uid',
+    'username',
+    'password',
+    'group',
+    'gecos',
+    'home_directory',
+    'login_shell',
+    'email',
+    'first_name',
+    'last_name',
+    'full_name',
+    'phone',
+    'mobile_phone',
+    'version',
+]
+if ENABLE_SAMBA:
+    field_list += [
+        'domain',
+        'acct_flags',
+        'lm_password',
+        'nt_password',
+        'sid',
+        'pwd_last_set',
+        'pwd_can_change',
+        'pwd_must_change',
+        'logon_time',
+        'logoff_time',
+        'kickoff_time',
+        'bad_password_count',
+        'bad_password_time',
+        'logon_hours',
+    ]
+
+
+class LdapUserForm(CheckAlreadyAssignedMixin, ConcurrencyCheckMixin,
+                   LdapUserPasswordMixin, forms.ModelForm):
     """
     """
 
-    group = forms.ModelChoiceField(
+    group = CachedModelChoiceField(
         queryset=LdapGroup.objects.all(), to_field_name='gid')
-    if conf.get('enable_samba'):
-        domain = forms.ModelChoiceField(
+    if ENABLE_SAMBA:
+        domain = CachedModelChoiceField(
             queryset=LdapSambaDomain.objects.all(),
             to_field_name='domain_name')
 
     class Meta:
         model = LdapUser
+        fields = field_list
         exclude = ['dn', 'photo']
 
+    def __init__(self, *args, **kwargs):
+        super(LdapUserForm, self).__init__(*args, **kwargs)
+        if conf.get('choices_autocomplete'):
+            for name in ['group', 'domain']:
+                if name in self.fields:
+                    self.use_autocomplete(name)
+
+    def use_autocomplete(self, name):
+        """
+        Switch the named choice field to an autocomplete widget.
+        """
+        from .widgets import LdapAutocompleteSelect
+
+        field = self.fields[name]
+        field.widget = LdapAutocompleteSelect(
+            'admin:ldap-choices-autocomplete', url_kwargs={'field_name': name})
+        field.widget.is_required = field.required
+        field.widget.choices = field.choices
+
     def clean_password(self):
         """
         Generate a random password if the password is blank.
@@ -204,51 +322,13 @@ class LdapUserForm(CheckAlreadyAssignedMixin, LdapUserPasswordMixin,
         return self.data['home_directory']
 
 
-# Force ordering for user info:
-field_list = [
-    'uid',
-    'username',
-    'password',
-    'group',
-    'gecos',
-    'home_directory',
-    'login_shell',
-    'email',
-    'first_name',
-    'last_name',
-    'full_name',
-    'phone',
-    'mobile_phone',
-]
-if conf.get('enable_samba'):
-    field_list += [
-        'domain',
-        'acct_flags',
-        'lm_password',
-        'nt_password',
-        'sid',
-        'pwd_last_set',
-        'pwd_can_change',
-        'pwd_must_change',
-        'logon_time',
-        'logoff_time',
-        'kickoff_time',
-        'bad_password_count',
-        'bad_password_time',
-        'logon_hours',
-    ]
-
-LdapUserForm.base_fields = OrderedDict(
-    [(k, LdapUserForm.base_fields[k]) for k in field_list])
-
-# Note: In the LdapUserAdmin this done via formsets.
-
 ################################################################
 
 ################################################################
 
 
-class LdapGroupForm(CheckAlreadyAssignedMixin, forms.ModelForm):
+class LdapGroupForm(CheckAlreadyAssignedMixin, ConcurrencyCheckMixin,
+                    forms.ModelForm):
     """
     Form for LdapGroup objects.
     """
@@ -309,6 +389,66 @@ class LdapPasswordResetForm(LdapUserMixin, PasswordResetForm):
             email__iexact=email, is_active=True)
         return (u for u in active_users if self._user_has_usuable_password(u))
 
+    def get_email_message(self,
+                          subject_template_name,
+                          email_template_name,
+                          context,
+                          from_email,
+                          to_email,
+                          html_email_template_name=None):
+        """
+        Return the EmailMultiAlternatives for a password reset.
+        (See the parent ``send_mail()``.)
+        """
+        subject = loader.render_to_string(subject_template_name, context)
+        # Email subject *must not* contain newlines
+        subject = ''.join(subject.splitlines())
+        body = loader.render_to_string(email_template_name, context)
+
+        email_message = EmailMultiAlternatives(subject, body, from_email,
+                                               [to_email])
+        if html_email_template_name is not None:
+            html_email = loader.render_to_string(html_email_template_name,
+                                                 context)
+            email_message.attach_alternative(html_email, 'text/html')
+        return email_message
+
+    def send_mail(self, *args, **kwargs):
+        """
+        Queue the message for the batch sender (see ``save()``),
+        or send it immediately when there is no batch sender.
+        """
+        email_message = self.get_email_message(*args, **kwargs)
+        if getattr(self, 'email_messages', None) is not None:
+            self.email_messages.append(email_message)
+        else:
+            email_message.send()
+
+    def save(self, *args, **kwargs):
+        """
+        Rate limit resets for each email address; this is checked
+        before any users are looked up.
+        When configured, the ``password_reset_sender`` sends all of
+        the messages (one address may have several accounts) at once.
+        """
+        email = self.cleaned_data['email']
+        if is_rate_limited('password_reset:' + email.lower(),
+                           conf.get('password_reset_rate')):
+            # Do not tell the client: that would leak valid addresses.
+            return
+
+        sender = conf.get('password_reset_sender')
+        if sender is None:
+            return super(LdapPasswordResetForm, self).save(*args, **kwargs)
+
+        self.email_messages = []
+        try:
+            super(LdapPasswordResetForm, self).save(*args, **kwargs)
+            if self.email_messages:
+                import_string(sender)(self.email_messages)
+        finally:
+            self.email_messages = None
+
 
 ################################################################
 
@@ -372,16 +512,71 @@ class LdapPasswordChangeForm(PasswordChangeForm, LdapSetPasswordForm):
 ################################################################
 
 
+class LdapUserChoiceIterator(forms.models.ModelChoiceIterator):
+    """
+    Resolve only the selected LDAP users (in chunks) for the
+    autocomplete widget, rather than enumerating the directory.
+    """
+    search_fields = ['first_name', 'last_name', 'full_name', 'username']
+
+    def selected(self, values):
+        return [
+            self.choice(obj) for obj in self.queryset.iter_chunks(
+                values, self.field.to_field_name or 'pk')
+        ]
+
+    def search(self, term):
+        """
+        Return the choices for the users with one of the
+        ``search_fields`` containing ``term``.
+        """
+        queryset = self.queryset
+        if term:
+            query = Q()
+            for name in self.search_fields:
+                query |= Q(**{name + '__icontains': term})
+            queryset = queryset.filter(query)
+        return [self.choice(obj) for obj in queryset]
+
+
+class LdapUserMultipleChoiceField(forms.ModelMultipleChoiceField):
+    """
+    A multiple choice field for a (possibly very large) number of
+    LDAP users.
+
+    Cleaning does not look up the users; the cleaned value is the list
+    of selected values, which are resolved later (in chunks) with
+    ``LdapUser.objects.iter_chunks()``.
+    """
+    iterator = LdapUserChoiceIterator
+
+    def clean(self, value):
+        value = self.prepare_value(value)
+        if not value:
+            if self.required:
+                raise ValidationError(
+                    self.error_messages['required'], code='required')
+            return []
+        if not isinstance(value, (list, tuple)):
+            raise ValidationError(self.error_messages['list'], code='list')
+        return list(value)
+
+
 class AdminEmailForm(forms.Form):
     """
     A form for composing an email.
     Assumes that the from and the to will be given.
+
+    Large selections of recipients (e.g., from the admin action) are
+    given as ``selected``, a list of LdapUser primary keys stored
+    server side; ``selection`` is the token identifying them.
     """
-    to_list = forms.ModelMultipleChoiceField(
-        queryset=LdapUser.objects.all(),
-        widget=FilteredSelectMultiple('Receipents', False))
+    selection = forms.CharField(required=False, widget=forms.HiddenInput)
+    to_list = LdapUserMultipleChoiceField(
+        queryset=LdapUser.objects.all(), required=False)
+    # (the User model is only known once the apps are loaded.)
     from_user = forms.ModelChoiceField(
-        queryset=DjangoUser.objects.all(), widget=forms.HiddenInput)
+        queryset=None, widget=forms.HiddenInput)
     subject = forms.CharField(
         max_length=128, widget=forms.TextInput(attrs={'size': 90}))
     message = forms.CharField(
@@ -389,30 +584,81 @@ class AdminEmailForm(forms.Form):
             'rows': 18,
             'cols': 65
         }))
+    merge = forms.BooleanField(
+        required=False,
+        label='Personalize',
+        help_text='Replace ' + ', '.join(
+            ['{' + name + '}' for name in MERGE_FIELDS]) +
+        ' in the subject and message for each recipient.')
+
+    def __init__(self, *args, **kwargs):
+        self.selected = kwargs.pop('selected', None) or []
+        super(AdminEmailForm, self).__init__(*args, **kwargs)
+        self.fields['from_user'].queryset = \
+            get_user_model()._default_manager.all()
+        self.use_autocomplete('to_list')
+        if self.selected:
+            n = len(self.selected)
+            self.fields['to_list'].help_text = \
+                '{0} selected user{1} will also receive this message.'.format(
+                    n, 's' if n != 1 else '')
+
+    def use_autocomplete(self, name):
+        """
+        Switch the recipients field to an autocomplete widget.
+        """
+        from .widgets import LdapAutocompleteSelectMultiple
+
+        field = self.fields[name]
+        field.widget = LdapAutocompleteSelectMultiple(
+            'admin:ldap-email-choices-autocomplete',
+            url_kwargs={'field_name': name})
+        field.widget.is_required = field.required
+        field.widget.choices = field.choices
+
+    def clean(self):
+        cleaned_data = super(AdminEmailForm, self).clean()
+        if not self.selected and not cleaned_data.get('to_list'):
+            raise ValidationError('Choose at least one recipient.')
+        if cleaned_data.get('merge'):
+            for name in ['subject', 'message']:
+                if name not in cleaned_data:
+                    continue
+                try:
+                    cleaned_data[name + '_template'] = MergeTemplate(
+                        cleaned_data[name])
+                except ValueError as e:
+                    self.add_error(name, six.text_type(e))
+        return cleaned_data
+
+    def get_recipients(self):
+        """
+        Yield the LdapUser recipients.  These are looked up in chunks,
+        so large numbers of recipients are never all in memory.
+        """
+        pk_list = OrderedDict.fromkeys(self.selected)
+        pk_list.update(OrderedDict.fromkeys(self.cleaned_data['to_list']))
+        return LdapUser.objects.iter_chunks(pk_list)
 
-    @property
-    def media(self):
-        js = [
-            'jquery.js', 'jquery.init.js', "core.js", "SelectBox.js",
-            "SelectFilter2.js"
-        ]
-        return forms.Media(js=[static("admin/js/%s" % path) for path in js])
-
-    def send_email(self):
+    def iter_messages(self):
         """
-        The form is assumed to be valid at the point this is called.
-        Return the number of messages sent.
+        Yield an EmailMessage for each recipient.
+        With ``merge``, the subject and message templates (compiled
+        once, when the form was cleaned) are rendered per recipient.
         """
         from_user = self.cleaned_data['from_user']
-        to_list = self.cleaned_data['to_list']
-        from_email = from_user.get_full_name() + ' <' + from_user.email + '>'
+        from_email = formataddr((from_user.get_full_name(), from_user.email))
         subject = self.cleaned_data['subject']
         message = self.cleaned_data['message']
-
-        count = 0
-        for to_obj in to_list:
-            headers = {'To': to_obj.full_name + ' <' + to_obj.email + '>'}
-            email = EmailMessage(
+        merge = self.cleaned_data.get('merge', False)
+
+        for to_obj in self.get_recipients():
+            if merge:
+                context = get_merge_context(to_obj)
+                subject = self.cleaned_data['subject_template'].render(context)
+                message = self.cleaned_data['message_template'].render(context)
+            headers = {'To': formataddr((to_obj.full_name, to_obj.email))}
+            yield EmailMessage(
                 subject=subject,
                 body=message,
                 from_email=from_email,
@@ -420,8 +666,13 @@ class AdminEmailForm(forms.Form):
                     to_obj.email,
                 ],
                 headers=headers)
-            count += email.send()
-        return count
+
+    def send_email(self):
+        """
+        The form is assumed to be valid at the point this is called.
+        Return the number of messages sent.
+        """
+        return send_mass_messages(self.iter_messages())
 
 
 ################################################################
@@ -9,8 +9,14 @@ from __future__ import print_function, unicode_literals
 
 from django.contrib.auth import get_user_model
 
+from .choices import invalidate_choices
+from .photos import invalidate_photo
+
 ################################################################
 
+# The LdapUser fields copied to the Django user.
+USER_SYNC_FIELDS = ['first_name', 'last_name', 'email']
+
 
 def user_sync_post_save(sender, instance, **kwargs):
     """
@@ -33,19 +39,53 @@ def user_sync_post_save(sender, instance, **kwargs):
     """
     if kwargs.get('raw', False):
         return
+    sync_django_user(instance)
+
+
+def sync_django_user(ldap_user):
+    """
+    Create or update the Django user for an LdapUser.  Fields deferred
+    (not loaded) on ``ldap_user``, e.g., when only its password was
+    changed, are left as they are, rather than read from the directory.
+    """
+    deferred_fields = ldap_user.get_deferred_fields()
+    values = dict([(name, getattr(ldap_user, name))
+                   for name in USER_SYNC_FIELDS
+                   if name not in deferred_fields])
     DjangoUserModel = get_user_model()
     user, flag = DjangoUserModel.objects.get_or_create(
-        username=instance.username,
-        defaults={
-            'first_name': instance.first_name,
-            'last_name': instance.last_name,
-            'email': instance.email,
-        })
+        username=ldap_user.username, defaults=values)
     if not flag:
-        user.first_name = instance.first_name
-        user.last_name = instance.last_name
-        user.email = instance.email
-        user.save()
+        changed = [
+            name for name, value in values.items()
+            if getattr(user, name) != value
+        ]
+        if changed:
+            for name in changed:
+                setattr(user, name, values[name])
+            user.save(update_fields=changed)
+
+
+################################################################
+
+
+def choices_cache_invalidate(sender, **kwargs):
+    """
+    Forget the cached form choices for ``sender`` whenever one of
+    its instances is saved or deleted.
+    """
+    invalidate_choices(sender)
+
+
+################################################################
+
+
+def photo_cache_invalidate(sender, instance, **kwargs):
+    """
+    Forget the cached photo details of an LdapUser whenever it is saved
+    or deleted.
+    """
+    invalidate_photo(instance.username)
 
 
 ################################################################
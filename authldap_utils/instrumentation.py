@@ -0,0 +1,260 @@
+"""
+Instrumentation of LDAP operations.
+
+The ``authldap_utils.backends.ldap`` database backend records every
+directory operation (search, add, modify, delete, rename, compare):
+the ``ldap_operation`` signal is sent, and per operation/model counters
+are kept for the ``ldap_metrics`` view (Prometheus text format), with
+those of password hashing (see ``authldap_utils.executors``).
+
+In tests::
+
+    class MyTestCase(LdapQueriesMixin, TestCase):
+        def test_profile(self):
+            with self.assertLdapQueries(1):
+                self.client.get('/profile/')
+"""
+################################################################
+from __future__ import print_function, unicode_literals
+
+import contextlib
+import threading
+import time
+
+from django.dispatch import Signal
+
+################################################################
+
+# Sent after every LDAP operation, with the keyword arguments:
+#   operation   'search', 'add', 'modify', 'delete', 'rename', 'compare'
+#   model       the model class, if known (also the sender), else None
+#   using       the database alias
+#   dn          the DN (the search base, for searches)
+#   filterstr, scope, attrlist  (searches only)
+#   count       the number of results (searches), or entries changed
+#   duration    the time spent in the directory, in seconds
+ldap_operation = Signal()
+
+# {(operation, model label, alias): [number, seconds, results]}
+_stats = {}
+_stats_lock = threading.Lock()
+
+_local = threading.local()
+
+# Password hashing: the number of passwords waiting or being hashed,
+# and the number hashed, and the time it took (waits included).
+_hashing_stats = {'pending': 0, 'count': 0, 'seconds': 0.0}
+
+
+def get_model_label(model):
+    if model is None:
+        return ''
+    return model._meta.label_lower
+
+
+@contextlib.contextmanager
+def using_model(model):
+    """
+    Attribute the operations within to ``model`` (when the caller of
+    the database backend does not say).
+    """
+    previous = getattr(_local, 'model', None)
+    _local.model = model
+    try:
+        yield
+    finally:
+        _local.model = previous
+
+
+def get_current_model():
+    return getattr(_local, 'model', None)
+
+
+def record(operation, using, model=None, count=1, duration=0.0, **details):
+    """
+    Record an LDAP operation, and send the ``ldap_operation`` signal.
+    """
+    if model is None:
+        model = get_current_model()
+    key = (operation, get_model_label(model), using)
+    with _stats_lock:
+        stats = _stats.setdefault(key, [0, 0.0, 0])
+        stats[0] += 1
+        stats[1] += duration
+        stats[2] += count
+    ldap_operation.send(
+        sender=model,
+        operation=operation,
+        model=model,
+        using=using,
+        count=count,
+        duration=duration,
+        **details)
+
+
+@contextlib.contextmanager
+def timed(operation, using, model=None, **details):
+    """
+    Record the operation within; set ``info['count']`` for the number
+    of results (default 1).
+    """
+    info = {'count': 1}
+    start = time.time()
+    try:
+        yield info
+    finally:
+        record(
+            operation,
+            using,
+            model=model,
+            count=info['count'],
+            duration=time.time() - start,
+            **details)
+
+
+@contextlib.contextmanager
+def timed_hashing():
+    """
+    Record the password hashing within.
+    """
+    with _stats_lock:
+        _hashing_stats['pending'] += 1
+    start = time.time()
+    try:
+        yield
+    finally:
+        duration = time.time() - start
+        with _stats_lock:
+            _hashing_stats['pending'] -= 1
+            _hashing_stats['count'] += 1
+            _hashing_stats['seconds'] += duration
+
+
+def get_hashing_stats():
+    """
+    Return {'pending': number, 'count': number, 'seconds': seconds}.
+    """
+    with _stats_lock:
+        return dict(_hashing_stats)
+
+
+def get_stats():
+    """
+    Return {(operation, model label, alias): (number, seconds, results)}.
+    """
+    with _stats_lock:
+        return dict([(key, tuple(value)) for key, value in _stats.items()])
+
+
+def reset_stats():
+    with _stats_lock:
+        _stats.clear()
+        _hashing_stats.update(count=0, seconds=0.0)
+
+
+################################################################
+
+
+class CapturedOperations(object):
+    """
+    The LDAP operations (each a dictionary of the signal arguments)
+    recorded within ``capture_ldap_operations()``.
+    """
+
+    def __init__(self, using=None):
+        self.using = using
+        self.operations = []
+        self.thread = threading.current_thread()
+
+    def __call__(self, sender, **kwargs):
+        if threading.current_thread() is not self.thread:
+            return
+        if self.using is None or kwargs['using'] == self.using:
+            kwargs.pop('signal', None)
+            self.operations.append(kwargs)
+
+    def __len__(self):
+        return len(self.operations)
+
+    def __iter__(self):
+        return iter(self.operations)
+
+
+@contextlib.contextmanager
+def capture_ldap_operations(using=None):
+    """
+    Collect the LDAP operations (of this thread, for the database alias
+    ``using`` or all) made within.
+    """
+    captured = CapturedOperations(using)
+    ldap_operation.connect(captured, weak=False)
+    try:
+        yield captured
+    finally:
+        ldap_operation.disconnect(captured)
+
+
+class LdapQueriesMixin(object):
+    """
+    A TestCase mixin with ``assertLdapQueries()``, like
+    ``assertNumQueries()`` but for LDAP operations.
+    """
+
+    @contextlib.contextmanager
+    def assertLdapQueries(self, num, using=None):
+        with capture_ldap_operations(using) as captured:
+            yield captured
+        self.assertEqual(
+            len(captured), num,
+            '{0} LDAP operations, {1} expected:\n{2}'.format(
+                len(captured), num, '\n'.join([
+                    '{0}. {1} {2}'.format(
+                        i + 1, op['operation'],
+                        op.get('filterstr', None) or op.get('dn', ''))
+                    for i, op in enumerate(captured)
+                ])))
+
+
+################################################################
+
+METRICS = [
+    ('authldap_utils_ldap_operations_total', 'counter',
+     'Number of LDAP operations.', 0),
+    ('authldap_utils_ldap_operation_seconds_total', 'counter',
+     'Time spent in LDAP operations.', 1),
+    ('authldap_utils_ldap_results_total', 'counter',
+     'Number of entries returned (searches) or changed.', 2),
+]
+
+HASHING_METRICS = [
+    ('authldap_utils_password_hashing_pending', 'gauge',
+     'Number of passwords waiting or being hashed.', 'pending'),
+    ('authldap_utils_password_hashing_total', 'counter',
+     'Number of passwords hashed.', 'count'),
+    ('authldap_utils_password_hashing_seconds_total', 'counter',
+     'Time spent hashing passwords, waiting included.', 'seconds'),
+]
+
+
+def get_prometheus_text():
+    """
+    The counters, in the Prometheus text exposition format.
+    """
+    stats = sorted(get_stats().items())
+    lines = []
+    for name, kind, help_text, index in METRICS:
+        lines.append('# HELP {0} {1}'.format(name, help_text))
+        lines.append('# TYPE {0} {1}'.format(name, kind))
+        for (operation, model, using), values in stats:
+            lines.append(
+                '{0}{{operation="{1}",model="{2}",database="{3}"}} {4}'.
+                format(name, operation, model, using, values[index]))
+    hashing_stats = get_hashing_stats()
+    for name, kind, help_text, key in HASHING_METRICS:
+        lines.append('# HELP {0} {1}'.format(name, help_text))
+        lines.append('# TYPE {0} {1}'.format(name, kind))
+        lines.append('{0} {1}'.format(name, hashing_stats[key]))
+    return '\n'.join(lines) + '\n'
+
+
+################################################################
@@ -0,0 +1,128 @@
+"""
+Email utilities for the authldap_utils application.
+"""
+################################################################
+from __future__ import print_function, unicode_literals
+
+import threading
+from string import Formatter
+
+from django.core.mail import get_connection
+
+from . import conf
+from .utils import chunked
+
+################################################################
+
+# LdapUser attributes that may be used in a mail merge template.
+MERGE_FIELDS = [
+    'username',
+    'first_name',
+    'last_name',
+    'full_name',
+    'email',
+]
+
+################################################################
+
+
+class MergeTemplate(object):
+    """
+    A ``str.format()`` style template (e.g., ``Dear {first_name},``)
+    which is parsed once, and then rendered for many recipients.
+
+    Only plain field names in ``fields`` are allowed; attribute and
+    index lookups (``{user.password}``, ``{0}``) are refused.  Invalid
+    conversions and format specs (``{username!x}``) raise ValueError
+    here too, rather than when rendering.
+    """
+
+    def __init__(self, template, fields=None):
+        if fields is None:
+            fields = MERGE_FIELDS
+        self.template = template
+        self.fields = set()
+        self.parts = []
+        formatter = Formatter()
+        for literal, name, format_spec, conversion in formatter.parse(
+                template):
+            if name is not None and name not in fields:
+                raise ValueError('Unknown merge field: {{{0}}}'.format(name))
+            if name is not None:
+                self.fields.add(name)
+            self.parts.append((literal, name, format_spec, conversion))
+        self.formatter = formatter
+        # conversions and format specs are only applied when rendering:
+        # try them with placeholder (text) values.
+        try:
+            self.render(dict([(name, name) for name in self.fields]))
+        except (TypeError, ValueError) as e:
+            raise ValueError('Invalid merge template: {0}'.format(e))
+
+    def render(self, context):
+        """
+        Render the template with ``context``, a dictionary.
+        """
+        bits = []
+        for literal, name, format_spec, conversion in self.parts:
+            bits.append(literal)
+            if name is None:
+                continue
+            value = self.formatter.convert_field(context[name], conversion)
+            bits.append(self.formatter.format_field(value, format_spec))
+        return ''.join(bits)
+
+
+def get_merge_context(obj, fields=None):
+    """
+    Return the mail merge context for an object (e.g., an LdapUser).
+    """
+    if fields is None:
+        fields = MERGE_FIELDS
+    return dict([(name, getattr(obj, name, '') or '') for name in fields])
+
+
+################################################################
+
+
+def send_mass_messages(messages,
+                       chunk_size=None,
+                       connection=None,
+                       fail_silently=False):
+    """
+    Send the EmailMessages from the iterable ``messages``, in chunks of
+    ``chunk_size``, over a single connection.
+
+    ``messages`` may be a generator: only one chunk of messages is
+    ever held in memory.
+    Return the number of messages sent.
+    """
+    if chunk_size is None:
+        chunk_size = conf.get('email_chunk_size')
+    if connection is None:
+        connection = get_connection(fail_silently=fail_silently)
+    count = 0
+    opened = connection.open()
+    try:
+        for chunk in chunked(messages, chunk_size):
+            count += connection.send_messages(chunk) or 0
+    finally:
+        if opened:
+            connection.close()
+    return count
+
+
+def send_mass_messages_in_background(messages, **kwargs):
+    """
+    Send the EmailMessages from ``messages`` with ``send_mass_messages()``
+    in a separate thread, so the request does not wait on the mail
+    server.  The messages should already be rendered.
+    """
+    thread = threading.Thread(
+        target=send_mass_messages, args=(list(messages), ), kwargs=kwargs)
+    thread.daemon = True
+    thread.start()
+    return thread
+
+
+################################################################
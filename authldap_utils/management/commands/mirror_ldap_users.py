@@ -0,0 +1,43 @@
+"""
+Mirror the LDAP users changed since the last run to Django users.
+"""
+################################################################
+from __future__ import print_function, unicode_literals
+
+from django.core.management.base import BaseCommand
+
+from ...handlers import sync_django_user
+from ...models import LdapUser
+from ...sync import ChangeFeed
+
+################################################################
+
+
+class Command(BaseCommand):
+    help = 'Mirror the LDAP users changed since the last run to Django users.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help='Mirror every LDAP user, not only the changed ones.')
+        parser.add_argument(
+            '--checkpoint',
+            default='mirror_ldap_users',
+            help='The name of the change feed checkpoint.')
+
+    def handle(self, *args, **options):
+        feed = ChangeFeed(options['checkpoint'], LdapUser)
+        if options['full']:
+            feed.reset()
+        n = 0
+        for ldap_user in feed.changes():
+            sync_django_user(ldap_user)
+            n += 1
+        feed.commit()
+        if options['verbosity'] > 0:
+            self.stdout.write('Mirrored {0} user{1} ({2}).'.format(
+                n, '' if n == 1 else 's', feed.mode))
+
+
+################################################################
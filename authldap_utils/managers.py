@@ -6,6 +6,8 @@ from __future__ import print_function, unicode_literals
 
 from django.db import models
 
+from .querysets import LdapModelQuerySet
+
 # from .querysets import Authldap_UtilsModelQuerySet
 
 #######################################################################
@@ -29,7 +31,7 @@ class CustomQuerySetManager(models.Manager):
         """
         Return the custom QuerySet
         """
-        queryset = self.queryset_class(self.model)
+        queryset = self.queryset_class(self.model, using=self._db)
         if self.always_select_related is not None:
             queryset = queryset.select_related(*self.always_select_related)
         return queryset
@@ -37,7 +39,11 @@ class CustomQuerySetManager(models.Manager):
     def __getattr__(self, name):
         """
         If a method/attribute etc. cannot be located, proxy to the QuerySet.
+        (Not private ones: copying a manager looks for ``__getstate__``,
+        which would evaluate the QuerySet.)
         """
+        if name.startswith('_'):
+            raise AttributeError(name)
         return getattr(self.get_queryset(), name)
 
 
@@ -50,3 +56,30 @@ class CustomQuerySetManager(models.Manager):
 #     queryset_class = Authldap_UtilsModelQuerySet
 
 #######################################################################
+
+
+class LdapModelManager(CustomQuerySetManager):
+    queryset_class = LdapModelQuerySet
+    always_defer = None
+
+    # use always_defer for (large) attributes which are seldom needed,
+    #   e.g., photos; these are fetched when first accessed.
+
+    def get_queryset(self):
+        """
+        Return the custom QuerySet
+        """
+        queryset = super(LdapModelManager, self).get_queryset()
+        if self.always_defer is not None:
+            queryset = queryset.defer(*self.always_defer)
+        return queryset
+
+
+class LdapUserManager(LdapModelManager):
+
+    @property
+    def always_defer(self):
+        # the Samba fields are loaded together, when first needed.
+        return ['photo'] + list(self.model.samba_fields)
+
+#######################################################################
@@ -10,26 +10,321 @@
 ################################################################
 from __future__ import print_function, unicode_literals
 
+import copy
+import logging
 import time
 
+import ldap
+import ldap.filter
+import six
 from django.conf import settings
-from django.db import models
-from django.utils.encoding import python_2_unicode_compatible
+from django.db import connections, router
+from django.db.models.base import DEFERRED, ModelState
+from django.db.models.signals import post_init, pre_init
 
 import ldapdb.models
 from ldapdb.models.fields import CharField, ImageField, IntegerField, ListField
 
 from . import conf
+from .executors import hash_password
+from .fields import OperationalField
+from .instrumentation import timed, using_model
+from .managers import LdapModelManager, LdapUserManager
 from .utils import (generate_random_password, is_ssha_password_usable,
-                    make_lm_password, make_nt_password, make_ssha_password)
+                    make_ssha_password)
 
 LDAP_DC_DN = getattr(settings, 'LDAP_DC_DN', 'dc=example,dc=com')
 
+# The Samba fields are part of the model (so this is fixed at startup).
+ENABLE_SAMBA = conf.get('enable_samba')
+
+logger = logging.getLogger('authldap_utils')
+
+################################################################
+
+
+class ConcurrentModificationError(Exception):
+    """
+    The entry was changed (by someone else) since it was loaded.
+    """
+
+
+class LdapModel(ldapdb.models.Model):
+    """
+    An LDAP entry which remembers the values it was loaded with, so
+    saving only sends the changed attributes, in a single modify
+    request, without reading the entry again first.
+
+    Setting ``expected_version`` (see ``get_version()``) makes the
+    save conditional: it fails with ``ConcurrentModificationError``
+    if the entry changed in the meantime.
+    """
+    objects = LdapModelManager()
+
+    # operational fields identifying the state of an entry, by preference.
+    version_fields = ['csn', 'modified']
+    expected_version = None
+
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """
+        Make the instance straight from the loaded values, without
+        ``Model.__init__()`` (unless there are pre_init/post_init
+        receivers): no field defaults are evaluated, as the fields not
+        loaded are deferred.
+        """
+        if pre_init.has_listeners(cls) or post_init.has_listeners(cls):
+            instance = super(LdapModel, cls).from_db(db, field_names, values)
+            instance.remember_loaded_values(field_names)
+            return instance
+
+        instance = cls.__new__(cls)
+        instance._state = ModelState()
+        instance._state.adding = False
+        instance._state.db = db
+        loaded = {}
+        for name, value in zip(field_names, values):
+            if value is not DEFERRED:
+                instance.__dict__[name] = value
+                # a copy, so changes to lists are seen.
+                loaded[name] = list(value) if isinstance(value,
+                                                         list) else value
+        instance._loaded_values = loaded
+        instance.saved_pk = instance.pk
+        return instance
+
+    @classmethod
+    def from_ldap(cls, dn, attrs, using=None, fields=None, attrlist=None):
+        """
+        Make an instance from a search result ``(dn, attrs)``.  Only the
+        named ``fields`` (by default, those of the ``attrlist`` of the
+        search: None for all user attributes) are converted; the others
+        are deferred.  Requested attributes missing from ``attrs`` are
+        empty, as in the directory.
+        """
+        if using is None:
+            using = router.db_for_read(cls)
+        connection = connections[using]
+        if attrlist is not None:
+            attrlist = set(name.lower() for name in attrlist)
+        field_names = ['dn']
+        values = [dn]
+        for f in cls._meta.concrete_fields:
+            if f.attname == 'dn' or not f.db_column:
+                continue
+            if fields is not None:
+                wanted = f.name in fields
+            elif attrlist is None:
+                wanted = not isinstance(f, OperationalField)
+            else:
+                # ('*' is all user attributes, '+' all operational ones.)
+                every = '+' if isinstance(f, OperationalField) else '*'
+                wanted = every in attrlist or f.db_column.lower() in attrlist
+            if not wanted:
+                continue
+            field_names.append(f.attname)
+            values.append(
+                f.from_ldap(attrs.get(f.db_column, []), connection=connection))
+        return cls.from_db(using, field_names, values)
+
+    def refresh_from_db(self, using=None, fields=None):
+        super(LdapModel, self).refresh_from_db(using=using, fields=fields)
+        self.remember_loaded_values(fields)
+
+    def remember_loaded_values(self, fields=None):
+        """
+        Record the current values (of ``fields``, or all loaded fields)
+        as those in the directory.
+        """
+        loaded = getattr(self, '_loaded_values', {})
+        deferred_fields = self.get_deferred_fields()
+        for f in self._meta.concrete_fields:
+            if f.attname in deferred_fields:
+                continue
+            if fields is None or f.attname in fields:
+                # a copy, so changes to lists are seen.
+                loaded[f.attname] = copy.copy(getattr(self, f.attname))
+        self._loaded_values = loaded
+
+    def has_changed(self, name):
+        """
+        Return True if the field may differ from the directory (i.e.,
+        it was set, and not loaded with this value).
+        """
+        loaded = getattr(self, '_loaded_values', None)
+        if loaded is None or not self.dn:
+            return True
+        if name in self.get_deferred_fields():
+            return False
+        return name not in loaded or loaded[name] != getattr(self, name)
+
+    def get_changed_fields(self):
+        """
+        Return the names of the fields which may have changed.
+        """
+        return [
+            f.attname for f in self._meta.concrete_fields
+            if not f.primary_key and self.has_changed(f.attname)
+        ]
+
+    def get_version(self):
+        """
+        An opaque token for the loaded state of the entry, e.g.,
+        ``entryCSN=<value>`` (or ``modifyTimestamp=<value>`` without
+        CSNs).  Empty for new entries.
+        """
+        if not self.dn:
+            return ''
+        deferred_fields = self.get_deferred_fields()
+        fields = dict([(f.name, f) for f in self._meta.concrete_fields])
+        for name in self.version_fields:
+            f = fields.get(name, None)
+            if f is not None and f.attname not in deferred_fields:
+                value = getattr(self, f.attname)
+                if value:
+                    return '{0}={1}'.format(f.db_column, value)
+        return ''
+
+    def get_current_version(self):
+        """
+        The version of the entry now in the (provider) directory.
+        """
+        names = [
+            f.name for f in self._meta.concrete_fields
+            if f.name in self.version_fields
+        ]
+        using = router.db_for_write(self.__class__, instance=self)
+        current = self.__class__._base_manager.using(using).filter(
+            pk=self.saved_pk).only('dn', *names).first()
+        if current is None:
+            return ''
+        return current.get_version()
+
+    def check_version(self, connection, dn):
+        """
+        Compare (before a modify) the entry with the expected version.
+        """
+        attr, value = self.expected_version.split('=', 1)
+        ldap_object = connection._cursor().connection
+        with timed('compare', connection.alias, model=self.__class__, dn=dn):
+            matched = ldap_object.compare_s(dn, attr, value.encode('utf-8'))
+        if not matched:
+            raise ConcurrentModificationError(dn)
+
+    def get_server_controls(self, connection, dn):
+        """
+        The controls for a conditional modify, or None.
+        """
+        if not self.expected_version:
+            return None
+        if conf.get('concurrency_check') == 'compare':
+            self.check_version(connection, dn)
+            return None
+        from ldap.controls.libldap import AssertionControl
+        attr, value = self.expected_version.split('=', 1)
+        return [AssertionControl(
+            criticality=True,
+            filterstr='({0}={1})'.format(
+                attr, ldap.filter.escape_filter_chars(value)))]
+
+    def get_modlist(self, fields, connection):
+        """
+        The modify operations for the changed ``fields``.
+        """
+        loaded = self._loaded_values
+        modlist = []
+        for field in fields:
+            new_value = field.get_db_prep_save(
+                getattr(self, field.attname), connection=connection)
+            if field.attname in loaded:
+                old_value = field.get_db_prep_save(
+                    loaded[field.attname], connection=connection)
+                if old_value == new_value:
+                    continue
+            # replacing with no values deletes the attribute, if present.
+            modlist.append((ldap.MOD_REPLACE, field.db_column, new_value))
+        return modlist
+
+    def delete(self, using=None):
+        with using_model(self.__class__):
+            return super(LdapModel, self).delete(using=using)
+
+    def _save_table(self,
+                    raw=False,
+                    cls=None,
+                    force_insert=None,
+                    force_update=None,
+                    using=None,
+                    update_fields=None):
+        with using_model(self.__class__):
+            return self._save_entry(raw, cls, force_insert, force_update,
+                                    using, update_fields)
+
+    def _save_entry(self, raw, cls, force_insert, force_update, using,
+                    update_fields):
+        if force_insert or not self.dn or \
+                getattr(self, '_loaded_values', None) is None:
+            # new entries, and those not loaded from the directory.
+            updated = super(LdapModel, self)._save_table(
+                raw, cls, force_insert, force_update, using, update_fields)
+            self.remember_loaded_values()
+            return updated
+
+        connection = connections[using]
+        if update_fields:
+            fields = [self._meta.get_field(name) for name in update_fields]
+        else:
+            fields = [
+                self._meta.get_field(name)
+                for name in self.get_changed_fields()
+            ]
+        modlist = self.get_modlist(fields, connection)
+
+        old_dn = self.dn
+        new_dn = self.build_dn()
+        serverctrls = self.get_server_controls(connection, old_dn)
+        try:
+            if serverctrls is None:
+                if modlist:
+                    connection.modify_s(old_dn, modlist)
+                if new_dn != old_dn:
+                    connection.rename_s(old_dn, self.build_rdn())
+            else:
+                ldap_object = connection._cursor().connection
+                if modlist:
+                    with timed('modify', connection.alias, dn=old_dn):
+                        ldap_object.modify_ext_s(old_dn, modlist,
+                                                 serverctrls=serverctrls)
+                    # the modify changed the version.
+                    serverctrls = None
+                if new_dn != old_dn:
+                    with timed('rename', connection.alias, dn=old_dn):
+                        ldap_object.rename_s(old_dn, self.build_rdn(),
+                                             serverctrls=serverctrls)
+        except ldap.ASSERTION_FAILED:
+            raise ConcurrentModificationError(old_dn)
+        if modlist:
+            logger.debug('Modified LDAP entry %s: %s', old_dn,
+                         ', '.join([m[1] for m in modlist]))
+        if new_dn != old_dn:
+            logger.debug('Renamed LDAP entry %s to %s', old_dn, new_dn)
+        self.expected_version = None
+
+        self.dn = new_dn
+        self.saved_pk = self.pk
+        self.remember_loaded_values([f.attname for f in fields])
+        # (an update, even if nothing changed.)
+        return True
+
+
 ################################################################
 
 
-@python_2_unicode_compatible
-class LdapUser(ldapdb.models.Model):
+@six.python_2_unicode_compatible
+class LdapUser(LdapModel):
     """
     Class for representing an LDAP user entry.
 
@@ -41,19 +336,11 @@ class LdapUser(ldapdb.models.Model):
     """
     # LDAP meta-data
     base_dn = "ou=People," + LDAP_DC_DN
-    if conf.get('enable_samba'):
-        object_classes = [
-            'posixAccount',
-            'shadowAccount',
-            'inetOrgPerson',
-            'sambaSamAccount',
-        ]
-    else:
-        object_classes = [
-            'posixAccount',
-            'shadowAccount',
-            'inetOrgPerson',
-        ]
+    object_classes = [
+        'posixAccount',
+        'shadowAccount',
+        'inetOrgPerson',
+    ] + (['sambaSamAccount'] if ENABLE_SAMBA else [])
 
     # inetOrgPerson
     first_name = CharField(db_column='givenName')
@@ -85,15 +372,19 @@ class LdapUser(ldapdb.models.Model):
         help_text='Leave blank to auto populate this field')
     login_shell = CharField(db_column='loginShell', default='/bin/bash')
     username = CharField(db_column='uid', primary_key=True)
-    password = CharField(
-        db_column='userPassword', default=generate_random_password)
+    # (a random password is set when a new entry is saved without one.)
+    password = CharField(db_column='userPassword')
+
+    # operational
+    modified = OperationalField(db_column='modifyTimestamp')
+    csn = OperationalField(db_column='entryCSN')
 
     # shadowAccount
     #shadowLastChange
     #shadowMax default -1
 
     # sambaSamAccount
-    if conf.get('enable_samba'):
+    if ENABLE_SAMBA:
         domain = CharField(
             db_column='sambaDomainName',
             verbose_name='samba domain',
@@ -150,20 +441,51 @@ class LdapUser(ldapdb.models.Model):
             db_column='sambaLogonHours',
             default='FFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFF')
 
+        # deferred by default, and loaded together when first needed.
+        samba_fields = [
+            'domain', 'acct_flags', 'lm_password', 'nt_password', 'sid',
+            'pwd_last_set', 'pwd_can_change', 'pwd_must_change',
+            'logon_time', 'logoff_time', 'kickoff_time',
+            'bad_password_count', 'bad_password_time', 'logon_hours'
+        ]
+    else:
+        samba_fields = []
+
+    objects = LdapUserManager()
+
     class Meta:
         verbose_name = 'User'
 
     def __str__(self):
         return self.full_name
 
+    @classmethod
+    def get_password_fields(cls):
+        """
+        The fields needed to check, set and save a password; use these
+        with ``.only()`` to avoid fetching the entire entry.
+        """
+        fields = ['username', 'uid', 'password']
+        if ENABLE_SAMBA:
+            fields += [
+                'domain', 'sid', 'lm_password', 'nt_password', 'pwd_last_set'
+            ]
+        return fields
+
     def set_password(self, password):
         """
         This function changes the given plaintext password to {SSHA}
         Note that this function **does not** save the password.
         """
-        self.password = make_ssha_password(password)
-        self.lm_password = make_lm_password(password)
-        self.nt_password = make_nt_password(password)
+        self.set_password_hashes(hash_password(password))
+
+    def set_password_hashes(self, hashes):
+        """
+        Set the password from its ``utils.make_password_hashes()``,
+        e.g., computed in another thread.
+        """
+        for name, value in hashes.items():
+            setattr(self, name, value)
         self.pwd_last_set = int(time.time())
 
     def check_password(self, password):
@@ -180,22 +502,38 @@ class LdapUser(ldapdb.models.Model):
         """
         return is_ssha_password_usable(self.password)
 
+    def refresh_from_db(self, using=None, fields=None):
+        """
+        Load the deferred Samba fields together, when one is needed.
+        """
+        if fields is not None and set(fields) & set(self.samba_fields):
+            deferred_fields = self.get_deferred_fields()
+            fields = list(fields) + [
+                name for name in self.samba_fields
+                if name in deferred_fields and name not in fields
+            ]
+        super(LdapUser, self).refresh_from_db(using=using, fields=fields)
+
     def save(self, *args, **kwargs):
         """
-        Override sid
+        Override sid: this is recomputed (with a domain lookup) only when
+        the uid or Samba domain changed.
+        New entries without a password get a random one.
         """
-        if conf.get('enable_samba'):
+        if self._state.adding and not self.password:
+            self.password = generate_random_password()
+        if ENABLE_SAMBA and \
+                (self.has_changed('uid') or self.has_changed('domain')):
             samba_domain = LdapSambaDomain.objects.get(domain_name=self.domain)
             self.sid = samba_domain.sid + '-' + str(2 * int(self.uid) + 1000)
-        # may need to modify fields, if present...
         return super(LdapUser, self).save(*args, **kwargs)
 
 
 ################################################################
 
 
-@python_2_unicode_compatible
-class LdapGroup(ldapdb.models.Model):
+@six.python_2_unicode_compatible
+class LdapGroup(LdapModel):
     """
     Class for representing an LDAP group entry.
 
@@ -218,6 +556,10 @@ class LdapGroup(ldapdb.models.Model):
     name = CharField(db_column='cn', max_length=200, primary_key=True)
     usernames = ListField(db_column='memberUid')
 
+    # operational
+    modified = OperationalField(db_column='modifyTimestamp')
+    csn = OperationalField(db_column='entryCSN')
+
     class Meta:
         verbose_name = 'group'
 
@@ -228,8 +570,8 @@ class LdapGroup(ldapdb.models.Model):
 ################################################################
 
 
-@python_2_unicode_compatible
-class LdapSambaDomain(ldapdb.models.Model):
+@six.python_2_unicode_compatible
+class LdapSambaDomain(LdapModel):
     """
     Class for representing a Samba domain.
 
@@ -0,0 +1,42 @@
+"""
+A django-debug-toolbar panel of the LDAP operations of a request::
+
+    DEBUG_TOOLBAR_PANELS += ['authldap_utils.panels.LdapPanel']
+"""
+################################################################
+from __future__ import print_function, unicode_literals
+
+from debug_toolbar.panels import Panel
+
+from .debug import LdapOperationCollector
+
+################################################################
+
+
+class LdapPanel(Panel):
+    """
+    The LDAP operations of the request (see ``authldap_utils.debug``).
+    """
+    title = 'LDAP'
+    template = 'authldap_utils/ldap_debug.html'
+
+    @property
+    def nav_subtitle(self):
+        stats = self.get_stats()
+        if not stats:
+            return ''
+        return '{0} operations in {1:.1f}ms'.format(
+            stats['count'], stats['duration_ms'])
+
+    def enable_instrumentation(self):
+        self.collector = LdapOperationCollector()
+        self.collector.start()
+
+    def disable_instrumentation(self):
+        self.collector.stop()
+
+    def generate_stats(self, request, response):
+        self.record_stats(self.collector.get_stats())
+
+
+################################################################
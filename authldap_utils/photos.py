@@ -0,0 +1,173 @@
+"""
+User photo thumbnails for the authldap_utils application.
+
+Photos (``jpegPhoto``) can be several hundred KB, so they are only
+fetched from the directory when the cached details for a user are
+missing or stale.  Thumbnails are cached by DN, content hash and size;
+resizing needs Pillow, without it (or when Pillow cannot read the
+photo) the original photo is served.
+"""
+################################################################
+from __future__ import print_function, unicode_literals
+
+import calendar
+import hashlib
+import io
+import logging
+import time
+
+from django.utils.encoding import force_bytes
+
+from . import conf
+from .utils import get_cache
+
+logger = logging.getLogger('authldap_utils')
+
+################################################################
+
+PHOTO_CACHE_KEY = 'authldap_utils.photo.{0}'
+THUMBNAIL_CACHE_KEY = 'authldap_utils.thumbnail.{0}.{1}.{2}'
+
+
+def get_photo_cache_key(username):
+    digest = hashlib.md5(force_bytes(username)).hexdigest()
+    return PHOTO_CACHE_KEY.format(digest)
+
+
+def get_thumbnail_cache_key(dn, content_hash, size):
+    digest = hashlib.md5(force_bytes(dn)).hexdigest()
+    return THUMBNAIL_CACHE_KEY.format(digest, content_hash, size)
+
+
+def invalidate_photo(username):
+    """
+    Forget the cached photo details for the user (the thumbnails are
+    keyed by content, so they need not be removed).
+    """
+    get_cache().delete(get_photo_cache_key(username))
+
+
+################################################################
+
+
+def get_thumbnail_size(requested=None):
+    """
+    The smallest of the ``photo_thumbnail_sizes`` at least as large as
+    ``requested`` (the largest of them, if none is); the default size
+    is the first.  This bounds the number of cached variants.
+    """
+    sizes = sorted(conf.get('photo_thumbnail_sizes'))
+    if requested is None:
+        return conf.get('photo_thumbnail_sizes')[0]
+    for size in sizes:
+        if size >= requested:
+            return size
+    return sizes[-1]
+
+
+def make_thumbnail(data, size):
+    """
+    Return (content_type, data) for a JPEG thumbnail of the photo,
+    no larger than ``size`` pixels in either dimension.
+    """
+    try:
+        from PIL import Image
+    except ImportError:
+        return 'image/jpeg', data
+
+    try:
+        image = Image.open(io.BytesIO(data))
+        if image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        image.thumbnail((size, size))
+        output = io.BytesIO()
+        image.save(output, format='JPEG', quality=85)
+    except (IOError, OSError, ValueError) as e:
+        # a corrupt (or unsupported) photo is served as it is.
+        logger.warning('Cannot make a thumbnail of a photo: %s', e)
+        return 'image/jpeg', data
+    return 'image/jpeg', output.getvalue()
+
+
+def parse_timestamp(value):
+    """
+    The POSIX time of a generalized time (e.g., a ``modifyTimestamp``
+    of ``20240131120000Z``), or None.
+    """
+    try:
+        return calendar.timegm(time.strptime(value[:14], '%Y%m%d%H%M%S'))
+    except (TypeError, ValueError):
+        return None
+
+
+################################################################
+
+
+def get_photo_details(username):
+    """
+    Return the details of the user's photo, a dictionary with the user
+    ``dn``, the photo content ``hash`` and the ``modified`` time of the
+    entry (its ``modifyTimestamp``, None if unknown); or None when there
+    is no user or photo.
+
+    Details are cached, so the photo is only fetched when they expire
+    or the user is saved.  On a cache miss, the photo data is included
+    (as ``data``), so it need not be fetched again.
+    """
+    from .models import LdapUser  # handlers import this module early
+
+    cache = get_cache()
+    key = get_photo_cache_key(username)
+    details = cache.get(key)
+    if details is not None:
+        return details
+
+    rows = LdapUser.objects.filter(username=username).values_list(
+        'dn', 'photo', 'modified')
+    for dn, data, modified in rows:
+        break
+    else:
+        return None
+    if not data:
+        return None
+
+    details = {
+        'dn': dn,
+        'hash': hashlib.sha1(force_bytes(data)).hexdigest(),
+        'modified': parse_timestamp(modified),
+    }
+    cache.set(key, details, conf.get('photo_cache_timeout'))
+    return dict(details, data=data)
+
+
+def get_thumbnail(username, size, details=None):
+    """
+    Return (details, (content_type, data)) for the thumbnail of the
+    user's photo, or (None, None).  The photo is only fetched when
+    the thumbnail is not cached.
+    """
+    if details is None:
+        details = get_photo_details(username)
+    if details is None:
+        return None, None
+
+    cache = get_cache()
+    key = get_thumbnail_cache_key(details['dn'], details['hash'], size)
+    thumbnail = cache.get(key)
+    if thumbnail is not None:
+        return details, thumbnail
+
+    if 'data' not in details:
+        # fetch the photo, which may have changed since it was cached.
+        invalidate_photo(username)
+        details = get_photo_details(username)
+        if details is None:
+            return None, None
+        return get_thumbnail(username, size, details)
+
+    thumbnail = make_thumbnail(force_bytes(details['data']), size)
+    cache.set(key, thumbnail, conf.get('photo_cache_timeout'))
+    return details, thumbnail
+
+
+################################################################
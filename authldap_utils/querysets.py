@@ -5,9 +5,15 @@ Models for the authldap_utils application.
 from __future__ import print_function, unicode_literals
 
 import operator
+from collections import namedtuple
 
 from django.core.exceptions import ImproperlyConfigured
-from django.db import models
+from django.db import connections, models
+from django.db.models.query import BaseIterable
+from django.db.models.sql.constants import GET_ITERATOR_CHUNK_SIZE
+
+from . import conf
+from .utils import chunked
 
 #######################################################################
 #######################################################################
@@ -79,3 +85,96 @@ class BaseCustomQuerySet(models.query.QuerySet):
 #     """
 
 #######################################################################
+
+# namedtuple classes, by (model, field names).
+_record_classes = {}
+
+
+def get_record_class(model, field_names):
+    """
+    Return the (cached) namedtuple class for records of the model with
+    the given fields.
+    """
+    key = (model, tuple(field_names))
+    record_class = _record_classes.get(key, None)
+    if record_class is None:
+        record_class = namedtuple(str('{0}Record'.format(model.__name__)),
+                                  field_names)
+        _record_classes[key] = record_class
+    return record_class
+
+
+class RecordIterable(BaseIterable):
+    """
+    Yield a read-only namedtuple for each search result, made directly
+    from the converted attribute values, rather than a model instance.
+    """
+
+    def __iter__(self):
+        queryset = self.queryset
+        compiler = queryset.query.get_compiler(queryset.db)
+        compiler.setup_query()
+        field_names = [e[0].target.attname for e in compiler.select]
+        make = get_record_class(queryset.model, field_names)._make
+        for row in compiler.results_iter(chunked_fetch=self.chunked_fetch,
+                                         chunk_size=self.chunk_size):
+            yield make(row)
+
+
+#######################################################################
+
+
+class LdapModelQuerySet(models.query.QuerySet):
+    """
+    QuerySet for LDAP models.
+    """
+
+    def as_records(self):
+        """
+        Return a QuerySet yielding namedtuples (with a field for each
+        attribute which is not deferred) rather than model instances.
+        For reading many entries, e.g., exports and audits.
+        """
+        clone = self._clone()
+        clone._iterable_class = RecordIterable
+        return clone
+
+    def only(self, *fields):
+        """
+        Like ``QuerySet.only()``, but the DN (part of every search
+        result) is always loaded: instances are saved by their DN.
+        """
+        if 'dn' not in fields:
+            fields += ('dn', )
+        return super(LdapModelQuerySet, self).only(*fields)
+
+    def iterator(self, chunk_size=None):
+        """
+        Yield the results as they arrive, one page (of ``chunk_size``
+        entries) at a time, without caching them in the QuerySet.
+        The default ``chunk_size`` is the connection's page size.
+        Results are streamed unless the QuerySet is ordered (with
+        ``.order_by()``), as sorting needs all of them.
+        """
+        if chunk_size is None:
+            chunk_size = getattr(connections[self.db], 'page_size',
+                                 GET_ITERATOR_CHUNK_SIZE)
+        return super(LdapModelQuerySet, self).iterator(chunk_size=chunk_size)
+
+    def iter_chunks(self, values, field_name='pk', chunk_size=None):
+        """
+        Yield the objects with ``field_name`` in ``values``.
+
+        The directory is searched one chunk of values at a time (each
+        chunk is a single OR filter), so a long list of values does
+        not produce a huge filter, and the matches are never all held
+        in memory at once.
+        """
+        if chunk_size is None:
+            chunk_size = conf.get('ldap_chunk_size')
+        lookup = '{0}__in'.format(field_name)
+        for chunk in chunked(values, chunk_size):
+            for obj in self.filter(**{lookup: chunk}):
+                yield obj
+
+#######################################################################
@@ -0,0 +1,118 @@
+"""
+Database router for the authldap_utils application.
+"""
+################################################################
+from __future__ import print_function, unicode_literals
+
+import itertools
+import threading
+
+from ldapdb.router import Router as BaseRouter
+
+from . import conf
+from .backends.ldap.base import get_latency
+
+################################################################
+
+# Database engines for LDAP servers.
+LDAP_ENGINES = [
+    'ldapdb.backends.ldap',
+    'authldap_utils.backends.ldap',
+    'authldap_utils.backends.memory',
+]
+
+# Per thread (i.e., per request) read-your-writes state.
+_local = threading.local()
+
+# The LDAP operations (see ``instrumentation.ldap_operation``) which
+# pin the thread to the provider.
+WRITE_OPERATIONS = ['add', 'modify', 'delete', 'rename']
+
+
+def pin_to_provider():
+    """
+    Send all further reads (in this thread) to the provider.
+    """
+    _local.pinned = True
+
+
+def unpin(**kwargs):
+    """
+    Allow reads from replicas again; connected to ``request_started``
+    and ``request_finished``.
+    """
+    _local.pinned = False
+
+
+def pin_on_write(sender, operation, **kwargs):
+    """
+    Pin the thread to the provider when it writes to the directory;
+    connected to ``ldap_operation``.
+    """
+    if operation in WRITE_OPERATIONS:
+        pin_to_provider()
+
+
+def is_pinned():
+    return getattr(_local, 'pinned', False)
+
+
+################################################################
+
+
+class Router(BaseRouter):
+    """
+    The ``ldapdb`` router, which also recognizes the
+    ``authldap_utils.backends.ldap`` (pooled) and
+    ``authldap_utils.backends.memory`` backends.
+    """
+
+    def __init__(self):
+        from django.conf import settings
+        self.ldap_alias = None
+        replicas = conf.get('ldap_replicas')
+        for alias, settings_dict in settings.DATABASES.items():
+            if settings_dict['ENGINE'] in LDAP_ENGINES and \
+                    alias not in replicas:
+                self.ldap_alias = alias
+                break
+
+
+################################################################
+
+
+class ReplicaRouter(Router):
+    """
+    Send reads of LDAP models to the consumer replicas (the
+    ``ldap_replicas`` database aliases), and writes to the provider.
+
+    Replicas are chosen in turn ('round-robin'), or by the lowest
+    average search latency ('least-latency'; measured by the
+    ``authldap_utils.backends.ldap`` backend).
+    Once a thread (request) has written to the directory, its reads
+    also go to the provider, for the rest of the request (see
+    ``pin_on_write()``; writes are seen by the ``ldap_operation``
+    signal, sent by the ``authldap_utils`` backends).
+    """
+
+    def __init__(self):
+        super(ReplicaRouter, self).__init__()
+        self.replicas = list(conf.get('ldap_replicas'))
+        self.selection = conf.get('ldap_replica_selection')
+        self.counter = itertools.count()
+
+    def choose_replica(self):
+        if self.selection == 'least-latency':
+            # Replicas without any measurement are tried first.
+            return min(self.replicas,
+                       key=lambda alias: get_latency(alias) or 0)
+        return self.replicas[next(self.counter) % len(self.replicas)]
+
+    def db_for_read(self, model, **hints):
+        alias = super(ReplicaRouter, self).db_for_read(model, **hints)
+        if alias is None or not self.replicas or is_pinned():
+            return alias
+        return self.choose_replica()
+
+
+################################################################
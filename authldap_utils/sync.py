@@ -0,0 +1,189 @@
+"""
+Incremental change feeds for the LDAP models.
+
+A feed yields the entries added or changed since its checkpoint, which
+is kept (by name) in the default database::
+
+    feed = ChangeFeed('mirror-users', LdapUser)
+    for user in feed.changes():
+        ...
+    feed.commit()
+
+Servers offering RFC 4533 content synchronization (syncrepl) are
+followed with a cookie; otherwise entries are found with a
+``modifyTimestamp>=`` filter.  Entries on the checkpoint boundary may
+be yielded again, and deleted entries are not reported.
+"""
+################################################################
+from __future__ import print_function, unicode_literals
+
+import logging
+
+import ldap
+import ldap.dn
+from django.db import connections, router
+from ldapdb.backends.ldap.compiler import query_as_ldap
+
+from . import conf
+from .checkpoints.models import SyncCheckpoint
+
+logger = logging.getLogger('authldap_utils')
+
+################################################################
+
+# The Sync Request Control (RFC 4533).
+SYNC_REQUEST_OID = '1.3.6.1.4.1.4203.1.9.1.1'
+
+
+def supports_syncrepl(using):
+    """
+    Return True if the server of the database alias offers syncrepl.
+    """
+    connection = connections[using]
+    try:
+        for dn, attrs in connection.search_s(
+                '', ldap.SCOPE_BASE, attrlist=['supportedControl']):
+            controls = attrs.get('supportedControl', [])
+            return SYNC_REQUEST_OID.encode('ascii') in controls
+    except ldap.LDAPError as e:
+        logger.info('Cannot read the root DSE: %s', e)
+    return False
+
+
+def get_syncrepl_consumer(ldap_object):
+    """
+    Return a syncrepl consumer for the (python-ldap) connection,
+    collecting the DNs of added or changed entries, and the cookie.
+    """
+    from ldap.syncrepl import SyncreplConsumer
+
+    class Consumer(SyncreplConsumer):
+        def __init__(self, cookie):
+            self.cookie = cookie
+            self.changed = []
+
+        def search_ext(self, *args, **kwargs):
+            return ldap_object.search_ext(*args, **kwargs)
+
+        def result4(self, *args, **kwargs):
+            return ldap_object.result4(*args, **kwargs)
+
+        def syncrepl_get_cookie(self):
+            return self.cookie
+
+        def syncrepl_set_cookie(self, cookie):
+            self.cookie = cookie
+
+        def syncrepl_entry(self, dn, attrs, uuid):
+            self.changed.append(dn)
+
+        def syncrepl_present(self, uuids, refreshDeletes=False):
+            pass
+
+        def syncrepl_delete(self, uuids):
+            pass
+
+    return Consumer
+
+
+################################################################
+
+
+class ChangeFeed(object):
+    """
+    The entries of an LDAP ``model`` added or changed since the named
+    checkpoint.  ``mode`` is 'syncrepl', 'timestamp' or 'auto' (syncrepl
+    if the server offers it); the default is the ``change_feed_mode``
+    setting.  The model needs a ``modified`` (``modifyTimestamp``) field
+    for the 'timestamp' mode.
+    """
+
+    def __init__(self, name, model, mode=None, chunk_size=None):
+        self.name = name
+        self.model = model
+        self.using = router.db_for_read(model)
+        if mode is None:
+            mode = conf.get('change_feed_mode')
+        if mode == 'auto':
+            mode = 'syncrepl' if supports_syncrepl(self.using) else \
+                   'timestamp'
+        self.mode = mode
+        self.chunk_size = chunk_size
+        self.checkpoint, created = SyncCheckpoint.objects.get_or_create(
+            name=name)
+        self.timestamp = self.checkpoint.timestamp
+        self.cookie = self.checkpoint.cookie
+
+    def changes(self):
+        """
+        Yield the added or changed entries (every entry, the first time).
+        """
+        if self.mode == 'syncrepl':
+            return self.syncrepl_changes()
+        return self.timestamp_changes()
+
+    def get_queryset(self):
+        return self.model.objects.using(self.using).all()
+
+    def timestamp_changes(self):
+        queryset = self.get_queryset()
+        if self.timestamp:
+            queryset = queryset.filter(modified__gte=self.timestamp)
+        for obj in queryset.iterator(chunk_size=self.chunk_size):
+            # generalized time (UTC) sorts as a string.
+            if obj.modified and obj.modified > self.timestamp:
+                self.timestamp = obj.modified
+            yield obj
+
+    def syncrepl_changes(self):
+        queryset = self.get_queryset()
+        compiler = queryset.query.get_compiler(self.using)
+        lookup = query_as_ldap(
+            queryset.query, compiler=compiler, connection=compiler.connection)
+        if lookup is None:
+            return
+
+        wrapper = connections[self.using]
+        wrapper.ensure_connection()
+        consumer = get_syncrepl_consumer(wrapper.connection)(
+            self.cookie or None)
+        # Only the DNs: the entries are read in chunks below.
+        msgid = consumer.syncrepl_search(
+            lookup.base,
+            lookup.scope,
+            mode='refreshOnly',
+            filterstr=lookup.filterstr,
+            attrlist=['1.1'])
+        chunk_size = conf.get('ldap_chunk_size')
+        in_progress = True
+        while in_progress:
+            # one message at a time
+            in_progress = consumer.syncrepl_poll(msgid=msgid, all=0)
+            if len(consumer.changed) >= chunk_size or \
+                    (consumer.changed and not in_progress):
+                # the RDN value is the primary key.
+                pks = [ldap.dn.str2dn(dn)[0][0][1] for dn in consumer.changed]
+                consumer.changed = []
+                for obj in queryset.iter_chunks(pks, chunk_size=chunk_size):
+                    yield obj
+        if consumer.cookie:
+            self.cookie = consumer.cookie
+
+    def commit(self):
+        """
+        Save the checkpoint, once the changes have been processed.
+        """
+        self.checkpoint.timestamp = self.timestamp
+        self.checkpoint.cookie = self.cookie
+        self.checkpoint.save()
+
+    def reset(self):
+        """
+        Start again from the beginning (i.e., every entry).
+        """
+        self.timestamp = ''
+        self.cookie = ''
+        self.commit()
+
+
+################################################################
@@ -33,16 +33,53 @@
 #
 from __future__ import print_function, unicode_literals
 
+import time
+
 import ldap
+from django.contrib import admin
+from django.contrib.admin.utils import flatten_fieldsets
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.core.signals import request_finished
 from django.db import connections, router
 from django.db.models import Q
-from django.test import TestCase
-from ldap.models import LdapGroup, LdapUser
-
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase
+from django.urls import reverse
+from django.views.generic import View
+from ldap.controls import SimplePagedResultsControl
 from ldapdb.backends.ldap.compiler import query_as_ldap
 
+from . import executors, fakeldap
+from .admin import SAMBA_FIELDSETS
+from .backends.ldap.pool import LdapConnectionPool, PoolTimeout
+from .choices import CachedModelChoiceField, get_cache_key
+from .debug import LdapOperationCollector
+from .executors import hash_password, submit
+from .forms import AdminEmailForm, LdapPasswordResetForm
+from .instrumentation import (LdapQueriesMixin, get_hashing_stats,
+                              get_prometheus_text, record)
+from .mail import MergeTemplate
+from .models import (ENABLE_SAMBA, ConcurrentModificationError, LdapGroup,
+                     LdapSambaDomain, LdapUser)
+from .photos import (get_photo_details, get_thumbnail_size, make_thumbnail,
+                     parse_timestamp)
+from .router import ReplicaRouter, unpin
+from .sync import ChangeFeed
+from .throttle import is_rate_limited
+from .utils import (RANDPASS_ALPHABET, generate_random_passwords, get_cache,
+                    is_ssha_password_usable, make_nt_password,
+                    make_password_hashes)
+from .views import (PasswordThrottleMixin, discard_selection, load_selection,
+                    store_selection)
+
 
 class BaseTestCase(TestCase):
+    # the LDAP database too (with the authldap_utils.backends.memory
+    # engine, each test is rolled back there as well).
+    databases = '__all__'
+
     def _add_base_dn(self, model):
         using = router.db_for_write(model)
         connection = connections[using]
@@ -112,55 +149,59 @@ class GroupTestCase(BaseTestCase):
         qs = LdapGroup.objects.all()
         self.assertEquals(len(qs), 3)
 
+    def get_filterstr(self, qs):
+        compiler = qs.query.get_compiler(using=qs.db)
+        return query_as_ldap(qs.query, compiler, compiler.connection).filterstr
+
     def test_ldap_filter(self):
         # single filter
         qs = LdapGroup.objects.filter(name='foogroup')
         self.assertEquals(
-            query_as_ldap(qs.query),
+            self.get_filterstr(qs),
             '(&(objectClass=posixGroup)(cn=foogroup))')
 
         qs = LdapGroup.objects.filter(Q(name='foogroup'))
         self.assertEquals(
-            query_as_ldap(qs.query),
+            self.get_filterstr(qs),
             '(&(objectClass=posixGroup)(cn=foogroup))')
 
         # AND filter
         qs = LdapGroup.objects.filter(gid=1000, name='foogroup')
         self.assertEquals(
-            query_as_ldap(qs.query),
+            self.get_filterstr(qs),
             '(&(objectClass=posixGroup)(&(gidNumber=1000)(cn=foogroup)))')
 
         qs = LdapGroup.objects.filter(Q(gid=1000) & Q(name='foogroup'))
         self.assertEquals(
-            query_as_ldap(qs.query),
+            self.get_filterstr(qs),
             '(&(objectClass=posixGroup)(&(gidNumber=1000)(cn=foogroup)))')
 
         # OR filter
         qs = LdapGroup.objects.filter(Q(gid=1000) | Q(name='foogroup'))
         self.assertEquals(
-            query_as_ldap(qs.query),
+            self.get_filterstr(qs),
             '(&(objectClass=posixGroup)(|(gidNumber=1000)(cn=foogroup)))')
 
         # single exclusion
         qs = LdapGroup.objects.exclude(name='foogroup')
         self.assertEquals(
-            query_as_ldap(qs.query),
+            self.get_filterstr(qs),
             '(&(objectClass=posixGroup)(!(cn=foogroup)))')
 
         qs = LdapGroup.objects.filter(~Q(name='foogroup'))
         self.assertEquals(
-            query_as_ldap(qs.query),
+            self.get_filterstr(qs),
             '(&(objectClass=posixGroup)(!(cn=foogroup)))')
 
         # multiple exclusion
         qs = LdapGroup.objects.exclude(name='foogroup', gid=1000)
         self.assertEquals(
-            query_as_ldap(qs.query),
+            self.get_filterstr(qs),
             '(&(objectClass=posixGroup)(!(&(gidNumber=1000)(cn=foogroup))))')
 
         qs = LdapGroup.objects.filter(name='foogroup').exclude(gid=1000)
         self.assertEquals(
-            query_as_ldap(qs.query),
+            self.get_filterstr(qs),
             '(&(objectClass=posixGroup)(&(cn=foogroup)(!(gidNumber=1000))))')
 
     def test_filter(self):
@@ -174,7 +215,7 @@ class GroupTestCase(BaseTestCase):
         self.assertEquals(g.dn, 'cn=foogroup,%s' % LdapGroup.base_dn)
         self.assertEquals(g.name, 'foogroup')
         self.assertEquals(g.gid, 1000)
-        self.assertEquals(g.usernames, ['foouser', 'baruser'])
+        self.assertEquals(sorted(g.usernames), ['baruser', 'foouser'])
 
         # try to filter non-existent entries
         qs = LdapGroup.objects.filter(name='does_not_exist')
@@ -188,7 +229,7 @@ class GroupTestCase(BaseTestCase):
         self.assertEquals(g.dn, 'cn=foogroup,%s' % LdapGroup.base_dn)
         self.assertEquals(g.name, 'foogroup')
         self.assertEquals(g.gid, 1000)
-        self.assertEquals(g.usernames, ['foouser', 'baruser'])
+        self.assertEquals(sorted(g.usernames), ['baruser', 'foouser'])
 
         # try to get a non-existent entry
         self.assertRaises(
@@ -316,7 +357,7 @@ class GroupTestCase(BaseTestCase):
         self.assertEquals(len(qs), 2)
 
 
-class UserTestCase(BaseTestCase):
+class UserTestCase(LdapQueriesMixin, BaseTestCase):
     def setUp(self):
         super(UserTestCase, self).setUp()
 
@@ -329,7 +370,7 @@ class UserTestCase(BaseTestCase):
         u.home_directory = "/home/foouser"
         u.uid = 2000
         u.username = "foouser"
-        u.photo = '\xff\xd8\xff\xe0\x00\x10JFIF\x00\x01\x01\x01\x00H\x00H\x00\x00\xff\xfe\x00\x1cCreated with GIMP on a Mac\xff\xdb\x00C\x00\x05\x03\x04\x04\x04\x03\x05\x04\x04\x04\x05\x05\x05\x06\x07\x0c\x08\x07\x07\x07\x07\x0f\x0b\x0b\t\x0c\x11\x0f\x12\x12\x11\x0f\x11\x11\x13\x16\x1c\x17\x13\x14\x1a\x15\x11\x11\x18!\x18\x1a\x1d\x1d\x1f\x1f\x1f\x13\x17"$"\x1e$\x1c\x1e\x1f\x1e\xff\xdb\x00C\x01\x05\x05\x05\x07\x06\x07\x0e\x08\x08\x0e\x1e\x14\x11\x14\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\xff\xc0\x00\x11\x08\x00\x08\x00\x08\x03\x01"\x00\x02\x11\x01\x03\x11\x01\xff\xc4\x00\x15\x00\x01\x01\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x08\xff\xc4\x00\x19\x10\x00\x03\x01\x01\x01\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x01\x02\x06\x11A\xff\xc4\x00\x14\x01\x01\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\xff\xc4\x00\x14\x11\x01\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\xff\xda\x00\x0c\x03\x01\x00\x02\x11\x03\x11\x00?\x00\x9d\xf29wU5Q\xd6\xfd\x00\x01\xff\xd9'
+        u.photo = b'\xff\xd8\xff\xe0\x00\x10JFIF\x00\x01\x01\x01\x00H\x00H\x00\x00\xff\xfe\x00\x1cCreated with GIMP on a Mac\xff\xdb\x00C\x00\x05\x03\x04\x04\x04\x03\x05\x04\x04\x04\x05\x05\x05\x06\x07\x0c\x08\x07\x07\x07\x07\x0f\x0b\x0b\t\x0c\x11\x0f\x12\x12\x11\x0f\x11\x11\x13\x16\x1c\x17\x13\x14\x1a\x15\x11\x11\x18!\x18\x1a\x1d\x1d\x1f\x1f\x1f\x13\x17"$"\x1e$\x1c\x1e\x1f\x1e\xff\xdb\x00C\x01\x05\x05\x05\x07\x06\x07\x0e\x08\x08\x0e\x1e\x14\x11\x14\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\xff\xc0\x00\x11\x08\x00\x08\x00\x08\x03\x01"\x00\x02\x11\x01\x03\x11\x01\xff\xc4\x00\x15\x00\x01\x01\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x08\xff\xc4\x00\x19\x10\x00\x03\x01\x01\x01\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x01\x02\x06\x11A\xff\xc4\x00\x14\x01\x01\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\xff\xc4\x00\x14\x11\x01\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\xff\xda\x00\x0c\x03\x01\x00\x02\x11\x03\x11\x00?\x00\x9d\xf29wU5Q\xd6\xfd\x00\x01\xff\xd9'
         u.save()
 
     def test_get(self):
@@ -344,7 +385,7 @@ class UserTestCase(BaseTestCase):
         self.assertEquals(u.username, 'foouser')
         self.assertEquals(
             u.photo,
-            '\xff\xd8\xff\xe0\x00\x10JFIF\x00\x01\x01\x01\x00H\x00H\x00\x00\xff\xfe\x00\x1cCreated with GIMP on a Mac\xff\xdb\x00C\x00\x05\x03\x04\x04\x04\x03\x05\x04\x04\x04\x05\x05\x05\x06\x07\x0c\x08\x07\x07\x07\x07\x0f\x0b\x0b\t\x0c\x11\x0f\x12\x12\x11\x0f\x11\x11\x13\x16\x1c\x17\x13\x14\x1a\x15\x11\x11\x18!\x18\x1a\x1d\x1d\x1f\x1f\x1f\x13\x17"$"\x1e$\x1c\x1e\x1f\x1e\xff\xdb\x00C\x01\x05\x05\x05\x07\x06\x07\x0e\x08\x08\x0e\x1e\x14\x11\x14\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\xff\xc0\x00\x11\x08\x00\x08\x00\x08\x03\x01"\x00\x02\x11\x01\x03\x11\x01\xff\xc4\x00\x15\x00\x01\x01\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x08\xff\xc4\x00\x19\x10\x00\x03\x01\x01\x01\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x01\x02\x06\x11A\xff\xc4\x00\x14\x01\x01\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\xff\xc4\x00\x14\x11\x01\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\xff\xda\x00\x0c\x03\x01\x00\x02\x11\x03\x11\x00?\x00\x9d\xf29wU5Q\xd6\xfd\x00\x01\xff\xd9'
+            b'\xff\xd8\xff\xe0\x00\x10JFIF\x00\x01\x01\x01\x00H\x00H\x00\x00\xff\xfe\x00\x1cCreated with GIMP on a Mac\xff\xdb\x00C\x00\x05\x03\x04\x04\x04\x03\x05\x04\x04\x04\x05\x05\x05\x06\x07\x0c\x08\x07\x07\x07\x07\x0f\x0b\x0b\t\x0c\x11\x0f\x12\x12\x11\x0f\x11\x11\x13\x16\x1c\x17\x13\x14\x1a\x15\x11\x11\x18!\x18\x1a\x1d\x1d\x1f\x1f\x1f\x13\x17"$"\x1e$\x1c\x1e\x1f\x1e\xff\xdb\x00C\x01\x05\x05\x05\x07\x06\x07\x0e\x08\x08\x0e\x1e\x14\x11\x14\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\x1e\xff\xc0\x00\x11\x08\x00\x08\x00\x08\x03\x01"\x00\x02\x11\x01\x03\x11\x01\xff\xc4\x00\x15\x00\x01\x01\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x08\xff\xc4\x00\x19\x10\x00\x03\x01\x01\x01\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x01\x02\x06\x11A\xff\xc4\x00\x14\x01\x01\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\xff\xc4\x00\x14\x11\x01\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\xff\xda\x00\x0c\x03\x01\x00\x02\x11\x03\x11\x00?\x00\x9d\xf29wU5Q\xd6\xfd\x00\x01\xff\xd9'
         )
 
         self.assertRaises(
@@ -362,6 +403,181 @@ class UserTestCase(BaseTestCase):
         u.save()
         self.assertEquals(u.dn, 'uid=foouser2,%s' % LdapUser.base_dn)
 
+    def test_no_rebind(self):
+        connection = connections[router.db_for_read(LdapUser)]
+        connection.ensure_connection()
+        binds = []
+        simple_bind_s = connection.connection.simple_bind_s
+
+        def counting_bind(*args, **kwargs):
+            binds.append(args)
+            return simple_bind_s(*args, **kwargs)
+
+        connection.connection.simple_bind_s = counting_bind
+        u = LdapUser.objects.get(username='foouser')
+        u.phone = '555-1234'
+        u.save()
+        self.assertEquals(LdapUser.objects.count(), 1)
+        self.assertEquals(binds, [])
+
+    def test_has_changed(self):
+        u = LdapUser.objects.get(username='foouser')
+        self.assertFalse(u.has_changed('uid'))
+        u.uid = 2001
+        self.assertTrue(u.has_changed('uid'))
+        u.save()
+        self.assertFalse(u.has_changed('uid'))
+        # new entries
+        self.assertTrue(LdapUser(username='bar').has_changed('uid'))
+
+    def test_changed_fields(self):
+        u = LdapUser.objects.get(username='foouser')
+        self.assertEquals(u.get_changed_fields(), [])
+        u.email = 'foo@example.com'
+        u.phone = '555-1234'
+        self.assertEquals(sorted(u.get_changed_fields()), ['email', 'phone'])
+        u.save()
+        self.assertEquals(u.get_changed_fields(), [])
+        u = LdapUser.objects.get(username='foouser')
+        self.assertEquals(u.email, 'foo@example.com')
+
+    def test_concurrent_modification(self):
+        u = LdapUser.objects.get(username='foouser')
+        version = u.get_version()
+        self.assertTrue(version)
+
+        other = LdapUser.objects.get(username='foouser')
+        other.phone = '555-1234'
+        other.save()
+        self.assertNotEquals(u.get_current_version(), version)
+
+        u.expected_version = version
+        u.email = 'foo@example.com'
+        self.assertRaises(ConcurrentModificationError, u.save)
+
+    def test_ldap_queries(self):
+        with self.assertLdapQueries(1) as captured:
+            LdapUser.objects.get(username='foouser')
+        self.assertEquals(captured.operations[0]['operation'], 'search')
+        self.assertEquals(captured.operations[0]['model'], LdapUser)
+        self.assertEquals(captured.operations[0]['count'], 1)
+
+        u = LdapUser.objects.get(username='foouser')
+        # only the modify: the entry is not read again.
+        with self.assertLdapQueries(1):
+            u.phone = '555-1234'
+            u.save()
+        self.assertIn('operation="modify"', get_prometheus_text())
+
+    def test_password_fields(self):
+        form = LdapPasswordResetForm()
+        u = form.get_ldap_user('foouser')
+        with self.assertLdapQueries(0):
+            for name in LdapUser.get_password_fields():
+                getattr(u, name)
+        self.assertIn('photo', u.get_deferred_fields())
+        self.assertIsNone(form.get_ldap_user('does_not_exist'))
+
+    def test_sync_deferred(self):
+        u = LdapUser.objects.get(username='foouser')
+        u.save()
+        django_user = get_user_model().objects.get(username='foouser')
+        self.assertEquals(django_user.first_name, u.first_name)
+
+        u = LdapUser.objects.only('username', 'password').get(
+            username='foouser')
+        # only the modify: deferred fields are not loaded to be synced.
+        with self.assertLdapQueries(1):
+            u.password = '{SSHA}x'
+            u.save()
+        self.assertEquals(
+            get_user_model().objects.get(username='foouser').first_name,
+            django_user.first_name)
+
+    def test_ldap_debug_duplicates(self):
+        collector = LdapOperationCollector()
+        collector.start()
+        try:
+            LdapUser.objects.get(username='foouser')
+            LdapUser.objects.get(username='foouser')
+        finally:
+            collector.stop()
+        stats = collector.get_stats()
+        self.assertEquals(stats['count'], 2)
+        self.assertEquals(stats['duplicates'], 1)
+        # the call site is this test, not the query machinery.
+        self.assertIn('test_ldap_debug_duplicates',
+                      [frame[2] for frame in stats['operations'][0]['stack']])
+
+    def test_as_records(self):
+        records = list(LdapUser.objects.as_records())
+        self.assertEquals(len(records), 1)
+        self.assertEquals(records[0].username, 'foouser')
+        self.assertEquals(records[0].uid, 2000)
+        # the photo is deferred.
+        self.assertFalse(hasattr(records[0], 'photo'))
+
+        records = list(LdapUser.objects.only('username').as_records())
+        self.assertEquals(records[0].username, 'foouser')
+        self.assertFalse(hasattr(records[0], 'uid'))
+
+    def test_from_ldap(self):
+        u = LdapUser.from_ldap('uid=bazuser,' + LdapUser.base_dn, {
+            'uid': [b'bazuser'],
+            'mail': [b'baz@example.com'],
+        }, attrlist=['uid', 'mail'])
+        self.assertEquals(u.username, 'bazuser')
+        self.assertEquals(u.email, 'baz@example.com')
+        self.assertFalse(u.has_changed('email'))
+        # no defaults: the other fields are deferred.
+        self.assertIn('password', u.get_deferred_fields())
+        self.assertIn('login_shell', u.get_deferred_fields())
+
+    def test_from_ldap_empty(self):
+        # all user attributes were requested: those missing are empty.
+        u = LdapUser.from_ldap('uid=foouser,' + LdapUser.base_dn, {
+            'uid': [b'foouser'],
+        })
+        with self.assertLdapQueries(0):
+            self.assertEquals(u.phone, '')
+            self.assertEquals(u.email, '')
+        self.assertFalse(u.has_changed('phone'))
+        self.assertIn('modified', u.get_deferred_fields())
+        u = LdapUser.from_ldap('uid=foouser,' + LdapUser.base_dn, {
+            'uid': [b'foouser'],
+        }, attrlist=['*', '+'])
+        self.assertEquals(u.get_deferred_fields(), set())
+
+    def test_iterator(self):
+        users = list(LdapUser.objects.iterator(chunk_size=1))
+        self.assertEquals([u.username for u in users], ['foouser'])
+        uids = LdapUser.objects.values_list('uid', flat=True)
+        self.assertEquals(list(uids.iterator(chunk_size=1)), [2000])
+
+    def test_change_feed(self):
+        feed = ChangeFeed('test', LdapUser, mode='timestamp')
+        self.assertEquals([u.username for u in feed.changes()], ['foouser'])
+        feed.commit()
+
+        feed = ChangeFeed('test', LdapUser, mode='timestamp')
+        self.assertTrue(feed.timestamp)
+        # unchanged entries on the checkpoint boundary may be repeated.
+        self.assertTrue(len(list(feed.changes())) <= 1)
+
+    def test_photo_details(self):
+        get_cache().clear()
+        details = get_photo_details('foouser')
+        self.assertIn('data', details)
+        # the time of the entry, not of the fetch.
+        self.assertIsNotNone(details['modified'])
+        self.assertEquals(
+            details['modified'],
+            parse_timestamp(LdapUser.objects.get(username='foouser').modified))
+        # cached, without the photo.
+        details = get_photo_details('foouser')
+        self.assertNotIn('data', details)
+        self.assertEquals(get_photo_details('does_not_exist'), None)
+
 
 class ScopedTestCase(BaseTestCase):
     def setUp(self):
@@ -408,10 +624,10 @@ class ScopedTestCase(BaseTestCase):
 
 
 class AdminTestCase(BaseTestCase):
-    fixtures = ['test_users.json']
-
     def setUp(self):
         super(AdminTestCase, self).setUp()
+        get_user_model().objects.create_superuser(
+            'test_user', 'test_user@example.org', 'password')
 
         g = LdapGroup()
         g.name = "foogroup"
@@ -448,79 +664,649 @@ class AdminTestCase(BaseTestCase):
         self.client.login(username="test_user", password="password")
 
     def test_index(self):
-        response = self.client.get('/admin/ldap/')
-        self.assertContains(response, "Ldap groups")
-        self.assertContains(response, "Ldap users")
+        response = self.client.get('/admin/authldap_utils/')
+        self.assertContains(response, "Groups")
+        self.assertContains(response, "Users")
 
     def test_group_list(self):
-        response = self.client.get('/admin/ldap/ldapgroup/')
-        self.assertContains(response, "Ldap groups")
+        response = self.client.get('/admin/authldap_utils/ldapgroup/')
+        self.assertContains(response, "Groups")
         self.assertContains(response, "foogroup")
         self.assertContains(response, "1000")
 
         # order by name
-        response = self.client.get('/admin/ldap/ldapgroup/?o=1')
-        self.assertContains(response, "Ldap groups")
+        response = self.client.get('/admin/authldap_utils/ldapgroup/?o=1')
+        self.assertContains(response, "Groups")
         self.assertContains(response, "foogroup")
         self.assertContains(response, "1000")
 
         # order by gid
-        response = self.client.get('/admin/ldap/ldapgroup/?o=2')
-        self.assertContains(response, "Ldap groups")
+        response = self.client.get('/admin/authldap_utils/ldapgroup/?o=2')
+        self.assertContains(response, "Groups")
         self.assertContains(response, "foogroup")
         self.assertContains(response, "1000")
 
     def test_group_detail(self):
-        response = self.client.get('/admin/ldap/ldapgroup/foogroup/')
+        response = self.client.get('/admin/authldap_utils/ldapgroup/foogroup/change/')
         self.assertContains(response, "foogroup")
         self.assertContains(response, "1000")
 
     def test_group_add(self):
-        response = self.client.post('/admin/ldap/ldapgroup/add/', {
+        response = self.client.post('/admin/authldap_utils/ldapgroup/add/', {
             'gid': '1002',
             'name': 'wizgroup'
         })
-        self.assertRedirects(response, '/admin/ldap/ldapgroup/')
+        self.assertRedirects(response, '/admin/authldap_utils/ldapgroup/')
         qs = LdapGroup.objects.all()
         self.assertEquals(qs.count(), 3)
 
     def test_group_delete(self):
-        response = self.client.post('/admin/ldap/ldapgroup/foogroup/delete/',
+        response = self.client.post('/admin/authldap_utils/ldapgroup/foogroup/delete/',
                                     {'yes': 'post'})
-        self.assertRedirects(response, '/admin/ldap/ldapgroup/')
+        self.assertRedirects(response, '/admin/authldap_utils/ldapgroup/')
         qs = LdapGroup.objects.all()
         self.assertEquals(qs.count(), 1)
 
     def test_group_search(self):
-        response = self.client.get('/admin/ldap/ldapgroup/?q=foo')
-        self.assertContains(response, "Ldap groups")
+        response = self.client.get('/admin/authldap_utils/ldapgroup/?q=foo')
+        self.assertContains(response, "Groups")
         self.assertContains(response, "foogroup")
         self.assertContains(response, "1000")
 
     def test_user_list(self):
-        response = self.client.get('/admin/ldap/ldapuser/')
-        self.assertContains(response, "Ldap users")
+        response = self.client.get('/admin/authldap_utils/ldapuser/')
+        self.assertContains(response, "Users")
         self.assertContains(response, "foouser")
         self.assertContains(response, "2000")
 
         # order by username
-        response = self.client.get('/admin/ldap/ldapuser/?o=1')
-        self.assertContains(response, "Ldap users")
+        response = self.client.get('/admin/authldap_utils/ldapuser/?o=1')
+        self.assertContains(response, "Users")
         self.assertContains(response, "foouser")
         self.assertContains(response, "2000")
 
         # order by uid
-        response = self.client.get('/admin/ldap/ldapuser/?o=2')
-        self.assertContains(response, "Ldap users")
+        response = self.client.get('/admin/authldap_utils/ldapuser/?o=2')
+        self.assertContains(response, "Users")
         self.assertContains(response, "foouser")
         self.assertContains(response, "2000")
 
     def test_user_detail(self):
-        response = self.client.get('/admin/ldap/ldapuser/foouser/')
+        response = self.client.get('/admin/authldap_utils/ldapuser/foouser/change/')
         self.assertContains(response, "foouser")
         self.assertContains(response, "2000")
 
     def test_user_delete(self):
-        response = self.client.post('/admin/ldap/ldapuser/foouser/delete/',
+        response = self.client.post('/admin/authldap_utils/ldapuser/foouser/delete/',
                                     {'yes': 'post'})
-        self.assertRedirects(response, '/admin/ldap/ldapuser/')
+        self.assertRedirects(response, '/admin/authldap_utils/ldapuser/')
+
+
+class AdminChangeTestCase(BaseTestCase):
+    def setUp(self):
+        super(AdminChangeTestCase, self).setUp()
+        g = LdapGroup()
+        g.name = "foogroup"
+        g.gid = 1000
+        g.save()
+
+        u = LdapUser()
+        u.first_name = "Foo"
+        u.last_name = "User"
+        u.full_name = "Foo User"
+        u.group = 1000
+        u.home_directory = "/home/foouser"
+        u.uid = 2000
+        u.username = "foouser"
+        if ENABLE_SAMBA:
+            d = LdapSambaDomain()
+            d.domain_name = "FOO"
+            d.sid = "S-1-5-21-1000"
+            d.save()
+            u.domain = "FOO"
+        u.save()
+
+        self.client.force_login(get_user_model().objects.create_superuser(
+            'admin', 'admin@example.org', 'password'))
+
+    def test_user_change_form(self):
+        url = reverse('admin:authldap_utils_ldapuser_change',
+                      args=['foouser'])
+        response = self.client.get(url)
+        model_admin = admin.site._registry[LdapUser]
+        fieldsets = model_admin.get_fieldsets(response.wsgi_request)
+        readonly_fields = model_admin.get_readonly_fields(
+            response.wsgi_request)
+        for name in flatten_fieldsets(fieldsets):
+            self.assertContains(response, 'field-%s' % name)
+            if name not in readonly_fields:
+                self.assertContains(response, 'name="%s"' % name)
+        # the layout matches the model (see enable_samba).
+        self.assertEquals('sid' in readonly_fields, ENABLE_SAMBA)
+        self.assertEquals(
+            fieldsets[-len(SAMBA_FIELDSETS):] == SAMBA_FIELDSETS,
+            ENABLE_SAMBA)
+
+    def test_change_during_save(self):
+        url = reverse('admin:authldap_utils_ldapgroup_change',
+                      args=['foogroup'])
+        version = LdapGroup.objects.get(name='foogroup').get_version()
+
+        def change_entry(sender, instance, **kwargs):
+            # someone else changes the entry after the form is cleaned.
+            pre_save.disconnect(change_entry, sender=LdapGroup)
+            g = LdapGroup.objects.get(name='foogroup')
+            g.usernames = ['foouser']
+            g.save()
+
+        pre_save.connect(change_entry, sender=LdapGroup)
+        try:
+            response = self.client.post(url, {
+                'name': 'foogroup',
+                'gid': '1001',
+                'version': version
+            })
+        finally:
+            pre_save.disconnect(change_entry, sender=LdapGroup)
+        self.assertContains(response, 'changed by someone else')
+        self.assertEquals(LdapGroup.objects.get(name='foogroup').gid, 1000)
+
+    def test_email_form(self):
+        url = reverse('admin:ldap-email-choices-autocomplete',
+                      kwargs={'field_name': 'to_list'})
+        form = AdminEmailForm(initial={'to_list': ['foouser']})
+        html = str(form['to_list'])
+        self.assertIn('data-ajax--url="{0}"'.format(url), html)
+        self.assertIn('<option value="foouser" selected>Foo User</option>',
+                      html)
+
+        response = self.client.get(url, {'term': 'foo'})
+        self.assertEquals(response.json()['results'], [{
+            'id': 'foouser',
+            'text': 'Foo User'
+        }])
+        response = self.client.get(url, {'term': 'bar'})
+        self.assertEquals(response.json()['results'], [])
+
+    def test_autocomplete_page(self):
+        url = reverse('admin:ldap-choices-autocomplete',
+                      kwargs={'field_name': 'group'})
+        for page in ['0', '-1', 'x']:
+            response = self.client.get(url, {'page': page})
+            self.assertEquals(response.json()['results'], [{
+                'id': '1000',
+                'text': 'foogroup'
+            }])
+        response = self.client.get(url, {'page': '2'})
+        self.assertEquals(response.json()['results'], [])
+
+
+def send_password_resets(email_messages):
+    """
+    A ``password_reset_sender`` for PasswordResetTestCase.
+    """
+    PasswordResetTestCase.batches.append(list(email_messages))
+
+
+class PasswordResetTestCase(BaseTestCase):
+    batches = []
+
+    def setUp(self):
+        super(PasswordResetTestCase, self).setUp()
+        get_cache().clear()
+        PasswordResetTestCase.batches = []
+        User = get_user_model()
+        User.objects.create_user('foo', 'foo@example.org', 'password')
+        User.objects.create_user('foo2', 'Foo@example.org', 'password')
+
+    def reset(self, email='foo@example.org'):
+        form = LdapPasswordResetForm({'email': email})
+        self.assertTrue(form.is_valid())
+        form.save(domain_override='example.org')
+
+    def test_send(self):
+        self.reset()
+        self.assertEquals(len(mail.outbox), 2)
+        self.assertEquals(self.batches, [])
+
+    def test_sender(self):
+        with self.settings(AUTHLDAP_UTILS_CONFIG={
+                'password_reset_sender':
+                'authldap_utils.tests.send_password_resets'}):
+            self.reset()
+        self.assertEquals(len(mail.outbox), 0)
+        # all the messages for the address, at once.
+        self.assertEquals(len(self.batches), 1)
+        self.assertEquals(
+            sorted(m.to[0] for m in self.batches[0]),
+            ['Foo@example.org', 'foo@example.org'])
+
+    def test_rate(self):
+        with self.settings(AUTHLDAP_UTILS_CONFIG={
+                'password_reset_rate': (1, 3600)}):
+            self.reset()
+            self.assertEquals(len(mail.outbox), 2)
+            # dropped silently, whatever the case of the address.
+            self.reset('FOO@example.org')
+            self.assertEquals(len(mail.outbox), 2)
+
+
+class ExecutorTestCase(SimpleTestCase):
+    def test_password_hashes(self):
+        hashes = submit(make_password_hashes, 'secret').result()
+        user = LdapUser(username='foouser')
+        user.set_password_hashes(hashes)
+        self.assertTrue(user.has_usable_password())
+        self.assertEquals(user.nt_password, make_nt_password('secret'))
+        self.assertTrue(user.pwd_last_set)
+
+    def test_hashing_stats(self):
+        count = get_hashing_stats()['count']
+        LdapUser(username='foouser').set_password('secret')
+        self.assertEquals(get_hashing_stats()['count'], count + 1)
+        self.assertEquals(get_hashing_stats()['pending'], 0)
+
+    def test_hashing_processes(self):
+        from concurrent.futures import ProcessPoolExecutor
+        with self.settings(
+                AUTHLDAP_UTILS_CONFIG={'password_hashing_processes': 1}):
+            try:
+                hashes = hash_password('secret')
+                self.assertIsInstance(executors.get_hashing_executor(),
+                                      ProcessPoolExecutor)
+            finally:
+                executors.get_hashing_executor().shutdown()
+                executors._hashing_executor = None
+        self.assertTrue(is_ssha_password_usable(hashes['password']))
+        self.assertEquals(hashes['nt_password'], make_nt_password('secret'))
+
+
+class RandomPasswordTestCase(SimpleTestCase):
+    def test_generate(self):
+        passwords = generate_random_passwords(100, length=20)
+        self.assertEquals(len(set(passwords)), 100)
+        for password in passwords:
+            self.assertEquals(len(password), 20)
+            self.assertTrue(set(password) <= set(RANDPASS_ALPHABET))
+
+    def test_lazy_default(self):
+        self.assertEquals(LdapUser(username='foouser').password, '')
+
+
+class MergeTemplateTestCase(TestCase):
+    def test_render(self):
+        t = MergeTemplate('Dear {first_name}, your username is {username}.')
+        self.assertEquals(t.fields, set(['first_name', 'username']))
+        self.assertEquals(
+            t.render({
+                'first_name': u'Fôo',
+                'username': 'foouser'
+            }), u'Dear Fôo, your username is foouser.')
+
+    def test_literal_braces(self):
+        t = MergeTemplate('{{username}} is {username}')
+        self.assertEquals(t.render({'username': 'foouser'}),
+                          '{username} is foouser')
+
+    def test_unknown_field(self):
+        self.assertRaises(ValueError, MergeTemplate, '{password}')
+        self.assertRaises(ValueError, MergeTemplate, '{username.__class__}')
+        self.assertRaises(ValueError, MergeTemplate, '{0}')
+
+    def test_invalid_format(self):
+        self.assertRaises(ValueError, MergeTemplate, '{username!x}')
+        self.assertRaises(ValueError, MergeTemplate,
+                          '{username:{first_name}}')
+        self.assertRaises(ValueError, MergeTemplate, '{username:d}')
+        self.assertRaises(ValueError, MergeTemplate, 'Dear {first_name')
+        t = MergeTemplate('{username!r:>12}')
+        self.assertEquals(t.render({'username': 'foouser'}),
+                          '{0:>12}'.format(repr('foouser')))
+
+    def test_form_error(self):
+        user = get_user_model().objects.create_user('admin')
+        form = AdminEmailForm({
+            'from_user': user.pk,
+            'subject': 'Hello {username!x}',
+            'message': 'Dear {first_name},',
+            'merge': 'on',
+        }, selected=['foouser'])
+        self.assertFalse(form.is_valid())
+        self.assertIn('subject', form.errors)
+        self.assertNotIn('message', form.errors)
+
+
+class ThrottleTestCase(SimpleTestCase):
+    def setUp(self):
+        get_cache().clear()
+
+    def test_limit(self):
+        rate = (3, 60)
+        for i in range(3):
+            self.assertFalse(is_rate_limited('foo', rate, now=600.0 + i))
+        self.assertTrue(is_rate_limited('foo', rate, now=610.0))
+        # other keys are not affected.
+        self.assertFalse(is_rate_limited('bar', rate, now=610.0))
+
+    def test_sliding_window(self):
+        rate = (3, 60)
+        for i in range(3):
+            is_rate_limited('foo', rate, now=650.0 + i)
+        # 2.75 hits in the last minute ...
+        self.assertFalse(is_rate_limited('foo', rate, now=665.0))
+        # ... the previous window still counts ...
+        self.assertTrue(is_rate_limited('foo', rate, now=666.0))
+        # ... until it has slid past.
+        self.assertFalse(is_rate_limited('foo', rate, now=715.0))
+
+    def test_no_rate(self):
+        for i in range(10):
+            self.assertFalse(is_rate_limited('foo', None))
+
+    def test_throttled_view(self):
+        class PostView(View):
+            def post(self, request, *args, **kwargs):
+                return HttpResponse('ok')
+
+        class ThrottledView(PasswordThrottleMixin, PostView):
+            throttle_scope = 'test'
+
+            def get_throttle_ident(self):
+                return self.request.POST.get('email', '')
+
+        view = ThrottledView.as_view()
+        factory = RequestFactory()
+
+        def post(ip, email):
+            return view(factory.post('/', {'email': email}, REMOTE_ADDR=ip))
+
+        with self.settings(AUTHLDAP_UTILS_CONFIG={
+                'password_throttle_rate': (2, 60)}):
+            for i in range(2):
+                self.assertEquals(post('10.0.0.1', 'foo@example.org')
+                                  .status_code, 200)
+            response = post('10.0.0.1', 'bar@example.org')
+            self.assertEquals(response.status_code, 429)
+            self.assertEquals(response.template_name,
+                              'registration/password_throttled.html')
+            # the user is throttled from other addresses too ...
+            self.assertEquals(post('10.0.0.2', 'FOO@example.org')
+                              .status_code, 429)
+            # ... but not other users.
+            self.assertEquals(post('10.0.0.2', 'bar@example.org')
+                              .status_code, 200)
+
+
+class ChoicesTestCase(SimpleTestCase):
+    def setUp(self):
+        get_cache().clear()
+        self.field = CachedModelChoiceField(LdapGroup.objects.all(),
+                                            to_field_name='name')
+
+    def test_cached(self):
+        get_cache().set(get_cache_key(LdapGroup),
+                        {'name': [('foogroup', 'foogroup')]})
+        # (a SimpleTestCase would fail on a directory lookup.)
+        self.assertEquals(list(self.field.choices),
+                          [('', self.field.empty_label),
+                           ('foogroup', 'foogroup')])
+        self.assertEquals(len(self.field.choices), 2)
+        self.assertEquals(self.field.choices.search('GROUP'),
+                          [('foogroup', 'foogroup')])
+        self.assertEquals(self.field.choices.search('bar'), [])
+
+    def test_invalidate(self):
+        key = get_cache_key(LdapGroup)
+        get_cache().set(key, {'name': []})
+        get_cache().set(get_cache_key(LdapUser), {'pk': []})
+        post_save.send(sender=LdapGroup, instance=None, created=False)
+        self.assertIsNone(get_cache().get(key))
+        # other models are not affected.
+        self.assertIsNotNone(get_cache().get(get_cache_key(LdapUser)))
+        get_cache().set(key, {'name': []})
+        post_delete.send(sender=LdapGroup, instance=None)
+        self.assertIsNone(get_cache().get(key))
+
+
+class SelectionTestCase(SimpleTestCase):
+    def setUp(self):
+        self.request = RequestFactory().get('/')
+        self.request.session = {}
+
+    def test_selection(self):
+        usernames = ['user{0}'.format(i) for i in range(1000)]
+        token = store_selection(self.request, iter(usernames))
+        other = store_selection(self.request, ['foouser'])
+        self.assertNotEqual(token, other)
+        self.assertEquals(load_selection(self.request, token), usernames)
+        self.assertEquals(load_selection(self.request, other), ['foouser'])
+        discard_selection(self.request, token)
+        self.assertEquals(load_selection(self.request, token), [])
+        self.assertEquals(load_selection(self.request, other), ['foouser'])
+
+    def test_no_selection(self):
+        self.assertEquals(load_selection(self.request, None), [])
+        self.assertEquals(load_selection(self.request, 'unknown'), [])
+        discard_selection(self.request, None)
+
+
+class PhotoTestCase(SimpleTestCase):
+    def test_thumbnail_size(self):
+        with self.settings(AUTHLDAP_UTILS_CONFIG={
+                'photo_thumbnail_sizes': [128, 32, 256]}):
+            self.assertEquals(get_thumbnail_size(), 128)
+            self.assertEquals(get_thumbnail_size(20), 32)
+            self.assertEquals(get_thumbnail_size(100), 128)
+            self.assertEquals(get_thumbnail_size(1000), 256)
+
+    def test_corrupt_photo(self):
+        self.assertEquals(make_thumbnail(b'not a photo', 32),
+                          ('image/jpeg', b'not a photo'))
+
+    def test_parse_timestamp(self):
+        self.assertEquals(parse_timestamp('19700102000000Z'), 86400)
+        self.assertEquals(parse_timestamp('19700102000000.5Z'), 86400)
+        self.assertIsNone(parse_timestamp(''))
+        self.assertIsNone(parse_timestamp(None))
+
+
+class ReplicaRouterTestCase(SimpleTestCase):
+    replicas = ['ldap-replica-1', 'ldap-replica-2']
+
+    def setUp(self):
+        unpin()
+        with self.settings(
+                AUTHLDAP_UTILS_CONFIG={'ldap_replicas': self.replicas}):
+            self.router = ReplicaRouter()
+
+    def tearDown(self):
+        unpin()
+
+    def test_read(self):
+        self.assertEquals(
+            [self.router.db_for_read(LdapUser) for i in range(3)],
+            ['ldap-replica-1', 'ldap-replica-2', 'ldap-replica-1'])
+        self.assertIsNone(self.router.db_for_read(get_user_model()))
+
+    def test_write(self):
+        self.assertEquals(self.router.db_for_write(LdapUser), 'ldap')
+        # routing a write is not writing.
+        self.assertIn(self.router.db_for_read(LdapUser), self.replicas)
+        record('search', 'ldap', model=LdapUser)
+        self.assertIn(self.router.db_for_read(LdapUser), self.replicas)
+        record('modify', 'ldap', model=LdapUser)
+        self.assertEquals(self.router.db_for_read(LdapUser), 'ldap')
+        self.assertEquals(self.router.db_for_read(LdapGroup), 'ldap')
+
+    def test_request_finished(self):
+        record('add', 'ldap', model=LdapUser)
+        request_finished.send(sender=self.__class__)
+        self.assertIn(self.router.db_for_read(LdapUser), self.replicas)
+
+
+class PooledConnection(object):
+    """
+    A connection for LdapConnectionPool tests.
+    """
+
+    def __init__(self, healthy=True):
+        self.healthy = healthy
+        self.bound = True
+
+    def whoami_s(self):
+        if not self.healthy:
+            raise ldap.SERVER_DOWN({'desc': "Can't contact LDAP server"})
+        return ''
+
+    def unbind_s(self):
+        self.bound = False
+
+
+class PoolTestCase(SimpleTestCase):
+    def test_reuse(self):
+        pool = LdapConnectionPool(size=2)
+        connection = pool.acquire(PooledConnection)
+        pool.release(connection)
+        self.assertIs(pool.acquire(PooledConnection), connection)
+        self.assertEquals(pool.opened, 1)
+
+    def test_size(self):
+        pool = LdapConnectionPool(size=1, timeout=0)
+        connection = pool.acquire(PooledConnection)
+        self.assertRaises(PoolTimeout, pool.acquire, PooledConnection)
+        pool.discard(connection)
+        self.assertFalse(connection.bound)
+        self.assertIsNot(pool.acquire(PooledConnection), connection)
+
+    def test_failed_connect(self):
+        def connect():
+            raise ldap.SERVER_DOWN({'desc': "Can't contact LDAP server"})
+
+        pool = LdapConnectionPool(size=1, timeout=0)
+        self.assertRaises(ldap.SERVER_DOWN, pool.acquire, connect)
+        self.assertEquals(pool.opened, 0)
+        pool.acquire(PooledConnection)
+
+    def test_idle_timeout(self):
+        pool = LdapConnectionPool(size=1, idle_timeout=60)
+        connection = pool.acquire(PooledConnection)
+        pool.idle.append((connection, time.time() - 61))
+        self.assertIsNot(pool.acquire(PooledConnection), connection)
+        self.assertFalse(connection.bound)
+        self.assertEquals(pool.opened, 1)
+
+    def test_ping(self):
+        pool = LdapConnectionPool(size=1, ping_interval=30)
+        healthy = pool.acquire(PooledConnection)
+        pool.idle.append((healthy, time.time() - 31))
+        self.assertIs(pool.acquire(PooledConnection), healthy)
+        healthy.healthy = False
+        pool.idle.append((healthy, time.time() - 31))
+        self.assertIsNot(pool.acquire(PooledConnection), healthy)
+        self.assertFalse(healthy.bound)
+        self.assertEquals(pool.opened, 1)
+
+    def test_clear(self):
+        pool = LdapConnectionPool(size=2)
+        connection = pool.acquire(PooledConnection)
+        pool.release(connection)
+        pool.clear()
+        self.assertFalse(connection.bound)
+        self.assertEquals(pool.opened, 0)
+
+
+class FakeLdapTestCase(SimpleTestCase):
+    def setUp(self):
+        self.directory = fakeldap.Directory('dc=example,dc=com')
+        self.directory.add('ou=people,dc=example,dc=com', [
+            ('objectClass', [b'organizationalUnit']),
+        ])
+        for uid, email in [('foouser', 'foo@example.com'),
+                           ('baruser', 'bar@example.org')]:
+            self.directory.add('uid={0},ou=people,dc=example,dc=com'.format(
+                uid), [
+                    ('objectClass', [b'posixAccount']),
+                    ('mail', [email.encode('utf-8')]),
+                ])
+
+    def search(self, filterstr, base='dc=example,dc=com',
+               scope=ldap.SCOPE_SUBTREE):
+        return [dn for dn, attrs in self.directory.search(
+            base, scope, filterstr, ['uid'])]
+
+    def test_search(self):
+        self.assertEquals(
+            self.search('(uid=FOOUSER)'),
+            ['uid=foouser,ou=people,dc=example,dc=com'])
+        self.assertEquals(
+            self.search('(&(objectClass=posixAccount)(mail=*@example.org))'),
+            ['uid=baruser,ou=people,dc=example,dc=com'])
+        self.assertEquals(
+            self.search('(|(uid=foouser)(uid=baruser))'),
+            ['uid=foouser,ou=people,dc=example,dc=com',
+             'uid=baruser,ou=people,dc=example,dc=com'])
+        self.assertEquals(
+            self.search('(!(objectClass=posixAccount))',
+                        scope=ldap.SCOPE_ONELEVEL),
+            ['ou=people,dc=example,dc=com'])
+
+    def test_modify(self):
+        dn = 'uid=foouser,ou=people,dc=example,dc=com'
+        self.directory.modify(dn, [(ldap.MOD_REPLACE, 'mail',
+                                    [b'foo@example.net'])])
+        self.assertEquals(self.search('(mail=foo@example.com)'), [])
+        self.assertEquals(self.search('(mail=foo@example.net)'), [dn])
+
+        self.directory.rename(dn, 'uid=quxuser')
+        self.assertEquals(self.search('(uid=foouser)'), [])
+        self.assertEquals(self.search('(uid=quxuser)'),
+                          ['uid=quxuser,ou=people,dc=example,dc=com'])
+
+        self.assertRaises(ldap.NOT_ALLOWED_ON_NONLEAF, self.directory.delete,
+                          'ou=people,dc=example,dc=com')
+        self.assertRaises(ldap.NO_SUCH_OBJECT, self.directory.add,
+                          'uid=foouser,ou=nobody,dc=example,dc=com', [])
+
+    def test_snapshot(self):
+        snapshot = self.directory.snapshot()
+        self.directory.delete('uid=foouser,ou=people,dc=example,dc=com')
+        self.assertEquals(self.search('(uid=foouser)'), [])
+        self.directory.restore(snapshot)
+        self.assertEquals(self.search('(uid=foouser)'),
+                          ['uid=foouser,ou=people,dc=example,dc=com'])
+
+    def test_journal(self):
+        before = self.directory.search('dc=example,dc=com',
+                                       ldap.SCOPE_SUBTREE, None, None)
+        journal = self.directory.begin()
+        self.directory.modify('uid=foouser,ou=people,dc=example,dc=com',
+                              [(ldap.MOD_REPLACE, 'mail', [b'x@example.net'])])
+        savepoint = self.directory.begin()
+        self.directory.delete('uid=baruser,ou=people,dc=example,dc=com')
+        self.directory.rename('ou=people,dc=example,dc=com', 'ou=users')
+        self.directory.rollback(savepoint)
+        self.directory.end(savepoint)
+        self.assertEquals(self.search('(mail=x@example.net)'),
+                          ['uid=foouser,ou=people,dc=example,dc=com'])
+        self.assertEquals(self.search('(uid=baruser)'),
+                          ['uid=baruser,ou=people,dc=example,dc=com'])
+        self.directory.rollback(journal)
+        self.directory.end(journal)
+        self.assertEquals(
+            self.directory.search('dc=example,dc=com', ldap.SCOPE_SUBTREE,
+                                  None, None), before)
+        self.assertEquals(self.directory.journals, [])
+
+    def test_paged_search(self):
+        connection = fakeldap.FakeLDAPObject(self.directory)
+        control = SimplePagedResultsControl(True, size=2, cookie='')
+        dns = []
+        while True:
+            msgid = connection.search_ext(
+                'dc=example,dc=com', ldap.SCOPE_SUBTREE, serverctrls=[control])
+            rtype, rdata, rmsgid, serverctrls = connection.result3(msgid)
+            dns.extend(dn for dn, attrs in rdata)
+            control.cookie = serverctrls[0].cookie
+            if not control.cookie:
+                break
+        self.assertEquals(len(dns), 4)
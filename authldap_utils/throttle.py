@@ -0,0 +1,75 @@
+"""
+Rate limiting for the authldap_utils application.
+
+Counts are kept in the application cache (see ``conf.get('cache_alias')``),
+using a sliding window: the count for the current fixed window is added
+to the (time weighted) count of the previous window.  This needs only
+two small cache entries per key, regardless of the number of hits.
+"""
+################################################################
+from __future__ import print_function, unicode_literals
+
+import hashlib
+import time
+
+from django.utils.encoding import force_bytes
+
+from .utils import get_cache
+
+################################################################
+
+
+def get_cache_key(key, window):
+    """
+    The cache key for the counter of ``key`` in the given window.
+    Keys are hashed, as they may contain e.g., email addresses.
+    """
+    digest = hashlib.md5(force_bytes(key)).hexdigest()
+    return 'authldap_utils.throttle.{0}.{1}'.format(digest, window)
+
+
+def get_rate_count(key, period, now=None):
+    """
+    Return the (sliding window) number of hits recorded for ``key``
+    in the last ``period`` seconds.
+    """
+    if now is None:
+        now = time.time()
+    window = int(now // period)
+    elapsed = (now % period) / float(period)
+    current_key = get_cache_key(key, window)
+    previous_key = get_cache_key(key, window - 1)
+    counts = get_cache().get_many([current_key, previous_key])
+    return counts.get(current_key, 0) + \
+           counts.get(previous_key, 0) * (1.0 - elapsed)
+
+
+def is_rate_limited(key, rate, now=None):
+    """
+    Record a hit for ``key``, and return True if this exceeds ``rate``,
+    a ``(number, period)`` tuple, e.g., ``(5, 60)`` for at most five hits
+    per minute.  A ``rate`` of None is never limited.
+
+    Hits which are refused are not counted, so a client which backs off
+    is let through again once the window has moved on.
+    """
+    if rate is None:
+        return False
+    number, period = rate
+    if now is None:
+        now = time.time()
+    if get_rate_count(key, period, now) >= number:
+        return True
+    cache = get_cache()
+    current_key = get_cache_key(key, int(now // period))
+    # two periods: the count is still needed as the "previous" window.
+    cache.add(current_key, 0, 2 * period)
+    try:
+        cache.incr(current_key)
+    except ValueError:
+        # expired between add() and incr()
+        cache.set(current_key, 1, 2 * period)
+    return False
+
+
+################################################################
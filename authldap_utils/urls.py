@@ -15,6 +15,11 @@ urlpatterns = [
             TemplateView.as_view(template_name='registration/profile.html')),
         name='user-profile',
     ),
+    url(
+        r'^photo/(?P<username>[\w.@+-]+)/$',
+        login_required(views.LdapUserPhotoView.as_view()),
+        name='user-photo',
+    ),
     url(
         '^password-change/$',
         views.LdapPasswordChangeView.as_view(),
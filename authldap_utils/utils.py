@@ -2,24 +2,29 @@
 from __future__ import print_function, unicode_literals
 
 import hashlib
+import itertools
 import os
-import random
 from base64 import decodestring as decode
 from base64 import encodestring as encode
 from string import ascii_letters, digits
 
-import passlib.hash
-from django.utils import six
+import six
+from django.core.cache import caches
+
+from . import conf
 
 ###############################################################
 # As per https://stackoverflow.com/a/36503802
+# (passlib is slow to import, and only needed with Samba.)
 
 
 def make_lm_password(s):
+    import passlib.hash
     return passlib.hash.lmhash.encrypt(s).upper()
 
 
 def make_nt_password(s):
+    import passlib.hash
     return passlib.hash.nthash.encrypt(s).upper()
 
 
@@ -32,6 +37,17 @@ HASH_LENGTH = 38
 
 RANDPASS_ALPHABET = ascii_letters + digits + symbols
 
+# Random bytes are mapped to RANDPASS_ALPHABET with bytes.translate();
+# bytes from RANDPASS_LIMIT up are skipped, so every character is
+# equally likely.
+RANDPASS_LIMIT = 256 - 256 % len(RANDPASS_ALPHABET)
+RANDPASS_TABLE = bytes(
+    bytearray([
+        ord(RANDPASS_ALPHABET[i % len(RANDPASS_ALPHABET)])
+        for i in range(256)
+    ]))
+RANDPASS_SKIP = bytes(bytearray(range(RANDPASS_LIMIT, 256)))
+
 ###############################################################
 
 
@@ -49,6 +65,18 @@ def make_ssha_password(password):
     return secret
 
 
+def make_password_hashes(password):
+    """
+    The {field name: hash} of the password for an LdapUser (see
+    ``LdapUser.set_password_hashes()``).
+    """
+    return {
+        'password': make_ssha_password(password),
+        'lm_password': make_lm_password(password),
+        'nt_password': make_nt_password(password),
+    }
+
+
 ###############################################################
 
 
@@ -76,7 +104,47 @@ def generate_random_password(length=32):
     """
     Generate a random password for new users, and allow them to reset.
     """
-    return ''.join([random.choice(RANDPASS_ALPHABET) for n in range(length)])
+    return generate_random_passwords(1, length)[0]
+
+
+def generate_random_passwords(number, length=32):
+    """
+    Generate ``number`` random passwords at once (e.g., for bulk account
+    creation), from the operating system's random source.
+    """
+    size = number * length
+    chars = b''
+    while len(chars) < size:
+        # (a few bytes more, as some are skipped.)
+        chars += os.urandom(size - len(chars) + 16).translate(
+            RANDPASS_TABLE, RANDPASS_SKIP)
+    chars = chars[:size].decode('ascii')
+    return [chars[i:i + length] for i in range(0, size, length)]
+
+
+###############################################################
+
+
+def chunked(iterable, size):
+    """
+    Yield lists of (at most) ``size`` items from ``iterable``.
+    """
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+###############################################################
+
+
+def get_cache():
+    """
+    Return the cache used by this application.
+    """
+    return caches[conf.get('cache_alias')]
 
 
 ###############################################################
@@ -11,12 +11,56 @@ from django.contrib.auth.views import (PasswordChangeDoneView,
                                        PasswordResetConfirmView,
                                        PasswordResetDoneView,
                                        PasswordResetView)
+from django.http import Http404, HttpResponse, JsonResponse
+from django.template.response import TemplateResponse
 from django.urls import reverse_lazy
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.crypto import get_random_string
+from django.utils.http import http_date, quote_etag
+from django.views.generic import View
 from django.views.generic.edit import FormView
 
+from . import conf
 from .forms import (AdminEmailForm, LdapPasswordChangeForm,
-                    LdapPasswordResetForm, LdapSetPasswordForm)
+                    LdapPasswordResetForm, LdapSetPasswordForm, LdapUserForm)
+from .instrumentation import get_prometheus_text
 from .models import LdapUser
+from .photos import get_photo_details, get_thumbnail, get_thumbnail_size
+from .throttle import is_rate_limited
+from .widgets import autocomplete_results
+
+################################################################
+
+SELECTION_SESSION_KEY = 'authldap_utils.selection.{0}'
+
+
+def store_selection(request, values):
+    """
+    Store a (possibly large) list of selected values in the session,
+    rather than passing them around in URLs.
+    Return the token to retrieve them with.
+    """
+    token = get_random_string(16)
+    request.session[SELECTION_SESSION_KEY.format(token)] = list(values)
+    return token
+
+
+def load_selection(request, token):
+    """
+    Return the list of values stored for the token, if any.
+    """
+    if not token:
+        return []
+    return request.session.get(SELECTION_SESSION_KEY.format(token), [])
+
+
+def discard_selection(request, token):
+    """
+    Forget the values stored for the token.
+    """
+    if token:
+        request.session.pop(SELECTION_SESSION_KEY.format(token), None)
+
 
 ################################################################
 
@@ -29,6 +73,13 @@ class EmailUsersAdminAction(FormView):
     form_class = AdminEmailForm
     success_url = reverse_lazy('admin:ldap_ldapuser_changelist')
 
+    def get_selection_token(self):
+        """
+        The token for the recipients selected by the admin action.
+        """
+        return self.request.POST.get('selection',
+                                     self.request.GET.get('selection', ''))
+
     def get_initial(self):
         """
         Get initial data for the form.
@@ -37,16 +88,26 @@ class EmailUsersAdminAction(FormView):
 
         selected = self.request.GET.getlist('to') \
                         if 'to' in self.request.GET else []
-        #to_list = LdapUser.objects.filter(pk__in=selected)
         initial['to_list'] = selected
+        initial['selection'] = self.get_selection_token()
         initial['from_user'] = self.request.user
         return initial
 
+    def get_form_kwargs(self):
+        """
+        Pass the stored selection of recipients to the form.
+        """
+        kwargs = super(EmailUsersAdminAction, self).get_form_kwargs()
+        kwargs['selected'] = load_selection(self.request,
+                                            self.get_selection_token())
+        return kwargs
+
     def form_valid(self, form):
         """
         Process successful form submission.
         """
         n = form.send_email()
+        discard_selection(self.request, self.get_selection_token())
         suffix = 's' if n != 1 else ''
         msg = 'Email has been sent to {0} recipient{1}.'.format(n, suffix)
         messages.success(self.request, msg, fail_silently=True)
@@ -73,36 +134,180 @@ class EmailUsersAdminAction(FormView):
 ################################################################
 
 
-class LdapPasswordChangeView(PasswordChangeView):
+class LdapChoicesAutocompleteView(View):
+    """
+    Return (cached) choices for a form field as JSON, for the
+    autocomplete widgets.
+    The ``field_name`` must be a field of the ``form_class`` with a
+    searchable iterator, e.g., a ``CachedModelChoiceField``.
+    """
+    form_class = LdapUserForm
+    paginate_by = 20
+
+    def get(self, request, field_name):
+        field = self.form_class.base_fields.get(field_name, None)
+        if not hasattr(getattr(field, 'iterator', None), 'search'):
+            raise Http404('No autocomplete for {0!r}'.format(field_name))
+        term = request.GET.get('term', '')
+        try:
+            page = max(1, int(request.GET.get('page', 1)))
+        except ValueError:
+            page = 1
+        choices = field.iterator(field).search(term)
+        return JsonResponse(
+            autocomplete_results(choices, page, self.paginate_by))
+
+
+################################################################
+
+
+class LdapUserPhotoView(View):
+    """
+    Serve a thumbnail of a user's photo, e.g., for avatars.
+    The ``size`` (query) parameter is rounded up to one of the
+    ``photo_thumbnail_sizes``.
+    """
+
+    def get_size(self):
+        try:
+            requested = int(self.request.GET['size'])
+        except (KeyError, ValueError):
+            requested = None
+        return get_thumbnail_size(requested)
+
+    def get_etag(self, details, size):
+        return quote_etag('{0}-{1}'.format(details['hash'], size))
+
+    def get(self, request, username):
+        size = self.get_size()
+        details = get_photo_details(username)
+        if details is None:
+            raise Http404('No photo for {0!r}'.format(username))
+        # Revalidation needs neither the photo nor the thumbnail.
+        response = get_conditional_response(
+            request,
+            etag=self.get_etag(details, size),
+            last_modified=details['modified'])
+        if response is None:
+            details, thumbnail = get_thumbnail(username, size, details)
+            if thumbnail is None:
+                raise Http404('No photo for {0!r}'.format(username))
+            content_type, data = thumbnail
+            response = HttpResponse(data, content_type=content_type)
+        response['ETag'] = self.get_etag(details, size)
+        if details['modified'] is not None:
+            response['Last-Modified'] = http_date(details['modified'])
+        patch_cache_control(response, private=True, max_age=0)
+        return response
+
+
+################################################################
+
+
+def ldap_metrics(request):
+    """
+    The LDAP operation counters, in the Prometheus text format.
+    Not in the application urls: add it (protected) to your own.
+    """
+    return HttpResponse(get_prometheus_text(),
+                        content_type='text/plain; version=0.0.4')
+
+
+################################################################
+
+
+class PasswordThrottleMixin(object):
+    """
+    Throttle form submissions by client IP address and by user,
+    before the form does any directory lookups or password hashing.
+
+    ``throttle_scope`` separates the counts of different views.
+    """
+    throttle_scope = None
+    throttle_template_name = 'registration/password_throttled.html'
+
+    def get_throttle_ident(self):
+        """
+        The user (username, or email address) being throttled, if known.
+        """
+        return None
+
+    def get_client_ip(self):
+        """
+        The client IP address (the first, for a forwarded-for list).
+        """
+        value = self.request.META.get(conf.get('throttle_ip_header'), '')
+        return value.split(',')[0].strip()
+
+    def get_throttle_keys(self):
+        keys = ['{0}:ip:{1}'.format(self.throttle_scope, self.get_client_ip())]
+        ident = self.get_throttle_ident()
+        if ident:
+            keys.append('{0}:user:{1}'.format(self.throttle_scope,
+                                              ident.lower()))
+        return keys
+
+    def is_throttled(self):
+        rate = conf.get('password_throttle_rate')
+        # Every key must record this hit, so no short-circuit here.
+        limited = [is_rate_limited(key, rate)
+                   for key in self.get_throttle_keys()]
+        return any(limited)
+
+    def throttled(self):
+        """
+        The response for a throttled request.
+        """
+        return TemplateResponse(
+            self.request, self.throttle_template_name, status=429)
+
+    def post(self, request, *args, **kwargs):
+        if self.is_throttled():
+            return self.throttled()
+        return super(PasswordThrottleMixin, self).post(request, *args,
+                                                       **kwargs)
+
+
+################################################################
+
+
+class LdapPasswordChangeView(PasswordThrottleMixin, PasswordChangeView):
     form_class = LdapPasswordChangeForm
     success_url = reverse_lazy('password_change_done')
+    throttle_scope = 'password_change'
+
+    def get_throttle_ident(self):
+        return self.request.user.get_username()
 
 
 class LdapPasswordChangeDoneView(PasswordChangeDoneView):
     pass
 
 
-class LdapPasswordResetView(PasswordResetView):
+class LdapPasswordResetView(PasswordThrottleMixin, PasswordResetView):
     form_class = LdapPasswordResetForm
+    throttle_scope = 'password_reset'
+
+    def get_throttle_ident(self):
+        return self.request.POST.get('email', '')
 
 
 class LdapPasswordResetDoneView(PasswordResetDoneView):
     pass
 
 
-class LdapPasswordResetConfirmView(PasswordResetConfirmView):
+class LdapPasswordResetConfirmView(PasswordThrottleMixin,
+                                   PasswordResetConfirmView):
     form_class = LdapSetPasswordForm
+    throttle_scope = 'password_reset_confirm'
 
+    def get_throttle_ident(self):
+        if self.user is not None:
+            return self.user.get_username()
+        return None
 
-class LdapPasswordResetCompleteView(PasswordResetCompleteView):
-    pass
 
-
-class LdapPasswordChangeView(PasswordChangeView):
-    form_class = LdapPasswordChangeForm
-
-
-class LdapPasswordChangeDoneView(PasswordChangeDoneView):
+class LdapPasswordResetCompleteView(PasswordResetCompleteView):
     pass
 
 
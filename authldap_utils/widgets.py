@@ -0,0 +1,127 @@
+"""
+Widgets for the authldap_utils application.
+"""
+################################################################
+from __future__ import print_function, unicode_literals
+
+import json
+
+import six
+from django import forms
+from django.conf import settings
+from django.urls import reverse
+
+################################################################
+
+
+class LdapAutocompleteMixin(object):
+    """
+    Select widget mixin that only renders the selected option(s); the
+    remaining options are loaded on demand (via AJAX) by the select2
+    library bundled with the Django admin.
+
+    ``url_name`` (and ``url_kwargs``) name a view that returns choices
+    in the format expected by ``admin/js/autocomplete.js``.
+    The widget choices must provide a ``selected(values)`` method
+    returning the (value, label) pairs for the selected values,
+    e.g., a ``CachedModelChoiceIterator``.
+    """
+
+    def __init__(self, url_name, url_kwargs=None, attrs=None, choices=()):
+        super(LdapAutocompleteMixin, self).__init__(attrs, choices)
+        self.url_name = url_name
+        self.url_kwargs = url_kwargs
+
+    def get_url(self):
+        return reverse(self.url_name, kwargs=self.url_kwargs)
+
+    def build_attrs(self, base_attrs, extra_attrs=None):
+        """
+        Set the select2 AJAX attributes.
+        """
+        attrs = super(LdapAutocompleteMixin, self).build_attrs(
+            base_attrs, extra_attrs=extra_attrs)
+        css_class = attrs.get('class', '')
+        attrs.update({
+            'data-ajax--cache': 'true',
+            'data-ajax--type': 'GET',
+            'data-ajax--url': self.get_url(),
+            'data-theme': 'admin-autocomplete',
+            'data-allow-clear': json.dumps(not self.is_required),
+            'data-placeholder': '',
+            'class': css_class + (' ' if css_class else '') + \
+                     'admin-autocomplete',
+        })
+        return attrs
+
+    def optgroups(self, name, value, attrs=None):
+        """
+        Only the selected options are rendered.
+        """
+        default = (None, [], 0)
+        selected_values = [
+            v for v in value if v not in self.choices.field.empty_values
+        ]
+        if not self.is_required and not self.allow_multiple_selected:
+            default[1].append(self.create_option(name, '', '', False, 0))
+        if selected_values:
+            choices = self.choices.selected(selected_values)
+        else:
+            choices = []
+        for option_value, option_label in choices:
+            index = len(default[1])
+            default[1].append(
+                self.create_option(name, option_value, option_label, True,
+                                   index))
+        return [default]
+
+    @property
+    def media(self):
+        extra = '' if settings.DEBUG else '.min'
+        return forms.Media(
+            js=(
+                'admin/js/vendor/jquery/jquery%s.js' % extra,
+                'admin/js/vendor/select2/select2.full%s.js' % extra,
+                'admin/js/jquery.init.js',
+                'admin/js/autocomplete.js',
+            ),
+            css={
+                'screen': (
+                    'admin/css/vendor/select2/select2%s.css' % extra,
+                    'admin/css/autocomplete.css',
+                ),
+            },
+        )
+
+
+class LdapAutocompleteSelect(LdapAutocompleteMixin, forms.Select):
+    pass
+
+
+class LdapAutocompleteSelectMultiple(LdapAutocompleteMixin,
+                                     forms.SelectMultiple):
+    pass
+
+
+################################################################
+
+
+def autocomplete_results(choices, page=1, paginate_by=20):
+    """
+    Return the JSON-able structure expected by the select2 autocomplete
+    for the given list of (value, label) choices.
+    """
+    start = (page - 1) * paginate_by
+    end = start + paginate_by
+    return {
+        'results': [{
+            'id': six.text_type(value),
+            'text': six.text_type(label)
+        } for value, label in choices[start:end]],
+        'pagination': {
+            'more': len(choices) > end
+        },
+    }
+
+
+################################################################
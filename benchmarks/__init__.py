@@ -0,0 +1 @@
+from __future__ import unicode_literals, print_function
@@ -0,0 +1,179 @@
+"""
+Benchmarks of the hot paths of the authldap_utils application, against
+an in-process directory (``authldap_utils.backends.memory``) of 1k, 10k
+and 100k users (``--sizes`` to choose).
+
+    pip install -r benchmarks/requirements.txt
+    pytest benchmarks
+
+Results are saved as JSON (in ``.benchmarks/``); compare a run with the
+last saved one with ``--benchmark-compare``, and fail on regressions
+with, e.g., ``--benchmark-compare-fail=mean:10%``.
+"""
+################################################################
+from __future__ import print_function, unicode_literals
+
+import os
+
+import pytest
+
+################################################################
+
+SIZES = '1000,10000,100000'
+
+EMAIL_DOMAIN = 'example.com'
+
+
+def pytest_addoption(parser):
+    parser.addoption(
+        '--sizes',
+        default=SIZES,
+        help='the directory sizes (comma separated), default ' + SIZES)
+
+
+def pytest_configure(config):
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'benchmarks.settings')
+    import django
+    django.setup()
+
+    from django.core.management import call_command
+    call_command('migrate', verbosity=0, interactive=False)
+
+
+def pytest_generate_tests(metafunc):
+    if 'size' in metafunc.fixturenames:
+        sizes = [int(size) for size in
+                 metafunc.config.getoption('sizes').split(',')]
+        metafunc.parametrize('size', sizes, scope='session')
+
+
+################################################################
+
+
+def get_username(i):
+    return 'user{0:06d}'.format(i)
+
+
+def get_email(i):
+    return '{0}@{1}'.format(get_username(i), EMAIL_DOMAIN)
+
+
+def get_entry(instance, connection):
+    """
+    The (dn, modlist) to add the LDAP model instance (as ldapdb would).
+    """
+    modlist = [('objectClass', [oc.encode('utf-8')
+                                for oc in instance.object_classes])]
+    for field in instance._meta.concrete_fields:
+        if field.primary_key or not field.db_column:
+            continue
+        value = field.get_db_prep_save(
+            getattr(instance, field.attname), connection=connection)
+        if value is not None:
+            modlist.append((field.db_column, value))
+    return instance.build_dn(), modlist
+
+
+def populate(directory, size, connection):
+    """
+    Add the users (and their group) straight to the directory.
+    """
+    from authldap_utils.models import LdapGroup, LdapUser
+    from authldap_utils.utils import make_ssha_password
+
+    # (the same password for everyone: hashing is not measured here.)
+    password = make_ssha_password('secret')
+    for model in [LdapUser, LdapGroup]:
+        rdn = model.base_dn.split(',')[0]
+        attr, value = rdn.split('=')
+        directory.add(model.base_dn, [
+            ('objectClass', [b'top', b'organizationalUnit']),
+            (attr, [value.encode('utf-8')]),
+        ])
+
+    group = LdapGroup(name='staff', gid=100, usernames=[])
+    directory.add(*get_entry(group, connection))
+    for i in range(size):
+        username = get_username(i)
+        user = LdapUser(
+            username=username,
+            uid=10000 + i,
+            group=100,
+            first_name='First{0}'.format(i),
+            last_name='Last{0}'.format(i),
+            full_name='First{0} Last{0}'.format(i),
+            gecos='First{0} Last{0}'.format(i),
+            email=get_email(i),
+            home_directory='/home/' + username,
+            password=password)
+        directory.add(*get_entry(user, connection))
+
+
+@pytest.fixture(scope='session')
+def directory(size):
+    """
+    The in-memory directory, with ``size`` users.
+    """
+    from django.db import connections, router
+
+    from authldap_utils.models import LdapUser
+
+    connection = connections[router.db_for_write(LdapUser)]
+    directory = connection.get_directory()
+    directory.clear()
+    populate(directory, size, connection)
+    yield directory
+    directory.clear()
+
+
+@pytest.fixture(scope='session')
+def django_users(size):
+    """
+    The Django users (mirroring the LDAP users) and a superuser.
+    """
+    from django.contrib.auth import get_user_model
+
+    User = get_user_model()
+    User.objects.all().delete()
+    User.objects.bulk_create([
+        User(
+            username=get_username(i),
+            email=get_email(i),
+            first_name='First{0}'.format(i),
+            last_name='Last{0}'.format(i),
+            password='!') for i in range(size)
+    ])
+    admin = User.objects.create_superuser('admin', 'admin@' + EMAIL_DOMAIN,
+                                          'admin')
+    yield admin
+    User.objects.all().delete()
+
+
+@pytest.fixture
+def admin_client(django_users):
+    from django.test import Client
+
+    client = Client()
+    client.force_login(django_users)
+    return client
+
+
+@pytest.fixture
+def bench(benchmark, size):
+    """
+    Run a benchmark: fewer rounds for the larger directories.
+    """
+    rounds = max(3, min(50, 50000 // size))
+
+    def run(function, *args, **kwargs):
+        return benchmark.pedantic(
+            function,
+            args=args,
+            kwargs=kwargs,
+            rounds=rounds,
+            warmup_rounds=1)
+
+    return run
+
+
+################################################################
@@ -0,0 +1,72 @@
+"""
+Django settings for the benchmarks: the LDAP models use the in-memory
+directory backend, Django users an in-memory SQLite database.
+"""
+from __future__ import print_function, unicode_literals
+
+SECRET_KEY = 'benchmarks'
+DEBUG = False
+ALLOWED_HOSTS = ['testserver']
+
+INSTALLED_APPS = [
+    'django.contrib.admin',
+    'django.contrib.auth',
+    'django.contrib.contenttypes',
+    'django.contrib.sessions',
+    'django.contrib.messages',
+    'authldap_utils',
+    'authldap_utils.checkpoints',
+]
+
+LDAP_DC_DN = 'dc=example,dc=com'
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': ':memory:',
+    },
+    'ldap': {
+        'ENGINE': 'authldap_utils.backends.memory',
+        'NAME': 'memory://benchmarks',
+        'USER': 'cn=admin,' + LDAP_DC_DN,
+        'PASSWORD': '',
+    },
+}
+DATABASE_ROUTERS = ['authldap_utils.router.Router']
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+}
+
+EMAIL_BACKEND = 'django.core.mail.backends.locmem.EmailBackend'
+
+# Fast hashing of the Django users' passwords.
+PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+
+MIDDLEWARE = [
+    'django.contrib.sessions.middleware.SessionMiddleware',
+    'django.middleware.common.CommonMiddleware',
+    'django.middleware.csrf.CsrfViewMiddleware',
+    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'django.contrib.messages.middleware.MessageMiddleware',
+]
+
+ROOT_URLCONF = 'benchmarks.urls'
+
+TEMPLATES = [
+    {
+        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'APP_DIRS': True,
+        'OPTIONS': {
+            'context_processors': [
+                'django.template.context_processors.request',
+                'django.contrib.auth.context_processors.auth',
+                'django.contrib.messages.context_processors.messages',
+            ],
+        },
+    },
+]
+
+USE_TZ = True
@@ -0,0 +1,27 @@
+"""
+Benchmarks of the authldap_utils admin.
+"""
+from __future__ import print_function, unicode_literals
+
+from django.urls import reverse
+
+from .conftest import get_username
+
+
+def test_user_changelist(bench, directory, admin_client):
+    url = reverse('admin:authldap_utils_ldapuser_changelist')
+    response = bench(admin_client.get, url)
+    assert response.status_code == 200
+
+
+def test_group_changelist(bench, directory, admin_client):
+    url = reverse('admin:authldap_utils_ldapgroup_changelist')
+    response = bench(admin_client.get, url)
+    assert response.status_code == 200
+
+
+def test_user_change(bench, directory, admin_client):
+    url = reverse('admin:authldap_utils_ldapuser_change',
+                  args=[get_username(1)])
+    response = bench(admin_client.get, url)
+    assert response.status_code == 200
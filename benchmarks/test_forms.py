@@ -0,0 +1,78 @@
+"""
+Benchmarks of the authldap_utils forms.
+"""
+from __future__ import print_function, unicode_literals
+
+from django.core import mail
+
+from authldap_utils.forms import (AdminEmailForm, LdapPasswordResetForm,
+                                  LdapUserForm)
+from authldap_utils.models import LdapUser
+
+from .conftest import get_email, get_username
+
+
+def get_user_form_data():
+    return {
+        'uid': '',
+        'username': 'newuser',
+        'password': 'secret',
+        'group': '100',
+        'gecos': '',
+        'home_directory': '',
+        'login_shell': '/bin/bash',
+        'email': 'newuser@example.com',
+        'first_name': 'New',
+        'last_name': 'User',
+        'full_name': '',
+        'phone': '',
+        'mobile_phone': '',
+        'version': '',
+    }
+
+
+def test_user_form_validation(bench, directory, size):
+    data = get_user_form_data()
+
+    def validate():
+        form = LdapUserForm(data)
+        assert form.is_valid(), form.errors
+        return form.cleaned_data['uid']
+
+    assert bench(validate) == 10000 + size
+
+
+def test_auto_numeric_check(bench, directory, size):
+    form = LdapUserForm(get_user_form_data())
+    uid = bench(form.auto_numeric_check, 'uid', 10000, LdapUser.objects)
+    assert uid == 10000 + size
+
+
+def test_password_reset_get_users(bench, directory, django_users):
+    email = get_email(1)
+
+    def get_users():
+        form = LdapPasswordResetForm({'email': email})
+        return list(form.get_users(email))
+
+    users = bench(get_users)
+    assert [u.username for u in users] == [get_username(1)]
+
+
+def test_admin_email_send(bench, directory, django_users, size):
+    selected = [get_username(i) for i in range(size)]
+    data = {
+        'from_user': django_users.pk,
+        'subject': 'Hello {first_name}',
+        'message': 'Dear {full_name},\n\nHello.\n',
+        'merge': 'on',
+    }
+
+    def send_email():
+        mail.outbox = []
+        form = AdminEmailForm(data, selected=selected)
+        assert form.is_valid(), form.errors
+        return form.send_email()
+
+    assert bench(send_email) == size
+    assert len(mail.outbox) == size
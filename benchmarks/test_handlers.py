@@ -0,0 +1,15 @@
+"""
+Benchmarks of the authldap_utils signal handlers.
+"""
+from __future__ import print_function, unicode_literals
+
+from authldap_utils.handlers import user_sync_post_save
+from authldap_utils.models import LdapUser
+
+from .conftest import get_username
+
+
+def test_user_sync_post_save(bench, directory, django_users):
+    ldap_user = LdapUser.objects.get(username=get_username(1))
+    ldap_user.first_name = 'Changed'
+    bench(user_sync_post_save, LdapUser, ldap_user, created=False)
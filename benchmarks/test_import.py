@@ -0,0 +1,45 @@
+"""
+Benchmarks of the cold start (``django.setup()``, as done by every
+management command and worker process) of a project with the
+authldap_utils application, in a new interpreter each round.
+"""
+from __future__ import print_function, unicode_literals
+
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SETUP = 'import django; django.setup()'
+
+
+def run_python(code):
+    """
+    Run the code in a new interpreter, with ``-X importtime``; return
+    the {module: cumulative import time (us)} of its imports.
+    """
+    env = dict(os.environ)
+    env['DJANGO_SETTINGS_MODULE'] = 'benchmarks.settings'
+    env['PYTHONPATH'] = os.pathsep.join([ROOT] + sys.path)
+    output = subprocess.check_output(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        stderr=subprocess.STDOUT,
+        env=env,
+        cwd=ROOT)
+    times = {}
+    for line in output.decode('utf-8').splitlines():
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        self_time, cumulative, name = line[len('import time:'):].split('|')
+        if cumulative.strip().isdigit():
+            times[name.strip()] = int(cumulative)
+    return times
+
+
+def test_django_setup(benchmark):
+    times = benchmark.pedantic(run_python, args=(SETUP, ), rounds=5)
+    # (in the saved JSON: where the application's import time goes.)
+    benchmark.extra_info.update(
+        (name, time) for name, time in times.items()
+        if name.split('.')[0] in ['authldap_utils', 'ldapdb', 'passlib'])
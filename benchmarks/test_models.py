@@ -0,0 +1,23 @@
+"""
+Benchmarks of loading LdapUser instances from search results.
+"""
+from __future__ import print_function, unicode_literals
+
+from authldap_utils.models import LdapUser
+
+
+def load_users(*fields):
+    queryset = LdapUser.objects.all()
+    if fields:
+        queryset = queryset.only(*fields)
+    return list(queryset)
+
+
+def test_user_list(bench, directory, size):
+    users = bench(load_users)
+    assert len(users) == size
+
+
+def test_user_list_only(bench, directory, size):
+    users = bench(load_users, 'username', 'email')
+    assert len(users) == size
@@ -0,0 +1,12 @@
+"""
+The url patterns for the benchmarks.
+"""
+from __future__ import print_function, unicode_literals
+
+from django.conf.urls import include, url
+from django.contrib import admin
+
+urlpatterns = [
+    url(r'^admin/', admin.site.urls),
+    url(r'^accounts/', include('django.contrib.auth.urls')),
+]
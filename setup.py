@@ -27,7 +27,7 @@ setup(
     description='A authldap_utils application ... ',
     url="",
     license="GNU Lesser General Public License (LGPL) 3.0",
-    packages=find_packages(),
+    packages=find_packages(exclude=['benchmarks', 'benchmarks.*']),
     install_requires=read_requirements(),
     zip_safe=False,
     include_package_data=True,